@@ -0,0 +1,154 @@
+"""
+Decode time and peak RSS of full-resolution vs reduced-resolution decoding.
+
+Encodes a synthetic phone-sized photo (default 4000x3000) as JPEG and WebP,
+then decodes it once per SIZE_CONFIGS entry with `decode_image`, both with
+no size hint (full decode, the old `Image.open(...).convert("RGB")`) and with
+the entry as the hint (JPEG draft, see `decode_scale`). Every decode runs
+in a fresh subprocess whose peak-RSS counter is reset after imports, so the
+RSS columns are the decode's own high-water mark. The "+resample" columns
+add the global-view pad and tile-canvas resize the processor does next.
+Pillow only decodes JPEG below full size, so the WebP rows are full decodes
+in both columns (the "decoded" column is the JPEG size).
+
+Usage:
+    python benchmarks/bench_decode.py [--width 4000 --height 3000] [--repeats 5]
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.config import SIZE_CONFIGS  # noqa: E402
+from deepseek_ocr_vllm.fetcher import decode_image, decode_scale  # noqa: E402
+from deepseek_ocr_vllm.process.image_process import image_token_layout  # noqa: E402
+
+FORMATS = ["JPEG", "WEBP"]
+
+
+def reset_peak_rss():
+    """Reset VmHWM (Linux); returns False where that is not supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def resample(image, size_config):
+    """The processor's resize work after decoding: global-view pad and tile canvas."""
+    width, height = image.info["original_size"]
+    base_size, image_size = size_config["base_size"], size_config["image_size"]
+    ImageOps.pad(image, (base_size, base_size))
+    crop_ratio, _ = image_token_layout(width, height, base_size, image_size, size_config["crop_mode"])
+    if crop_ratio != (1, 1):
+        image.resize((image_size * crop_ratio[0], image_size * crop_ratio[1]))
+
+
+def child(path, mode, repeats):
+    with open(path, "rb") as f:
+        data = f.read()
+    hint, target = mode.split(":")
+    size_config = SIZE_CONFIGS[target]
+    decode_hint = None if hint == "full" else size_config
+    decode_image(io.BytesIO(data), decode_hint)  # warm up codec tables
+
+    reset_peak_rss()
+    baseline = current_rss_mb()
+    image = decode_image(io.BytesIO(data), decode_hint)
+    rss_mb = peak_rss_mb() - baseline
+    del image
+
+    decode_ms, total_ms = [], []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        image = decode_image(io.BytesIO(data), decode_hint)
+        t1 = time.perf_counter()
+        resample(image, size_config)
+        t2 = time.perf_counter()
+        decode_ms.append((t1 - t0) * 1000)
+        total_ms.append((t2 - t0) * 1000)
+        del image
+    median = lambda xs: sorted(xs)[len(xs) // 2]  # noqa: E731
+    print(json.dumps({"ms": median(decode_ms), "total_ms": median(total_ms), "rss_mb": rss_mb}))
+
+
+def run_child(path, mode, repeats):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", path, mode, "--repeats", str(repeats)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def make_photo(width, height):
+    """Smooth gradients plus noise: compresses like a photo, not like flat colour."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width, y / height, (x + y) / (width + height)], axis=-1) * 200
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child, args.repeats)
+        return
+
+    if not reset_peak_rss():
+        print("note: cannot reset peak RSS here; RSS columns are process high-water marks")
+    photo = make_photo(args.width, args.height)
+    print(f"{args.width}x{args.height} photo, medians of {args.repeats} decodes (old = full decode)")
+    print(f"{'format':>6} | {'mode':>6} | {'scale':>5} | {'decoded':>9} | {'old ms':>6} | {'new ms':>6} | "
+          f"{'old +resample':>13} | {'new +resample':>13} | {'old MB':>6} | {'new MB':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in FORMATS:
+            path = os.path.join(tmp, f"photo.{fmt.lower()}")
+            photo.save(path, format=fmt, quality=90)
+            for mode, size_config in SIZE_CONFIGS.items():
+                full = run_child(path, f"full:{mode}", args.repeats)
+                reduced = run_child(path, f"hint:{mode}", args.repeats)
+                scale = decode_scale(args.width, args.height, size_config)
+                decoded = f"{-(-args.width // scale)}x{-(-args.height // scale)}"
+                print(f"{fmt:>6} | {mode:>6} | {scale:>5} | {decoded:>9} | {full['ms']:6.1f} | {reduced['ms']:6.1f} | "
+                      f"{full['total_ms']:13.1f} | {reduced['total_ms']:13.1f} | "
+                      f"{full['rss_mb']:6.1f} | {reduced['rss_mb']:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Decode-while-downloading check for the streaming fetcher.
+
+`ImageFetcher` hands PIL a `_ChunkStream` that fills up as the body arrives.
+PIL's parsers assume full reads (a short read is a truncated file), so the
+stream must block until a read can be satisfied or the body ends.
+
+Two checks, each against a decode of the complete bytes:
+
+* stream: PNG / JPEG / WebP bytes fed into a `_ChunkStream` from another
+  thread in 1, 3, 7, 1000 and 1400 byte pieces
+* fetch: the same images served by a local HTTP server in 1400-byte writes
+  (one TCP segment each, with a short pause between them) and fetched with
+  `ImageFetcher`, --repeats times per format
+
+The script exits non-zero if any decode fails or differs.
+
+Usage:
+    python benchmarks/bench_fetch_stream.py [--width 800 --height 600] [--repeats 10]
+"""
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.fetcher import ImageFetcher, _ChunkStream, decode_image  # noqa: E402
+
+FORMATS = ["PNG", "JPEG", "WEBP"]
+STREAM_CHUNKS = [1, 3, 7, 1000, 1400]
+SERVE_CHUNK = 1400
+SERVE_PAUSE = 0.0005  # seconds between writes, so chunks reach the client separately
+
+
+def make_image(fmt, width, height):
+    rng = np.random.default_rng(0)
+    # Smooth gradients plus noise: compressible, but still many chunks long
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) % 256], axis=-1)
+    pixels = (pixels + rng.integers(0, 32, size=pixels.shape)).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def reference(data):
+    return np.asarray(decode_image(io.BytesIO(data)))
+
+
+def decode_streamed(data, chunk):
+    stream = _ChunkStream()
+
+    def feed():
+        for start in range(0, len(data), chunk):
+            stream.feed(data[start:start + chunk])
+        stream.finish()
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    try:
+        return np.asarray(decode_image(stream))
+    finally:
+        feeder.join()
+
+
+def serve(images):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            data = images[self.path.strip("/")]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                for start in range(0, len(data), SERVE_CHUNK):
+                    self.wfile.write(data[start:start + SERVE_CHUNK])
+                    self.wfile.flush()
+                    time.sleep(SERVE_PAUSE)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the fetcher gave up on a failed decode
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    images = {fmt: make_image(fmt, args.width, args.height) for fmt in FORMATS}
+    expected = {fmt: reference(data) for fmt, data in images.items()}
+    failures = 0
+
+    print(f"{'format':>6} | {'bytes':>7} | {'chunk':>5} | {'result':>6}")
+    for fmt, data in images.items():
+        for chunk in STREAM_CHUNKS:
+            try:
+                ok = np.array_equal(decode_streamed(data, chunk), expected[fmt])
+                result = "ok" if ok else "DIFF"
+            except Exception as e:  # noqa: BLE001
+                ok, result = False, type(e).__name__
+            failures += not ok
+            print(f"{fmt:>6} | {len(data):>7} | {chunk:>5} | {result:>6}")
+
+    server = serve(images)
+    fetcher = ImageFetcher()
+    print(f"\nImageFetcher over HTTP, {SERVE_CHUNK}-byte writes")
+    print(f"{'format':>6} | {'ok':>5} | {'ms':>8}")
+    try:
+        for fmt in FORMATS:
+            url = f"http://127.0.0.1:{server.server_address[1]}/{fmt}"
+            passed, wall = 0, []
+            for _ in range(args.repeats):
+                t0 = time.perf_counter()
+                try:
+                    data, image = fetcher.fetch_image(url)
+                    passed += data == images[fmt] and np.array_equal(np.asarray(image), expected[fmt])
+                except Exception as e:  # noqa: BLE001
+                    print(f"  {fmt}: {type(e).__name__}: {e}")
+                wall.append((time.perf_counter() - t0) * 1000)
+            failures += args.repeats - passed
+            print(f"{fmt:>6} | {passed:>2}/{args.repeats:<2} | {min(wall):8.1f}")
+    finally:
+        fetcher.close()
+        server.shutdown()
+
+    if failures:
+        print(f"{failures} decode(s) failed or differ from the complete-bytes decode")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
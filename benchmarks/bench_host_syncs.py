@@ -0,0 +1,170 @@
+"""
+Host-device syncs per step in the multimodal input path, before and after.
+
+Builds one vLLM step's image fields (global views, crop tiles, tile grids,
+embedding cache keys, tile keys, batched the way V0 hands them to the model)
+and runs the metadata half of the vision path that decides what to encode:
+
+* old: `torch.sum(pixel_values).item()` for "has image", a
+  `torch.sum(patches).item()` per image for "has tiles", separate
+  `.tolist()` reads of the cache and tile keys, and tensor tile grids
+  converted to ints while laying out features
+* new: `read_image_metadata`, one transfer of the tile grids and keys; the
+  pixels are never reduced
+
+`count_host_syncs` is the hook. On CUDA it counts the synchronizations
+PyTorch reports under `torch.cuda.set_sync_debug_mode("warn")`. On CPU, where
+nothing syncs, it counts the calls that would (`.item()`, `.tolist()`, and
+tensor-to-bool/int/float conversions), so the numbers are comparable.
+
+Usage:
+    python benchmarks/bench_host_syncs.py [--images 8] [--tiles 6] [--device cpu] [--repeats 5]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+import warnings
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.vision_batch import read_image_metadata  # noqa: E402
+
+# Tensor methods that copy a value to the host (a sync when the tensor is on a GPU)
+HOST_READS = ("item", "tolist", "__bool__", "__int__", "__float__", "__index__")
+
+
+class SyncCounter:
+    def __init__(self):
+        self.count = 0
+
+
+@contextlib.contextmanager
+def count_host_syncs(device):
+    """Counts host-device syncs (CUDA) or host reads of tensors (CPU) inside the block."""
+    counter = SyncCounter()
+    if device.startswith("cuda"):
+        previous = torch.cuda.get_sync_debug_mode()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            torch.cuda.set_sync_debug_mode("warn")
+            try:
+                yield counter
+            finally:
+                torch.cuda.set_sync_debug_mode(previous)
+        counter.count = sum("synchroniz" in str(w.message) for w in caught)
+        return
+
+    originals = {name: getattr(torch.Tensor, name) for name in HOST_READS}
+
+    def counting(original):
+        def wrapper(self, *args, **kwargs):
+            counter.count += 1
+            return original(self, *args, **kwargs)
+        return wrapper
+
+    for name, original in originals.items():
+        setattr(torch.Tensor, name, counting(original))
+    try:
+        yield counter
+    finally:
+        for name, original in originals.items():
+            setattr(torch.Tensor, name, original)
+
+
+def make_step(n_images, n_tiles, device):
+    """V0-batched fields: a leading image dim, batch_size 1 per image."""
+    generator = torch.Generator().manual_seed(0)
+    grids = [(3, 2), (2, 3), (6, 1), (1, 1)]
+    crop_grids = [grids[i % len(grids)] for i in range(n_images)]
+    return {
+        "pixel_values": torch.rand((n_images, 1, 3, 1024, 1024), generator=generator).to(device),
+        "images_crop": torch.rand((n_images, 1, n_tiles, 3, 640, 640), generator=generator).to(device),
+        "images_spatial_crop": torch.tensor([[grid] for grid in crop_grids], device=device),
+        "image_cache_key": torch.arange(1, n_images + 1, device=device).view(n_images, 1),
+        "images_tile_key": torch.randint(1, 2**62, (n_images, 1, n_tiles), generator=generator).to(device),
+    }
+
+
+def old_path(step):
+    """What the model used to read on the host before encoding."""
+    if torch.sum(step["pixel_values"]).item() == 0:
+        return None
+    n_image = step["images_spatial_crop"].size(0)
+    cache_keys = step["image_cache_key"].reshape(n_image, -1)[:, 0].tolist()
+    tile_keys = step["images_tile_key"].reshape(n_image, -1).tolist()
+    plan = []
+    for jdx in range(n_image):
+        patches = step["images_crop"][jdx][0]
+        crop_shape = step["images_spatial_crop"][jdx][0]
+        has_crop = torch.sum(patches).item() != 0
+        if has_crop:
+            # the layout's view() takes the grid as Python ints
+            plan.append((int(crop_shape[0]), int(crop_shape[1]), cache_keys[jdx], tile_keys[jdx]))
+        else:
+            plan.append((None, None, cache_keys[jdx], None))
+    return plan
+
+
+def new_path(step):
+    """`_process_image_input` / `_pixel_values_to_embedding` now."""
+    crop_shapes, cache_keys, tile_keys = read_image_metadata(
+        step["images_spatial_crop"], step["image_cache_key"], step["images_tile_key"]
+    )
+    if not any(width * height for width, height in crop_shapes):
+        return None
+    plan = []
+    for (width, height), cache_key, keys in zip(crop_shapes, cache_keys, tile_keys):
+        if width > 1 or height > 1:
+            plan.append((width, height, cache_key, keys))
+        else:
+            plan.append((None, None, cache_key, None))
+    return plan
+
+
+def measure(fn, step, device, repeats):
+    with count_host_syncs(device) as syncs:
+        plan = fn(step)
+    wall = []
+    for _ in range(repeats):
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        t0 = time.perf_counter()
+        fn(step)
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        wall.append((time.perf_counter() - t0) * 1000)
+    return plan, syncs.count, min(wall)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--tiles", type=int, default=6, help="tile slots per image")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    step = make_step(args.images, args.tiles, args.device)
+    # Single-tile grids carry no crops: the processor sends an all-zero block
+    no_crop = (step["images_spatial_crop"][:, 0].prod(dim=-1) <= 1).cpu()
+    step["images_crop"][no_crop] = 0
+
+    old_plan, old_syncs, old_ms = measure(old_path, step, args.device, args.repeats)
+    new_plan, new_syncs, new_ms = measure(new_path, step, args.device, args.repeats)
+    same = old_plan == new_plan
+    counted = "syncs" if args.device.startswith("cuda") else "host reads"
+    print(f"{args.images} images x {args.tiles} tile slots on {args.device} ({counted} per step)")
+    print(f"{'path':>4} | {counted:>10} | {'ms':>8}")
+    print(f"{'old':>4} | {old_syncs:>10} | {old_ms:8.2f}")
+    print(f"{'new':>4} | {new_syncs:>10} | {new_ms:8.2f}")
+    print(f"same encode plan: {'ok' if same else 'FAIL'}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Parity of the handler's in-memory preprocessing with the HF model's `infer`.
+
+`handler.py` no longer calls `model.infer`: it tokenizes with the vendored
+`DeepseekOCRProcessor` (`prepare_inputs`) and calls `model.generate` itself.
+This script runs the HF model's own `infer` preprocessing on the same image
+and captures what it hands to `generate` (the model is built on the meta
+device, so no weights are loaded and `generate` never runs). Then it
+compares, per SIZE_CONFIGS mode and image shape:
+
+* input_ids and images_seq_mask (exact)
+* images_spatial_crop, the tile grid (exact)
+* the global view and the crop tiles (the handler's float32 or uint8
+  pixels normalized, against infer's bfloat16 ones, within bfloat16
+  rounding). Without tiles both sides must send an all-zero block.
+
+The handler side uses the default crop budget of a request
+(INFER_CROP_BUDGET). The script checks that it equals infer's
+`dynamic_preprocess` defaults. Tiny / Small exercise the resize-then-pad
+branch, Base / Large the pad-only branch, and Gundam the tiles.
+
+Reduced decode (REDUCED_DECODE) is an intended difference. The `reduced`
+column decodes the same JPEG at its `decode_scale` and checks only the
+tokens and the grid. It reports the largest pixel difference, which comes
+from resampling.
+
+Needs the model's remote code and tokenizer (Hugging Face Hub access or a
+local snapshot via --model); a GPU is not needed. Exits non-zero on any mismatch.
+
+Usage:
+    python benchmarks/bench_infer_parity.py [--model deepseek-ai/DeepSeek-OCR] [--modes Tiny Gundam]
+"""
+import argparse
+import contextlib
+import inspect
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.config import INFER_CROP_BUDGET, MODEL_ID, PROMPT_TEMPLATES, SIZE_CONFIGS  # noqa: E402
+from deepseek_ocr_vllm.fetcher import decode_image, decode_scale  # noqa: E402
+from deepseek_ocr_vllm.preprocess_pool import prepare_inputs  # noqa: E402
+from deepseek_ocr_vllm.process.image_process import DeepseekOCRProcessor, normalize_pixels  # noqa: E402
+
+# (width, height): below 640 (no tiles), a photo, a page, wide and tall strips,
+# and a square that tiles 3x3 with max_crops 9 but 2x2 with 6
+SHAPES = [(500, 400), (800, 600), (1700, 2200), (3000, 1000), (700, 2800), (1920, 1920)]
+# bfloat16 keeps 8 bits of mantissa: |x| <= 1 rounds by at most 2**-8
+PIXEL_ATOL = 2**-7
+
+
+class _Captured(Exception):
+    def __init__(self, args, kwargs):
+        super().__init__("generate called")
+        self.args, self.kwargs = args, kwargs
+
+
+def load_infer_model(model_id):
+    """The HF model class with its remote code, on the meta device (no weights)"""
+    from transformers import AutoConfig, AutoModel
+
+    config = AutoConfig.from_pretrained(model_id, trust_remote_code=True)
+    with torch.device("meta"):
+        return AutoModel.from_config(config, trust_remote_code=True)
+
+
+@contextlib.contextmanager
+def host_tensors():
+    """infer moves its inputs with .cuda(); keep them on the host when there is no GPU"""
+    if torch.cuda.is_available():
+        yield
+        return
+    cuda = torch.Tensor.cuda
+    torch.Tensor.cuda = lambda self, *args, **kwargs: self
+    try:
+        yield
+    finally:
+        torch.Tensor.cuda = cuda
+
+
+def infer_inputs(model, tokenizer, image_path, prompt, size_config):
+    """What `model.infer` passes to `generate` for one image"""
+
+    def capture(*args, **kwargs):
+        raise _Captured(args, kwargs)
+
+    model.generate = capture
+    with tempfile.TemporaryDirectory() as output_path, host_tensors():
+        try:
+            model.infer(
+                tokenizer,
+                prompt=prompt,
+                image_file=image_path,
+                output_path=output_path,
+                base_size=size_config["base_size"],
+                image_size=size_config["image_size"],
+                crop_mode=size_config["crop_mode"],
+                save_results=False,
+                eval_mode=True,
+            )
+        except _Captured as captured:
+            args, kwargs = captured.args, captured.kwargs
+        else:
+            raise RuntimeError("infer returned without calling generate")
+    images_crop, images_ori = kwargs["images"][0]
+    return {
+        "input_ids": args[0][0].cpu(),
+        "images_seq_mask": kwargs["images_seq_mask"][0].cpu(),
+        "images_spatial_crop": torch.as_tensor(kwargs["images_spatial_crop"]).reshape(-1, 2).cpu(),
+        "pixel_values": images_ori.float().cpu(),
+        "images_crop": images_crop.float().cpu(),
+        "generate_kwargs": {k: v for k, v in kwargs.items() if not isinstance(v, (torch.Tensor, list))},
+    }
+
+
+def handler_inputs(processor, image, prompt, size_config):
+    """`prepare_inputs` as the handler runs it, pixels normalized like `model_images`"""
+    inputs = prepare_inputs(processor, image, prompt, size_config)
+    images_crop = inputs["images_crop"]
+    if images_crop.dtype == torch.uint8 and not (inputs["images_spatial_crop"] > 1).any():
+        images_crop = torch.zeros(images_crop.shape)
+    return {
+        "input_ids": inputs["input_ids"].reshape(-1),
+        "images_seq_mask": inputs["images_seq_mask"].reshape(-1),
+        "images_spatial_crop": inputs["images_spatial_crop"].reshape(-1, 2),
+        "pixel_values": normalize_pixels(inputs["pixel_values"], torch.float32),
+        "images_crop": normalize_pixels(images_crop, torch.float32),
+    }
+
+
+def compare(ours, theirs):
+    """Names of the fields that differ"""
+    diffs = [
+        name for name in ("input_ids", "images_seq_mask", "images_spatial_crop")
+        if not torch.equal(ours[name].to(theirs[name].dtype), theirs[name])
+    ]
+    if ours["pixel_values"].shape != theirs["pixel_values"].shape or not torch.allclose(
+        ours["pixel_values"], theirs["pixel_values"], atol=PIXEL_ATOL
+    ):
+        diffs.append("global view")
+    if (theirs["images_spatial_crop"] > 1).any():
+        if ours["images_crop"].shape != theirs["images_crop"].shape or not torch.allclose(
+            ours["images_crop"], theirs["images_crop"], atol=PIXEL_ATOL
+        ):
+            diffs.append("tiles")
+    elif ours["images_crop"].any() or theirs["images_crop"].any():
+        # The model reads an all-zero block as "no tiles"; the block's shape does not matter
+        diffs.append("no-tile block")
+    return diffs
+
+
+def make_image(width, height):
+    rng = np.random.default_rng(width * 7 + height)
+    y, x = np.mgrid[0:height, 0:width]
+    # Text-like rows of dark strokes on a light gradient
+    pixels = np.stack([200 + x * 55 // width, 200 + y * 55 // height, np.full_like(x, 230)], axis=-1)
+    strokes = (y % 40 < 12) & (rng.random((height, width)) < 0.35)
+    pixels[strokes] = rng.integers(0, 80, size=(int(strokes.sum()), 3))
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=MODEL_ID, help="Hub id or local snapshot of the HF model")
+    parser.add_argument("--modes", nargs="+", default=list(SIZE_CONFIGS), choices=list(SIZE_CONFIGS))
+    parser.add_argument("--prompt", default=PROMPT_TEMPLATES["doc_to_markdown"])
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=True)
+    model = load_infer_model(args.model)
+    processor = DeepseekOCRProcessor(tokenizer=tokenizer, hash_tiles=False)
+    failures = 0
+
+    defaults = inspect.signature(sys.modules[type(model).__module__].dynamic_preprocess).parameters
+    infer_budget = (defaults["min_num"].default, defaults["max_num"].default)
+    budget_ok = infer_budget == tuple(INFER_CROP_BUDGET)
+    failures += not budget_ok
+    print(f"crop budget: handler {tuple(INFER_CROP_BUDGET)}, infer dynamic_preprocess {infer_budget}: "
+          f"{'ok' if budget_ok else 'FAIL'}")
+
+    generate_kwargs = None
+    print(f"{'mode':>6} | {'size':>9} | {'grid':>5} | {'tokens':>6} | {'full decode':<24} | "
+          f"{'reduced':<7} | {'max |d|':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for width, height in SHAPES:
+            buffer = io.BytesIO()
+            make_image(width, height).save(buffer, format="JPEG", quality=95)
+            data = buffer.getvalue()
+            image_path = os.path.join(tmp, f"{width}x{height}.jpg")
+            with open(image_path, "wb") as f:
+                f.write(data)
+
+            for mode in args.modes:
+                size_config = {
+                    **SIZE_CONFIGS[mode], "min_crops": INFER_CROP_BUDGET[0], "max_crops": INFER_CROP_BUDGET[1]
+                }
+                theirs = infer_inputs(model, tokenizer, image_path, args.prompt, size_config)
+                generate_kwargs = theirs["generate_kwargs"]
+                ours = handler_inputs(processor, decode_image(io.BytesIO(data)), args.prompt, size_config)
+                diffs = compare(ours, theirs)
+                failures += bool(diffs)
+
+                # Reduced decode: same tokens and grid, resampled pixels
+                reduced_image = decode_image(io.BytesIO(data), size_config)
+                if decode_scale(width, height, size_config) > 1:
+                    reduced = handler_inputs(processor, reduced_image, args.prompt, size_config)
+                    reduced_diffs = [d for d in compare(reduced, theirs) if d not in ("global view", "tiles")]
+                    failures += bool(reduced_diffs)
+                    reduced_result = "FAIL" if reduced_diffs else "ok"
+                    max_diff = f"{(reduced['pixel_values'] - theirs['pixel_values']).abs().max().item():7.3f}"
+                else:
+                    reduced_result, max_diff = "-", f"{'-':>7}"
+
+                grid = "x".join(str(n) for n in theirs["images_spatial_crop"][0].tolist())
+                tokens = int(theirs["images_seq_mask"].sum())
+                print(f"{mode:>6} | {width:>4}x{height:<4} | {grid:>5} | {tokens:>6} | "
+                      f"{'ok' if not diffs else 'DIFF ' + ', '.join(diffs):<24} | {reduced_result:<7} | {max_diff}")
+
+    print(f"infer's generate arguments: {generate_kwargs}")
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark the per-request I/O overhead removed from handler.process_image.
+
+The old path re-encoded every decoded image to a PNG in a temporary directory
+and let `model.infer` read and decode it again. The new path hands the decoded
+PIL image straight to `infer_image`. Model time is identical in both paths, so
+this script measures only the part that differs: decode vs. decode + PNG
+encode + disk write + re-read + re-decode.
+
+Usage:
+    python benchmarks/bench_inference_io.py [--repeats 20]
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+# Approximate encoded sizes (MB) of the synthetic inputs.
+TARGET_SIZES_MB = [1, 2, 5, 10]
+
+
+def make_input(target_mb):
+    """Build a JPEG of roughly `target_mb` megabytes (noise defeats compression)."""
+    side = 1024
+    while True:
+        rng = np.random.default_rng(side)
+        pixels = rng.integers(0, 256, size=(side, side, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=95)
+        if buffer.tell() >= target_mb * 1024 * 1024:
+            return buffer.getvalue()
+        side = int(side * 1.25)
+
+
+def decode(image_bytes):
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+
+def old_path(image_bytes):
+    image = decode(image_bytes)
+    with tempfile.TemporaryDirectory() as output_path:
+        temp_image_path = os.path.join(output_path, "temp_image.png")
+        image.save(temp_image_path)
+        # model.infer -> load_pil_images
+        return Image.open(temp_image_path).convert("RGB")
+
+
+def new_path(image_bytes):
+    return decode(image_bytes)
+
+
+def measure(fn, image_bytes, repeats):
+    cpu, wall = [], []
+    for _ in range(repeats):
+        c0, w0 = time.process_time(), time.perf_counter()
+        fn(image_bytes)
+        cpu.append((time.process_time() - c0) * 1000)
+        wall.append((time.perf_counter() - w0) * 1000)
+    wall.sort()
+    return {
+        "cpu_ms": statistics.mean(cpu),
+        "p50_ms": wall[len(wall) // 2],
+        "p99_ms": wall[min(len(wall) - 1, int(len(wall) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'input':>18} | {'path':>6} | {'cpu ms':>8} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for target_mb in TARGET_SIZES_MB:
+        image_bytes = make_input(target_mb)
+        w, h = Image.open(io.BytesIO(image_bytes)).size
+        label = f"{len(image_bytes) / 2**20:.1f}MB {w}x{h}"
+        results = {}
+        for name, fn in (("old", old_path), ("new", new_path)):
+            results[name] = measure(fn, image_bytes, args.repeats)
+            r = results[name]
+            print(f"{label:>18} | {name:>6} | {r['cpu_ms']:8.1f} | {r['p50_ms']:8.1f} | {r['p99_ms']:8.1f}")
+        saved = results["old"]["cpu_ms"] - results["new"]["cpu_ms"]
+        print(f"{'':>18} | {'saved':>6} | {saved:8.1f} | "
+              f"{results['old']['p50_ms'] - results['new']['p50_ms']:8.1f} | "
+              f"{results['old']['p99_ms'] - results['new']['p99_ms']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+MicroBatcher with a stub engine (CPU only).
+
+The stub engine is a tiny randomly initialised GPT-2 in float64, behind the
+same `left_pad` / `split_generated` collation `handler.generate_batch` uses.
+Jobs are synthetic prompts whose image-token block length depends on their
+SIZE_CONFIGS group, as it does for real prompts. The script checks:
+
+* lone jobs: a job submitted while nothing else is queued or running is
+  dispatched at once, not after --max-wait-ms
+* grouping: every batch holds jobs of one group only
+* left padding: a job's greedy output is the same in a padded batch as run
+  alone, and the padded images_seq_mask still marks exactly its image tokens.
+  EOS is chosen so rows finish at different steps.
+
+It then prints the batch-size histogram and queue waits of a concurrent
+burst. It exits non-zero on any failure.
+
+Usage:
+    python benchmarks/bench_micro_batcher.py [--jobs 48] [--max-batch-size 8] [--max-wait-ms 20] [--engine-ms 30]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.batching import MicroBatcher, left_pad, split_generated  # noqa: E402
+
+# group -> image tokens in its prompts (a stand-in for the per-mode image-token count)
+GROUPS = {"Tiny": 4, "Small": 7, "Gundam": 12}
+VOCAB = 64
+PAD_ID, IMAGE_TOKEN = 0, 5
+NEW_TOKENS = 12
+LONE_JOBS = 5
+
+
+class StubEngine:
+    def __init__(self, engine_ms):
+        from transformers import GPT2Config, GPT2LMHeadModel
+
+        torch.manual_seed(0)
+        config = GPT2Config(vocab_size=VOCAB, n_positions=128, n_embd=32, n_layer=2, n_head=2)
+        config._attn_implementation = "eager"  # the SDPA mask path cannot build a float64 mask
+        self.model = GPT2LMHeadModel(config).double().eval()
+        self.engine_ms = engine_ms
+        self.eos_id = None
+        self.mixed_batches = 0
+        self.mask_errors = 0
+
+    def generate(self, input_ids, attention_mask):
+        with torch.inference_mode():
+            return self.model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                do_sample=False,
+                max_new_tokens=NEW_TOKENS,
+                pad_token_id=PAD_ID,
+                eos_token_id=self.eos_id,
+            )
+
+    def run_alone(self, inputs):
+        output_ids = self.generate(inputs["input_ids"], torch.ones_like(inputs["input_ids"]))
+        return split_generated(output_ids, inputs["input_ids"].shape[1], self.eos_id)[0]
+
+    def run_batch(self, payloads):
+        """MicroBatcher's run_batch: payloads are (group, inputs)"""
+        self.mixed_batches += len({group for group, _ in payloads}) > 1
+        inputs_list = [inputs for _, inputs in payloads]
+        input_ids, attention_mask, images_seq_mask = left_pad(inputs_list, PAD_ID)
+        self.mask_errors += not torch.equal(images_seq_mask, (input_ids == IMAGE_TOKEN) & attention_mask.bool())
+        time.sleep(self.engine_ms / 1000)
+        return split_generated(self.generate(input_ids, attention_mask), input_ids.shape[1], self.eos_id)
+
+
+def make_job(generator, group):
+    """A prompt of random text around one image-token block"""
+    before, after = torch.randint(1, 12, (2,), generator=generator).tolist()
+    text = torch.randint(IMAGE_TOKEN + 1, VOCAB, (before + after,), generator=generator)
+    input_ids = torch.cat([text[:before], torch.full((GROUPS[group],), IMAGE_TOKEN), text[before:]]).unsqueeze(0)
+    return {"input_ids": input_ids, "images_seq_mask": input_ids[0] == IMAGE_TOKEN}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=48)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20.0)
+    parser.add_argument("--engine-ms", type=float, default=30.0, help="stub engine time per batch")
+    args = parser.parse_args()
+
+    engine = StubEngine(args.engine_ms)
+    generator = torch.Generator().manual_seed(0)
+    jobs = [(group, make_job(generator, group)) for group in list(GROUPS) * (args.jobs // len(GROUPS))]
+    # An EOS the model does emit, so rows of one batch finish at different steps
+    engine.eos_id = engine.run_alone(jobs[0][1])[3]
+    expected = [engine.run_alone(inputs) for _, inputs in jobs]
+    failures = 0
+
+    batcher = MicroBatcher(engine.run_batch, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    try:
+        for group, inputs in jobs[:LONE_JOBS]:
+            batcher.submit(group, (group, inputs)).result()
+        lone = batcher.stats.snapshot()
+        lone_ok = lone["queue_wait_ms"]["max"] < args.max_wait_ms / 2
+        failures += not lone_ok
+        print(f"lone jobs: {LONE_JOBS}, queue wait max {lone['queue_wait_ms']['max']:.2f} ms "
+              f"(window {args.max_wait_ms:g} ms): {'ok' if lone_ok else 'FAIL'}")
+
+        batcher.stats = type(batcher.stats)()
+        futures = [None] * len(jobs)
+        barrier = threading.Barrier(len(jobs))
+
+        def submit(index):
+            group, inputs = jobs[index]
+            barrier.wait()
+            futures[index] = batcher.submit(group, (group, inputs))
+
+        threads = [threading.Thread(target=submit, args=(index,)) for index in range(len(jobs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        outputs = [future.result() for future in futures]
+    finally:
+        batcher.close()
+
+    mismatches = sum(output != reference for output, reference in zip(outputs, expected))
+    failures += mismatches + engine.mixed_batches + engine.mask_errors
+    burst = batcher.stats.snapshot()
+    print(f"burst: {len(jobs)} jobs over {len(GROUPS)} groups, engine {args.engine_ms:g} ms per batch")
+    print(f"  {'batches':>7} | {'mean size':>9} | {'histogram':<28} | {'wait p50':>8} | {'p95':>6} | {'max':>6}")
+    waits = burst["queue_wait_ms"]
+    print(f"  {burst['batches']:>7} | {burst['mean_batch_size']:9.2f} | {str(burst['batch_size_histogram']):<28} | "
+          f"{waits['p50']:8.1f} | {waits['p95']:6.1f} | {waits['max']:6.1f}")
+    print(f"  batches mixing groups: {engine.mixed_batches}: {'ok' if not engine.mixed_batches else 'FAIL'}")
+    print(f"  padded images_seq_mask off its image tokens: {engine.mask_errors}: "
+          f"{'ok' if not engine.mask_errors else 'FAIL'}")
+    print(f"  outputs differing from the job run alone: {mismatches}/{len(jobs)}: {'ok' if not mismatches else 'FAIL'}")
+
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
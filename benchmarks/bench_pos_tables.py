@@ -0,0 +1,131 @@
+"""
+Per-forward cost of the positional tables, rebuilt vs cached (PosTableCache).
+
+For each input size the encoders see (640 px tiles, 1024 px global views,
+plus 512 / 1280 for Tiny and Large), measures on randomly initialised SAM and
+CLIP the work that only depends on the trained tables and the size: SAM's
+resized `pos_embed`, the Rh / Rw relative-position tables of every SAM
+attention block, and CLIP's resized position table. "rebuilt" is the old
+per-forward cost; "cached" is the cost of a cache hit. The parity check
+requires the cached tables to equal freshly built ones; the script exits
+non-zero otherwise. With --full, whole SAM + CLIP forwards on one view are
+timed with the caches disabled and enabled.
+
+Usage:
+    python benchmarks/bench_pos_tables.py [--repeats 20] [--full]
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.deepencoder.clip_sdpa import build_clip_l, get_abs_pos as clip_abs_pos  # noqa: E402
+from deepseek_ocr_vllm.deepencoder.pos_cache import PosTableCache  # noqa: E402
+from deepseek_ocr_vllm.deepencoder.sam_vary_sdpa import (  # noqa: E402
+    build_sam_vit_b,
+    get_abs_pos as sam_abs_pos,
+    get_rel_pos,
+)
+
+SIZES = [640, 1024, 512, 1280]
+SAM_PATCH = 16
+CLIP_DOWNSAMPLE = 4  # SAM's neck downsamples 4x before CLIP
+
+
+def table_builders(sam, clip, size):
+    """(source parameter, size key, build) for every table one forward at `size` uses."""
+    grid = size // SAM_PATCH
+    builders = [(sam.pos_embed, grid, lambda: sam_abs_pos(sam.pos_embed, grid))]
+    for block in sam.blocks:
+        attn = block.attn
+        side = block.window_size or grid
+        for rel_pos in (attn.rel_pos_h, attn.rel_pos_w):
+            builders.append((rel_pos, (side, side), lambda r=rel_pos, s=side: get_rel_pos(s, s, r)))
+    embeddings = clip.embeddings
+    tokens = (grid // CLIP_DOWNSAMPLE) ** 2 + 1
+    builders.append((
+        embeddings.position_embedding.weight,
+        tokens,
+        lambda: clip_abs_pos(embeddings.position_embedding(embeddings.position_ids), tokens),
+    ))
+    return builders
+
+
+def per_forward_ms(fn, repeats):
+    wall = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        wall.append((time.perf_counter() - t0) * 1000)
+    return sorted(wall)[len(wall) // 2]
+
+
+def set_cache_items(module, max_items):
+    for sub in module.modules():
+        for value in vars(sub).values():
+            if isinstance(value, PosTableCache):
+                value.max_items = max_items
+                value._tables.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--full", action="store_true", help="also time whole SAM + CLIP forwards")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    sam, clip = build_sam_vit_b().eval(), build_clip_l().eval()
+    for module in (sam, clip):
+        for name, param in module.named_parameters():
+            if "pos" in name:
+                torch.nn.init.normal_(param, std=0.02)
+
+    failures = 0
+    print(f"{'size':>5} | {'tables':>6} | {'rebuilt ms':>10} | {'cached ms':>9} | {'saved ms':>8} | {'parity':>6}")
+    with torch.inference_mode():
+        for size in SIZES:
+            builders = table_builders(sam, clip, size)
+            caches = [PosTableCache() for _ in builders]
+
+            def rebuilt():
+                return [build() for _, _, build in builders]
+
+            def cached():
+                return [cache.get(source, key, build) for cache, (source, key, build) in zip(caches, builders)]
+
+            same = all(torch.equal(a, b) for a, b in zip(rebuilt(), cached()))
+            failures += not same
+            old_ms = per_forward_ms(rebuilt, args.repeats)
+            new_ms = per_forward_ms(cached, args.repeats)
+            print(f"{size:>5} | {len(builders):>6} | {old_ms:10.3f} | {new_ms:9.3f} | {old_ms - new_ms:8.3f} | "
+                  f"{'ok' if same else 'FAIL':>6}")
+
+        if args.full:
+            view = torch.randn(1, 3, 640, 640)
+            print(f"\nSAM + CLIP forward, one 640 px tile (median of {args.repeats // 4 or 1})")
+            outputs = []
+            for label, max_items in (("rebuilt", 0), ("cached", PosTableCache().max_items)):
+                for module in (sam, clip):
+                    set_cache_items(module, max_items)
+
+                def forward():
+                    return clip(view, sam(view))
+
+                outputs.append(forward())
+                print(f"{label:>8}: {per_forward_ms(forward, args.repeats // 4 or 1):8.1f} ms")
+            same = torch.equal(*outputs)
+            failures += not same
+            print(f"  parity: {'ok' if same else 'FAIL'}")
+
+    if failures:
+        print(f"{failures} check(s) differ from freshly built tables")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
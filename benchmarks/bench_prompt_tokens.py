@@ -0,0 +1,111 @@
+"""
+Per-request CPU cost of building input_ids / target_ids / images_seq_mask.
+
+The original `tokenize_with_images` re-tokenized every prompt piece, built
+the image placeholder runs with Python list arithmetic, walked every token
+in a Python loop to build the target ids and only then converted to tensors.
+The current processor tokenizes prompt pieces once (PROMPT_TEMPLATES are
+warmed at construction), keeps one image-token block per run length and
+joins everything with tensor ops. This script times both for each
+PROMPT_TEMPLATES entry across tile layouts and checks the tensors match.
+
+Needs the DeepSeek-OCR tokenizer (downloaded from the Hub, or --tokenizer PATH).
+
+Usage:
+    python benchmarks/bench_prompt_tokens.py [--repeats 200] [--tokenizer PATH]
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.config import MODEL_ID, PROMPT_TEMPLATES  # noqa: E402
+from deepseek_ocr_vllm.process.image_process import (  # noqa: E402
+    DeepseekOCRProcessor,
+    image_token_layout,
+)
+
+# (width, height) of a Gundam-mode input -> 1x1, 2x1, 3x2 and 2x3 tile grids
+IMAGE_SIZES = [(600, 400), (1600, 800), (1900, 1260), (1260, 1900)]
+
+
+def reference_tokens(processor, text_splits, num_image_tokens):
+    """The original list-based assembly (bos and eos on)."""
+    tokenized_str, images_seq_mask = [], []
+    for text_sep, image_tokens in zip(text_splits, num_image_tokens):
+        tokenized_sep = processor.encode(text_sep, bos=False, eos=False)
+        tokenized_str += tokenized_sep
+        images_seq_mask += [False] * len(tokenized_sep)
+        tokenized_image = [processor.image_token_id] * image_tokens
+        tokenized_str += tokenized_image
+        images_seq_mask += [True] * len(tokenized_image)
+    tokenized_sep = processor.encode(text_splits[-1], bos=False, eos=False)
+    tokenized_str += tokenized_sep
+    images_seq_mask += [False] * len(tokenized_sep)
+    tokenized_str = [processor.bos_id] + tokenized_str + [processor.eos_id]
+    images_seq_mask = [False] + images_seq_mask + [False]
+
+    masked_tokenized_str = []
+    for token_index in tokenized_str:
+        if token_index != processor.image_token_id:
+            masked_tokenized_str.append(token_index)
+        else:
+            masked_tokenized_str.append(processor.ignore_id)
+
+    input_ids = torch.LongTensor(tokenized_str)
+    target_ids = torch.LongTensor(masked_tokenized_str)
+    images_seq_mask = torch.tensor(images_seq_mask, dtype=torch.bool)
+    target_ids[(input_ids < 0) | (input_ids == processor.image_token_id)] = processor.ignore_id
+    input_ids[input_ids < 0] = processor.pad_id
+    return input_ids, target_ids, images_seq_mask
+
+
+def cpu_us(fn, repeats):
+    t0 = time.process_time()
+    for _ in range(repeats):
+        fn()
+    return (time.process_time() - t0) / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--tokenizer", default=MODEL_ID)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    processor = DeepseekOCRProcessor(
+        tokenizer=AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+    )
+    failures = 0
+    print(f"{'task':>18} | {'size':>9} | {'tokens':>6} | {'old us':>8} | {'new us':>8} | {'saved us':>8}")
+    for task, template in PROMPT_TEMPLATES.items():
+        prompt = template.format(text_to_locate="Total amount")
+        text_splits = prompt.split(processor.image_token)
+        for width, height in IMAGE_SIZES:
+            _, image_tokens = image_token_layout(width, height)
+            counts = [image_tokens]
+
+            old = reference_tokens(processor, text_splits, counts)
+            new = processor._prompt_token_tensors(text_splits, counts, bos=True, eos=True)
+            failures += not all(torch.equal(a, b) for a, b in zip(old, new))
+
+            old_us = cpu_us(lambda: reference_tokens(processor, text_splits, counts), args.repeats)
+            new_us = cpu_us(
+                lambda: processor._prompt_token_tensors(text_splits, counts, bos=True, eos=True), args.repeats
+            )
+            print(f"{task:>18} | {f'{width}x{height}':>9} | {len(old[0]):>6} | {old_us:8.1f} | "
+                  f"{new_us:8.1f} | {old_us - new_us:8.1f}")
+
+    if failures:
+        print(f"{failures} case(s) differ from the original assembly")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Parity check and peak memory of SAM's chunked relative-position attention.
+
+SAM's global-attention blocks add a decomposed relative-position bias to
+SDPA. Built densely it is a [B, heads, HW, HW] tensor: for a 1024 px global
+view (HW = 4096) that is 12 x 4096^2 values per image, and for the 1280 px
+Large mode (HW = 6400) 2.4x more. `rel_pos_attention` can build it
+--chunk query rows at a time instead. That bounds the memory but costs time,
+so by default (SAM_ATTN_CHUNK_TOKENS = 0) the bias stays dense unless it
+would exceed VISION_ACTIVATION_BUDGET_MB (`bias_chunk_tokens`).
+
+Parity: randomly initialised global-attention blocks at the tile (640), Base
+(1024) and Large (1280) grids, chunked vs dense, in float32; the script exits
+non-zero if they differ beyond float tolerance.
+
+Memory: one global-attention block forward per mode (Base: one 1024 px view,
+Large: one 1280 px view, Gundam: one 1024 px global view then 6 tiles of
+640 px as one batch), dense and chunked, each in a fresh subprocess whose
+peak-RSS counter is reset after setup; the column is the forward's own
+high-water mark on CPU. A dense run killed for lack of memory is reported as
+OOM.
+
+Usage:
+    python benchmarks/bench_sam_attention.py [--dtype bfloat16] [--chunk 1024] [--skip-parity]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from functools import partial
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.config import SAM_ATTN_CHUNK_TOKENS  # noqa: E402
+from deepseek_ocr_vllm.deepencoder.sam_vary_sdpa import Block  # noqa: E402
+
+EMBED_DIM = 768
+NUM_HEADS = 12
+TRAINED_GRID = 64  # 1024 px / 16 px patches
+# mode -> [(batch, grid)] forwarded through one global-attention block
+MODES = {
+    "Base": [(1, 64)],
+    "Large": [(1, 80)],
+    "Gundam": [(1, 64), (6, 40)],
+}
+PARITY_GRIDS = [40, 64, 80]
+
+
+def global_block(seed=0):
+    """A global-attention block as build_sam_vit_b makes it, with random weights."""
+    torch.manual_seed(seed)
+    block = Block(
+        dim=EMBED_DIM,
+        num_heads=NUM_HEADS,
+        mlp_ratio=4,
+        qkv_bias=True,
+        norm_layer=partial(torch.nn.LayerNorm, eps=1e-6),
+        use_rel_pos=True,
+        window_size=0,
+        input_size=(TRAINED_GRID, TRAINED_GRID),
+    )
+    torch.nn.init.normal_(block.attn.rel_pos_h, std=0.02)
+    torch.nn.init.normal_(block.attn.rel_pos_w, std=0.02)
+    return block.eval()
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def child(mode, chunk, dtype):
+    block = global_block().to(getattr(torch, dtype))
+    block.attn.attn_chunk_tokens = chunk
+    inputs = [torch.randn(batch, grid, grid, EMBED_DIM, dtype=block.attn.qkv.weight.dtype)
+              for batch, grid in MODES[mode]]
+    with torch.inference_mode():
+        reset_peak_rss()
+        baseline = current_rss_mb()
+        t0 = time.perf_counter()
+        for x in inputs:
+            block(x)
+        seconds = time.perf_counter() - t0
+    print(json.dumps({"peak_mb": peak_rss_mb() - baseline, "seconds": seconds}))
+
+
+def run_child(mode, chunk, dtype):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--chunk", str(chunk), "--dtype", dtype],
+        capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        return None
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def parity(chunk):
+    failures = 0
+    block = global_block()
+    print(f"{'grid':>4} | {'HW':>5} | {'max abs diff':>12} | {'parity':>6}")
+    for grid in PARITY_GRIDS:
+        x = torch.randn(1, grid, grid, EMBED_DIM)
+        with torch.inference_mode():
+            block.attn.attn_chunk_tokens = 0
+            dense = block(x)
+            block.attn.attn_chunk_tokens = chunk
+            chunked = block(x)
+        diff = (dense - chunked).abs().max().item()
+        same = torch.allclose(dense, chunked, rtol=1e-5, atol=1e-5)
+        failures += not same
+        print(f"{grid:>4} | {grid * grid:>5} | {diff:12.2e} | {'ok' if same else 'FAIL':>6}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dtype", default="bfloat16", choices=["float32", "bfloat16"])
+    parser.add_argument("--chunk", type=int, default=SAM_ATTN_CHUNK_TOKENS or 1024, help="query rows per SDPA call")
+    parser.add_argument("--skip-parity", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.chunk, args.dtype)
+        return
+
+    failures = 0 if args.skip_parity else parity(args.chunk)
+    if not reset_peak_rss():
+        print("note: cannot reset peak RSS here; memory columns are process high-water marks")
+    print(f"\none global-attention block forward, {args.dtype}, chunk {args.chunk} query rows")
+    print(f"{'mode':>6} | {'dense MB':>8} | {'chunked MB':>10} | {'dense s':>7} | {'chunked s':>9}")
+    for mode in MODES:
+        dense = run_child(mode, 0, args.dtype)
+        chunked = run_child(mode, args.chunk, args.dtype)
+        cells = [f"{r['peak_mb']:{w}.0f}" if r else f"{'OOM':>{w}}" for r, w in ((dense, 8), (chunked, 10))]
+        times = [f"{r['seconds']:{w}.2f}" if r else f"{'-':>{w}}" for r, w in ((dense, 7), (chunked, 9))]
+        print(f"{mode:>6} | {cells[0]} | {cells[1]} | {times[0]} | {times[1]}")
+
+    if failures:
+        print(f"{failures} grid(s) differ from the dense bias")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Parity check and benchmark for tile-level dedupe in the vision encoder.
+
+Builds encoder batches the way the vLLM path sees them: scanned-form pages
+tiled by `dynamic_preprocess_tensor` (with `tile_keys`), where every page
+shares a letterhead, and blank (paper-coloured) tiles are common. Each batch
+is encoded with a small deterministic conv encoder standing in for
+SAM + CLIP + projector, once directly and once through `encode_tiles` with
+TILE_DEDUPE (per-batch dedupe) and with BLANK_TILE_CACHE added, and reports
+encoder calls saved and wall time. Parity requires the deduped features to
+match the direct ones (bit-identical when nothing is reusable); the script
+exits non-zero otherwise.
+
+Usage:
+    python benchmarks/bench_tile_dedupe.py [--pages 4] [--batches 3] [--repeats 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.process.image_process import ImageTransform, dynamic_preprocess_tensor  # noqa: E402
+from deepseek_ocr_vllm.tile_dedupe import BlankTileCache, encode_tiles  # noqa: E402
+
+IMAGE_SIZE = 640
+PAPER = (250, 250, 248)
+
+
+class CountingEncoder(torch.nn.Module):
+    """Conv + pooling stand-in for SAM + CLIP + projector; counts encoded tiles."""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.conv = torch.nn.Conv2d(3, 64, kernel_size=16, stride=16)
+        self.proj = torch.nn.Linear(64, 128)
+        self.tiles = 0
+
+    @torch.no_grad()
+    def forward(self, views):
+        self.tiles += len(views)
+        features = torch.nn.functional.avg_pool2d(self.conv(views), 4)
+        return self.proj(features.flatten(2).transpose(1, 2))
+
+
+def form_page(rng, letterhead):
+    """A Gundam 2x3 page: shared letterhead strip, a text block, blank lower half."""
+    page = Image.new("RGB", (IMAGE_SIZE * 2, IMAGE_SIZE * 3), PAPER)
+    page.paste(letterhead, (0, 0))
+    draw = ImageDraw.Draw(page)
+    for y in range(IMAGE_SIZE + 40, IMAGE_SIZE * 2 - 40, 24):
+        x_end = int(rng.uniform(0.4, 0.95) * page.width)
+        draw.rectangle([40, y, x_end, y + 10], fill=(30, 30, 30))
+    return page
+
+
+def make_batches(pages, batches):
+    rng = np.random.default_rng(0)
+    letterhead = Image.fromarray(rng.integers(0, 256, size=(IMAGE_SIZE, IMAGE_SIZE * 2, 3), dtype=np.uint8))
+    transform = ImageTransform()
+    out = []
+    for _ in range(batches):
+        batch = []
+        for _ in range(pages):
+            tiles, _, keys = dynamic_preprocess_tensor(
+                form_page(rng, letterhead), image_size=IMAGE_SIZE, transform=transform, with_keys=True)
+            batch.append((tiles, keys.tolist()))
+        out.append(batch)
+    return out
+
+
+def run(encoder, batches, dedupe, blank_cache):
+    """Encode every batch; returns (features per batch, tiles encoded, ms)."""
+    encoder.tiles = 0
+    results = []
+    t0 = time.perf_counter()
+    for batch in batches:
+        batch_features = {} if dedupe else None
+        results.append([
+            encode_tiles(encoder, tiles, keys, batch_features, blank_cache) for tiles, keys in batch
+        ])
+    return results, encoder.tiles, (time.perf_counter() - t0) * 1000
+
+
+def same(reference, results, exact):
+    compare = torch.equal if exact else (lambda a, b: torch.allclose(a, b, rtol=1e-5, atol=1e-5))
+    return all(
+        compare(a, b) for ref_batch, batch in zip(reference, results) for a, b in zip(ref_batch, batch)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=4, help="pages per encoder batch")
+    parser.add_argument("--batches", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    encoder = CountingEncoder()
+    batches = make_batches(args.pages, args.batches)
+    unkeyed = [[(tiles, [0] * len(keys)) for tiles, keys in batch] for batch in batches]
+    reference, total, _ = run(encoder, batches, dedupe=False, blank_cache=None)
+    failures = 0
+
+    # no reusable tiles: must be exactly encode(tiles)
+    results, _, _ = run(encoder, unkeyed, dedupe=True, blank_cache=BlankTileCache())
+    exact = same(reference, results, exact=True)
+    failures += not exact
+    print(f"unkeyed tiles bit-identical: {'ok' if exact else 'FAIL'}")
+
+    print(f"{args.batches} batches x {args.pages} pages, {total} tiles")
+    print(f"{'mode':>12} | {'encoded':>7} | {'saved':>6} | {'parity':>6} | {'ms':>8}")
+    modes = [("off", False, False), ("dedupe", True, False), ("dedupe+blank", True, True)]
+    for name, dedupe, blank in modes:
+        blank_cache = BlankTileCache() if blank else None
+        results, encoded, _ = run(encoder, batches, dedupe, blank_cache)
+        ok = same(reference, results, exact=False)
+        failures += not ok
+        ms = min(run(encoder, batches, dedupe, blank_cache)[2] for _ in range(args.repeats))
+        print(f"{name:>12} | {encoded:>7} | {1 - encoded / total:6.1%} | {'ok' if ok else 'FAIL':>6} | {ms:8.1f}")
+
+    if failures:
+        print(f"{failures} check(s) differ from the direct encoder")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Parity check and benchmark for the tensor-native tiling engine.
+
+Compares the original per-tile path (`dynamic_preprocess` PIL crops, then
+`ImageTransform` once per tile, then `torch.stack`) with
+`dynamic_preprocess_tensor` (one resize, tiles as a reshaped view, one
+normalize pass) for every 2-6 tile layout Gundam mode can pick. The parity
+check requires bit-identical tensors; the script exits non-zero otherwise.
+
+Usage:
+    python benchmarks/bench_tiling.py [--repeats 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.process.image_process import (  # noqa: E402
+    ImageTransform,
+    count_tiles,
+    dynamic_preprocess,
+    dynamic_preprocess_tensor,
+)
+
+IMAGE_SIZE = 640
+
+# (tiles_w, tiles_h) layouts with 2-6 tiles
+LAYOUTS = [(2, 1), (1, 2), (3, 1), (2, 2), (5, 1), (3, 2), (2, 3), (6, 1)]
+
+
+def make_image(tiles_w, tiles_h):
+    """Noise image whose aspect ratio selects the (tiles_w, tiles_h) layout."""
+    rng = np.random.default_rng(tiles_w * 10 + tiles_h)
+    width, height = int(tiles_w * IMAGE_SIZE * 1.3), int(tiles_h * IMAGE_SIZE * 1.3)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+def old_path(image, transform):
+    crops, ratio = dynamic_preprocess(image, image_size=IMAGE_SIZE)
+    return torch.stack([transform(crop) for crop in crops], dim=0), ratio
+
+
+def new_path(image, transform):
+    return dynamic_preprocess_tensor(image, image_size=IMAGE_SIZE, transform=transform)
+
+
+def measure(fn, image, transform, repeats):
+    wall = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(image, transform)
+        wall.append((time.perf_counter() - t0) * 1000)
+    wall.sort()
+    return statistics.mean(wall), wall[len(wall) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    transform = ImageTransform()
+    failures = 0
+    print(f"{'layout':>8} | {'tiles':>5} | {'parity':>6} | {'old ms':>8} | {'new ms':>8} | {'speedup':>7}")
+    for tiles_w, tiles_h in LAYOUTS:
+        image = make_image(tiles_w, tiles_h)
+        assert tuple(count_tiles(*image.size, image_size=IMAGE_SIZE)) == (tiles_w, tiles_h)
+
+        old_tiles, old_ratio = old_path(image, transform)
+        new_tiles, new_ratio = new_path(image, transform)
+        same = tuple(old_ratio) == tuple(new_ratio) and torch.equal(old_tiles, new_tiles)
+        failures += not same
+
+        old_mean, _ = measure(old_path, image, transform, args.repeats)
+        new_mean, _ = measure(new_path, image, transform, args.repeats)
+        print(f"{f'{tiles_w}x{tiles_h}':>8} | {tiles_w * tiles_h:>5} | {'ok' if same else 'FAIL':>6} | "
+              f"{old_mean:8.1f} | {new_mean:8.1f} | {old_mean / new_mean:6.2f}x")
+
+    if failures:
+        print(f"{failures} layout(s) differ from the reference path")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
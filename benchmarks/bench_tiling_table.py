@@ -0,0 +1,102 @@
+"""
+Property check and micro-benchmark for the memoized tiling table.
+
+`count_tiles` used to rebuild and sort the `target_ratios` set on every call,
+and `get_num_image_tokens` recomputed the tile grid for every image during
+prompt replacement. This script compares the original (uncached) code with
+`count_tiles` / `image_token_layout` over a wide grid of image sizes and
+crop ranges, requiring identical tile choices and token counts, then times
+both.
+
+Usage:
+    python benchmarks/bench_tiling_table.py [--step 37]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.process.image_process import (  # noqa: E402
+    count_tiles,
+    find_closest_aspect_ratio,
+    image_token_layout,
+)
+
+BASE_SIZE, IMAGE_SIZE = 1024, 640
+CROP_RANGES = [(2, 6), (2, 9), (1, 4)]
+
+
+def reference_count_tiles(orig_width, orig_height, min_num=2, max_num=6, image_size=640):
+    """`count_tiles` as it was before the table was memoized."""
+    aspect_ratio = orig_width / orig_height
+    target_ratios = set(
+        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
+        i * j <= max_num and i * j >= min_num)
+    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
+    return find_closest_aspect_ratio(aspect_ratio, target_ratios, orig_width, orig_height, image_size)
+
+
+def reference_num_image_tokens(width, height, min_num=2, max_num=6):
+    """`DeepseekOCRProcessingInfo.get_num_image_tokens` as it was (Gundam mode)."""
+    if width <= 640 and height <= 640:
+        num_width_tiles, num_height_tiles = 1, 1
+    else:
+        num_width_tiles, num_height_tiles = reference_count_tiles(width, height, min_num, max_num, IMAGE_SIZE)
+    h = w = math.ceil((BASE_SIZE // 16) / 4)
+    h2 = w2 = math.ceil((IMAGE_SIZE // 16) / 4)
+    tokens = h * (w + 1) + 1
+    if num_width_tiles > 1 or num_height_tiles > 1:
+        tokens += (num_height_tiles * h2) * (num_width_tiles * w2 + 1)
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--step", type=int, default=37, help="pixel step of the size grid")
+    args = parser.parse_args()
+
+    sizes = [(w, h) for w in range(16, 4097, args.step) for h in range(16, 4097, args.step)]
+    mismatches = 0
+    for min_num, max_num in CROP_RANGES:
+        for w, h in sizes:
+            if tuple(count_tiles(w, h, min_num, max_num, IMAGE_SIZE)) != tuple(
+                    reference_count_tiles(w, h, min_num, max_num, IMAGE_SIZE)):
+                mismatches += 1
+            _, tokens = image_token_layout(w, h, BASE_SIZE, IMAGE_SIZE, True, min_num, max_num)
+            if tokens != reference_num_image_tokens(w, h, min_num, max_num):
+                mismatches += 1
+    print(f"property check: {len(sizes) * len(CROP_RANGES)} (size, crop range) cases, {mismatches} mismatches")
+
+    # Micro-benchmark: one prompt-replacement lookup per image, images of
+    # recurring sizes (the usual case: scans / screenshots of a few resolutions)
+    workload = sizes[:2000] * 5
+    t0 = time.perf_counter()
+    for w, h in workload:
+        reference_num_image_tokens(w, h)
+    reference_us = (time.perf_counter() - t0) / len(workload) * 1e6
+
+    image_token_layout.cache_clear()
+    t0 = time.perf_counter()
+    for w, h in workload:
+        image_token_layout(w, h, BASE_SIZE, IMAGE_SIZE, True)
+    cached_us = (time.perf_counter() - t0) / len(workload) * 1e6
+
+    t0 = time.perf_counter()
+    for w, h in workload:
+        image_token_layout(w, h, BASE_SIZE, IMAGE_SIZE, True)
+    warm_us = (time.perf_counter() - t0) / len(workload) * 1e6
+
+    print(f"{'path':>22} | {'us / lookup':>11}")
+    print(f"{'original':>22} | {reference_us:11.2f}")
+    print(f"{'memoized (cold + reps)':>22} | {cached_us:11.2f}")
+    print(f"{'memoized (warm)':>22} | {warm_us:11.2f}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
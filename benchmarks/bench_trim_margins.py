@@ -0,0 +1,121 @@
+"""
+Vision-token and preprocessing-latency effect of margin trimming (trim_margins).
+
+Runs every page of a document corpus through the pixel half of
+`tokenize_with_images` (global-view pad + tiles) with and without
+`trim_margins` first, for the Gundam and Base modes, and reports the average
+image-token count (what the model prefills) and preprocessing time per page,
+trim cost included.
+
+Without --corpus a synthetic corpus is generated: text-block pages of common
+scan sizes (A4 / Letter at 300 dpi, receipts, slides) with random margins.
+Point --corpus at a directory of real scans for representative numbers.
+
+Usage:
+    python benchmarks/bench_trim_margins.py [--corpus DIR] [--pages 40] [--repeats 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.config import SIZE_CONFIGS  # noqa: E402
+from deepseek_ocr_vllm.process.image_process import (  # noqa: E402
+    ImageTransform,
+    dynamic_preprocess_tensor,
+    image_token_layout,
+    trim_margins,
+)
+
+MODES = ["Gundam", "Base"]
+# (width, height) of common scans
+PAGE_SIZES = [(2480, 3508), (2550, 3300), (900, 2600), (1920, 1080)]
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff", ".bmp")
+
+
+def synthetic_page(rng):
+    width, height = PAGE_SIZES[rng.integers(len(PAGE_SIZES))]
+    page = Image.new("RGB", (width, height), (250, 250, 248))
+    draw = ImageDraw.Draw(page)
+    # margins from a tight 3% up to a wide 25% per side
+    left, right = (rng.uniform(0.03, 0.25, size=2) * width).astype(int)
+    top, bottom = (rng.uniform(0.03, 0.25, size=2) * height).astype(int)
+    line = max(12, height // 120)
+    y = top
+    while y + line < height - bottom:
+        x_end = width - right - int(rng.uniform(0, 0.3) * (width - left - right))
+        draw.rectangle([left, y, x_end, y + line // 2], fill=(30, 30, 30))
+        y += line * (3 if rng.random() < 0.1 else 1)
+    return page
+
+
+def load_corpus(args):
+    if args.corpus:
+        paths = sorted(
+            os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        return [Image.open(path).convert("RGB") for path in paths[:args.pages]]
+    rng = np.random.default_rng(0)
+    return [synthetic_page(rng) for _ in range(args.pages)]
+
+
+def preprocess(image, size_config, transform, trim):
+    """Trim (optional) + the pixel work of `tokenize_with_images`; returns the image-token count."""
+    if trim:
+        image = trim_margins(image)
+    base_size, image_size, crop_mode = size_config["base_size"], size_config["image_size"], size_config["crop_mode"]
+    crop_ratio, num_image_tokens = image_token_layout(image.size[0], image.size[1], base_size, image_size, crop_mode)
+    if crop_ratio != (1, 1):
+        dynamic_preprocess_tensor(image, image_size=image_size, transform=transform)
+    if image_size <= 640 and not crop_mode:
+        image = image.resize((image_size, image_size))
+    transform(ImageOps.pad(image, (base_size, base_size), color=tuple(int(x * 255) for x in transform.mean)))
+    return num_image_tokens
+
+
+def timed_ms(fn, repeats):
+    wall = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        wall.append((time.perf_counter() - t0) * 1000)
+    return min(wall)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="directory of page images (default: synthetic pages)")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_corpus(args)
+    if not pages:
+        sys.exit("no pages found")
+    transform = ImageTransform()
+    print(f"{len(pages)} pages ({args.corpus or 'synthetic'})")
+    print(f"{'mode':>6} | {'tokens':>7} | {'trimmed':>7} | {'saved':>6} | {'prep ms':>7} | {'trimmed':>7} | "
+          f"{'trim ms':>7}")
+    for mode in MODES:
+        size_config = SIZE_CONFIGS[mode]
+        tokens, trimmed_tokens, prep_ms, trimmed_ms, trim_ms = [], [], [], [], []
+        for page in pages:
+            tokens.append(preprocess(page, size_config, transform, trim=False))
+            trimmed_tokens.append(preprocess(page, size_config, transform, trim=True))
+            prep_ms.append(timed_ms(lambda: preprocess(page, size_config, transform, False), args.repeats))
+            trimmed_ms.append(timed_ms(lambda: preprocess(page, size_config, transform, True), args.repeats))
+            trim_ms.append(timed_ms(lambda: trim_margins(page), args.repeats))
+        mean_tokens, mean_trimmed = statistics.mean(tokens), statistics.mean(trimmed_tokens)
+        print(f"{mode:>6} | {mean_tokens:7.0f} | {mean_trimmed:7.0f} | {1 - mean_trimmed / mean_tokens:6.1%} | "
+              f"{statistics.mean(prep_ms):7.1f} | {statistics.mean(trimmed_ms):7.1f} | {statistics.mean(trim_ms):7.1f}")
+
+
+if __name__ == "__main__":
+    main()
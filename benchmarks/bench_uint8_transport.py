@@ -0,0 +1,108 @@
+"""
+Memory and throughput of uint8 pixel transport (UINT8_PIXEL_TRANSPORT).
+
+Builds the Gundam-mode global view and crop tiles both ways (float32 as the
+processor emits by default, uint8 with the normalization moved to the
+consumer) and reports, per input layout:
+
+  * bytes of pixel_values + images_crop (what every copy / IPC hop moves)
+  * CPU preprocessing time
+  * pickle round trip (stand-in for the engine's IPC serialization)
+  * host -> device copy + normalize, on CUDA when available
+
+It also checks that `normalize_pixels` on the uint8 tensors reproduces the
+float32 tensors exactly.
+
+Usage:
+    python benchmarks/bench_uint8_transport.py [--repeats 10]
+"""
+import argparse
+import os
+import pickle
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.process.image_process import (  # noqa: E402
+    ImageTransform,
+    dynamic_preprocess_tensor,
+    normalize_pixels,
+    pil_to_uint8_tensor,
+)
+
+BASE_SIZE, IMAGE_SIZE = 1024, 640
+LAYOUTS = [(2, 1), (2, 2), (3, 2)]
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def make_image(tiles_w, tiles_h):
+    rng = np.random.default_rng(tiles_w * 10 + tiles_h)
+    width, height = int(tiles_w * IMAGE_SIZE * 1.3), int(tiles_h * IMAGE_SIZE * 1.3)
+    return Image.fromarray(rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8))
+
+
+def preprocess(image, transform, uint8):
+    """The pixel half of `tokenize_with_images` for one Gundam-mode image."""
+    tiles, _ = dynamic_preprocess_tensor(image, image_size=IMAGE_SIZE, transform=transform, uint8=uint8)
+    global_view = ImageOps.pad(image, (BASE_SIZE, BASE_SIZE), color=tuple(int(x * 255) for x in transform.mean))
+    pixel_values = (pil_to_uint8_tensor(global_view) if uint8 else transform(global_view)).unsqueeze(0)
+    return pixel_values, tiles.unsqueeze(0)
+
+
+def to_device(pixel_values, images_crop):
+    out = (
+        normalize_pixels(pixel_values.to(DEVICE), torch.bfloat16),
+        normalize_pixels(images_crop.to(DEVICE), torch.bfloat16),
+    )
+    if DEVICE == "cuda":
+        torch.cuda.synchronize()
+    return out
+
+
+def timed(fn, repeats):
+    wall = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        wall.append((time.perf_counter() - t0) * 1000)
+    return statistics.mean(wall)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    transform = ImageTransform()
+    print(f"device for copy + normalize: {DEVICE}")
+    print(f"{'layout':>6} | {'mode':>7} | {'MB':>7} | {'prep ms':>8} | {'pickle ms':>9} | {'to-dev ms':>9}")
+    failures = 0
+    for tiles_w, tiles_h in LAYOUTS:
+        image = make_image(tiles_w, tiles_h)
+        tensors = {}
+        for mode, uint8 in (("float32", False), ("uint8", True)):
+            pixel_values, images_crop = tensors[mode] = preprocess(image, transform, uint8)
+            nbytes = sum(t.numel() * t.element_size() for t in (pixel_values, images_crop))
+            prep_ms = timed(lambda: preprocess(image, transform, uint8), args.repeats)
+            pickle_ms = timed(lambda: pickle.loads(pickle.dumps((pixel_values, images_crop))), args.repeats)
+            device_ms = timed(lambda: to_device(pixel_values, images_crop), args.repeats)
+            print(f"{f'{tiles_w}x{tiles_h}':>6} | {mode:>7} | {nbytes / 2**20:7.1f} | {prep_ms:8.1f} | "
+                  f"{pickle_ms:9.1f} | {device_ms:9.1f}")
+
+        for ref, raw in zip(tensors["float32"], tensors["uint8"]):
+            failures += not torch.equal(ref, normalize_pixels(raw, torch.float32))
+
+    if failures:
+        print(f"{failures} tensor(s) differ after on-device normalization")
+        sys.exit(1)
+    print("parity: uint8 + normalize_pixels == float32 path")
+
+
+if __name__ == "__main__":
+    main()
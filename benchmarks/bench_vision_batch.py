@@ -0,0 +1,169 @@
+"""
+Parity check and benchmark for batched vision encoding.
+
+Encodes a scheduler step's worth of images with randomly initialised SAM,
+CLIP and projector weights, first the old way (per image: one forward for its
+tiles, one for its global view) and then the way
+`DeepseekOCRForCausalLM._pixel_values_to_embedding` does now
+(`encode_grouped`: one forward for every tile of the step, one per global-view
+size), and lays both out with `format_image_features`. The step mixes Gundam
+images (1024 px global view + 640 px tiles) with Small-mode images (640 px
+global view, no tiles), so the global views form two shape groups.
+Parity requires the per-image features to match within float tolerance;
+the script exits non-zero otherwise.
+
+Runs on CPU by default (float32); pass --device cuda --dtype bfloat16 for
+representative timings.
+
+Usage:
+    python benchmarks/bench_vision_batch.py [--gundam 2 --small 1] [--device cpu] [--repeats 1]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from addict import Dict  # noqa: E402
+
+from deepseek_ocr_vllm.config import SIZE_CONFIGS  # noqa: E402
+from deepseek_ocr_vllm.deepencoder.build_linear import MlpProjector  # noqa: E402
+from deepseek_ocr_vllm.deepencoder.clip_sdpa import build_clip_l  # noqa: E402
+from deepseek_ocr_vllm.deepencoder.sam_vary_sdpa import build_sam_vit_b  # noqa: E402
+from deepseek_ocr_vllm.process.image_process import (  # noqa: E402
+    ImageTransform,
+    dynamic_preprocess_tensor,
+    image_token_layout,
+)
+from deepseek_ocr_vllm.vision_batch import encode_grouped, format_image_features  # noqa: E402
+
+N_EMBED = 1280
+# Gundam page sizes with 2-3 tile layouts, to keep a CPU run short
+GUNDAM_SIZES = [(1400, 700), (700, 1400), (2000, 700)]
+
+
+class Encoder(torch.nn.Module):
+    """SAM + CLIP + projector as the model wires them (`_encode_views`); counts forwards."""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.sam_model = build_sam_vit_b()
+        self.vision_model = build_clip_l()
+        self.projector = MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=N_EMBED))
+        self.image_newline = torch.nn.Parameter(torch.randn(N_EMBED) / N_EMBED**0.5)
+        self.view_seperator = torch.nn.Parameter(torch.randn(N_EMBED) / N_EMBED**0.5)
+        self.calls = 0
+
+    @torch.no_grad()
+    def forward(self, views):
+        self.calls += 1
+        sam_features = self.sam_model(views)
+        clip_features = self.vision_model(views, sam_features)
+        features = torch.cat((clip_features[:, 1:], sam_features.flatten(2).permute(0, 2, 1)), dim=-1)
+        return self.projector(features)
+
+
+def make_step(n_gundam, n_small, transform):
+    """[(global view [1, 3, S, S], tiles [n, 3, 640, 640] or None, crop_shape or None)]"""
+    rng = np.random.default_rng(0)
+    step = []
+    for index in range(n_gundam + n_small):
+        mode = "Gundam" if index < n_gundam else "Small"
+        config = SIZE_CONFIGS[mode]
+        width, height = GUNDAM_SIZES[index % len(GUNDAM_SIZES)] if mode == "Gundam" else (900, 1200)
+        image = Image.fromarray(rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8))
+        crop_ratio, _ = image_token_layout(width, height, config["base_size"], config["image_size"],
+                                           config["crop_mode"])
+        tiles = crop_shape = None
+        if crop_ratio != (1, 1):
+            tiles, _ = dynamic_preprocess_tensor(image, image_size=config["image_size"], transform=transform)
+            crop_shape = crop_ratio
+        if config["image_size"] <= 640 and not config["crop_mode"]:
+            image = image.resize((config["image_size"], config["image_size"]))
+        base_size = config["base_size"]
+        global_view = transform(ImageOps.pad(image, (base_size, base_size),
+                                             color=tuple(int(x * 255) for x in transform.mean)))
+        step.append((global_view.unsqueeze(0), tiles, crop_shape))
+    return step
+
+
+def per_image(encoder, step):
+    """The previous loop: two encoder forwards per cropped image."""
+    out = []
+    for global_view, tiles, crop_shape in step:
+        local_features = encoder(tiles) if tiles is not None else None
+        global_features = encoder(global_view)
+        out.append(format_image_features(global_features, local_features, crop_shape,
+                                         encoder.image_newline, encoder.view_seperator))
+    return out
+
+
+def batched(encoder, step):
+    """`_pixel_values_to_embedding`'s gather / encode / scatter."""
+    tile_views = [tiles for _, tiles, _ in step if tiles is not None]
+    local_features = iter(encode_grouped(encoder, tile_views))
+    global_features = encode_grouped(encoder, [global_view for global_view, _, _ in step])
+    return [
+        format_image_features(image_global, next(local_features) if crop_shape is not None else None, crop_shape,
+                              encoder.image_newline, encoder.view_seperator)
+        for (_, _, crop_shape), image_global in zip(step, global_features)
+    ]
+
+
+def timed(fn, encoder, step, device, repeats):
+    best, out = float("inf"), None
+    for _ in range(repeats):
+        encoder.calls = 0
+        if device == "cuda":
+            torch.cuda.synchronize()
+        t0 = time.perf_counter()
+        out = fn(encoder, step)
+        if device == "cuda":
+            torch.cuda.synchronize()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return out, encoder.calls, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gundam", type=int, default=2, help="Gundam images in the step")
+    parser.add_argument("--small", type=int, default=1, help="Small-mode images in the step")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "bfloat16"])
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    dtype = getattr(torch, args.dtype)
+    encoder = Encoder().to(device=args.device, dtype=dtype).eval()
+    step = [
+        (global_view.to(args.device, dtype), None if tiles is None else tiles.to(args.device, dtype), crop_shape)
+        for global_view, tiles, crop_shape in make_step(args.gundam, args.small, ImageTransform())
+    ]
+    n_tiles = sum(len(tiles) for _, tiles, _ in step if tiles is not None)
+    print(f"{len(step)} images ({args.gundam} Gundam, {args.small} Small), {n_tiles} tiles, "
+          f"{args.device} {args.dtype}")
+
+    reference, old_calls, old_ms = timed(per_image, encoder, step, args.device, args.repeats)
+    result, new_calls, new_ms = timed(batched, encoder, step, args.device, args.repeats)
+    tolerance = 1e-4 if dtype == torch.float32 else 2e-2
+    worst = max((a.float() - b.float()).abs().max().item() for a, b in zip(reference, result))
+    same = all(a.shape == b.shape for a, b in zip(reference, result)) and all(
+        torch.allclose(a.float(), b.float(), rtol=tolerance, atol=tolerance) for a, b in zip(reference, result)
+    )
+
+    print(f"{'path':>9} | {'forwards':>8} | {'ms':>9}")
+    print(f"{'per-image':>9} | {old_calls:>8} | {old_ms:9.1f}")
+    print(f"{'batched':>9} | {new_calls:>8} | {new_ms:9.1f}")
+    print(f"parity: {'ok' if same else 'FAIL'} (max abs diff {worst:.2e})")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
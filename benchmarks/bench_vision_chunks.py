@@ -0,0 +1,104 @@
+"""
+Chunk plans of the memory-capped vision encoder forwards (CPU only).
+
+`_pixel_values_to_embedding` runs one SAM + CLIP forward per view shape; with
+many images in a step the tile batch grows without bound, and so does its
+peak activation memory. `encode_in_chunks` splits each forward into chunks
+whose estimated peak (`view_activation_bytes`: SAM's global-attention block
+token tensors plus the relative-position bias, and CLIP's block)
+fits VISION_ACTIVATION_BUDGET_MB.
+
+For steps of Base / Large / Gundam images, prints the per-view estimate, the
+chunk plan at a few budgets and the estimated peak of the largest chunk. The
+plans are checked (sizes cover every view, each chunk fits the budget unless
+it is a single view, sizes differ by at most one) and `encode_in_chunks` is
+checked against one direct forward with a small stand-in encoder; the
+script exits non-zero on any failure.
+
+Usage:
+    python benchmarks/bench_vision_chunks.py [--images 8] [--budgets 0 1024 2048 4096] [--dtype-bytes 2]
+"""
+import argparse
+import os
+import sys
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from deepseek_ocr_vllm.config import SAM_ATTN_CHUNK_TOKENS, VISION_ACTIVATION_BUDGET_MB  # noqa: E402
+from deepseek_ocr_vllm.vision_batch import encode_in_chunks, plan_chunks, view_activation_bytes  # noqa: E402
+
+# mode -> [(view size, views per image)] forwarded for a step of its images
+MODES = {
+    "Base": [(1024, 1)],
+    "Large": [(1280, 1)],
+    "Gundam": [(640, 6), (1024, 1)],
+}
+
+
+def describe(sizes):
+    """[7, 7, 6] -> '2x7 + 1x6'"""
+    return " + ".join(f"{sizes.count(n)}x{n}" for n in sorted(set(sizes), reverse=True))
+
+
+def check_plan(sizes, n_views, view_bytes, budget_bytes):
+    if sum(sizes) != n_views:
+        return False
+    if sizes and max(sizes) - min(sizes) > 1:
+        return False
+    return budget_bytes <= 0 or all(n == 1 or n * view_bytes <= budget_bytes for n in sizes)
+
+
+def check_encode(budget_mb):
+    """encode_in_chunks equals a single forward of a per-view stand-in encoder."""
+    torch.manual_seed(0)
+    weight = torch.randn(1, 8)
+
+    def encode(views):
+        return views.mean(dim=(-2, -1)) @ weight
+
+    # 1024 px views (one channel keeps the stand-in cheap): chunks of 2, 5 and 11 at 1, 2 and 4 GB
+    views = torch.randn(13, 1, 1024, 1024)
+    chunked = encode_in_chunks(encode, views, budget_mb=budget_mb)
+    return torch.allclose(chunked, encode(views))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 1024, 2048, VISION_ACTIVATION_BUDGET_MB])
+    parser.add_argument("--dtype-bytes", type=int, default=2, help="2 for bfloat16, 4 for float32")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{args.images} images per step, {args.dtype_bytes}-byte activations, "
+          f"SAM attention bias {f'chunked by {SAM_ATTN_CHUNK_TOKENS} query rows' if SAM_ATTN_CHUNK_TOKENS else 'dense'}")
+    print(f"{'mode':>6} | {'size':>4} | {'views':>5} | {'MB/view':>7} | {'budget MB':>9} | "
+          f"{'chunks':<12} | {'peak MB':>7} | {'plan':>4}")
+    for mode, shapes in MODES.items():
+        for size, per_image in shapes:
+            n_views = per_image * args.images
+            view_bytes = view_activation_bytes(size, args.dtype_bytes)
+            for budget_mb in args.budgets:
+                budget_bytes = budget_mb * 2**20
+                sizes = plan_chunks(n_views, view_bytes, budget_bytes)
+                ok = check_plan(sizes, n_views, view_bytes, budget_bytes)
+                failures += not ok
+                peak = max(sizes) * view_bytes / 2**20
+                chunks = describe(sizes)
+                print(f"{mode:>6} | {size:>4} | {n_views:>5} | {view_bytes / 2**20:7.0f} | {budget_mb or '-':>9} | "
+                      f"{chunks:<12} | {peak:7.0f} | {'ok' if ok else 'FAIL':>4}")
+
+    for budget_mb in args.budgets:
+        same = check_encode(budget_mb)
+        failures += not same
+        print(f"encode_in_chunks == one forward, budget {budget_mb or '-'} MB: {'ok' if same else 'FAIL'}")
+
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Dynamic micro-batching for concurrent OCR jobs
+Gathers jobs that arrive close together and runs them as one batched engine call
+"""
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import torch
+
+
+class BatchStats:
+    """Thread-safe batch-size and queue-wait statistics"""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._waits_ms = deque(maxlen=window)
+        self.batches = 0
+        self.jobs = 0
+        self.failed_batches = 0
+        self.max_wait_ms = 0.0
+
+    def record(self, batch_size: int, waits_ms: Sequence[float]):
+        with self._lock:
+            self.batches += 1
+            self.jobs += batch_size
+            self._batch_sizes[batch_size] += 1
+            self._waits_ms.extend(waits_ms)
+            self.max_wait_ms = max(self.max_wait_ms, *waits_ms)
+
+    def record_failure(self):
+        with self._lock:
+            self.failed_batches += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            return {
+                "batches": self.batches,
+                "jobs": self.jobs,
+                "failed_batches": self.failed_batches,
+                "mean_batch_size": self.jobs / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "queue_wait_ms": {
+                    "p50": _percentile(waits, 0.50),
+                    "p95": _percentile(waits, 0.95),
+                    "max": self.max_wait_ms,
+                },
+            }
+
+
+def left_pad(inputs_list: Sequence[Dict], pad_id: int) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Stack per-job prompts for one batched generate call, padded on the left
+
+    Left padding keeps every prompt's last token in the final column, where
+    generation continues. ``images_seq_mask`` is padded the same way, so image
+    features still land on each row's image tokens.
+
+    Args:
+        inputs_list: ``prepare_inputs`` dicts (``input_ids`` [1, n], ``images_seq_mask`` [n])
+
+    Returns:
+        (input_ids, attention_mask, images_seq_mask), each [n_jobs, longest prompt]
+    """
+    max_len = max(inputs["input_ids"].shape[1] for inputs in inputs_list)
+    input_ids = torch.full((len(inputs_list), max_len), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(inputs_list), max_len), dtype=torch.long)
+    images_seq_mask = torch.zeros((len(inputs_list), max_len), dtype=torch.bool)
+    for row, inputs in enumerate(inputs_list):
+        length = inputs["input_ids"].shape[1]
+        input_ids[row, max_len - length:] = inputs["input_ids"][0]
+        attention_mask[row, max_len - length:] = 1
+        images_seq_mask[row, max_len - length:] = inputs["images_seq_mask"]
+    return input_ids, attention_mask, images_seq_mask
+
+
+def split_generated(output_ids: torch.Tensor, prompt_len: int, eos_token_id: int) -> List[List[int]]:
+    """
+    Per-job generated token ids of a batched generate call
+
+    Rows that finished early are padded up to the longest one; each is cut at
+    its first EOS.
+    """
+    rows = []
+    for row in output_ids[:, prompt_len:].tolist():
+        if eos_token_id in row:
+            row = row[: row.index(eos_token_id)]
+        rows.append(row)
+    return rows
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class MicroBatcher:
+    """
+    Collect concurrent jobs into batches in front of a single engine
+
+    Jobs are grouped by a hashable key (e.g. the ``SIZE_CONFIGS`` name) so every
+    batch holds shape-compatible inputs. A group is dispatched as soon as it
+    holds ``max_batch_size`` jobs, or once its oldest job has waited
+    ``max_wait_ms``. A job that is alone while the engine is idle is
+    dispatched at once: the window only applies when there is traffic to
+    batch with. Batches run one at a time on a dedicated worker thread.
+
+    Args:
+        run_batch: Callable taking a list of payloads and returning one output per payload
+        max_batch_size: Upper bound on jobs per engine call
+        max_wait_ms: Longest time a job waits for others to join its batch
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"`max_batch_size` must be >= 1, got {max_batch_size}")
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = BatchStats()
+
+        self._groups: Dict[Hashable, deque] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._loop, name="ocr-micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, group: Hashable, payload: Any) -> Future:
+        """Queue one job and return a Future resolving to its output"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._groups.setdefault(group, deque()).append((payload, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop accepting jobs, flush the queued ones and join the worker"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join(timeout)
+
+    def _take_batch(self):
+        # Called with the condition held, on the worker between batches (the engine
+        # is idle). Returns (items, None) for a ready group, or (None, deadline)
+        # with the earliest time a group becomes ready.
+        now = time.monotonic()
+        ready, next_deadline = None, None
+        # Nothing running and nothing else queued: waiting would only add latency
+        alone = len(self._groups) == 1 and len(next(iter(self._groups.values()))) == 1
+        for group, queue in self._groups.items():
+            enqueued_at = queue[0][2]
+            if (
+                self._closed
+                or alone
+                or len(queue) >= self.max_batch_size
+                or enqueued_at + self.max_wait <= now
+            ):
+                # Among ready groups, serve the one holding the oldest job first
+                if ready is None or enqueued_at < self._groups[ready][0][2]:
+                    ready = group
+            elif next_deadline is None or enqueued_at + self.max_wait < next_deadline:
+                next_deadline = enqueued_at + self.max_wait
+
+        if ready is None:
+            return None, next_deadline
+
+        queue = self._groups[ready]
+        items = [queue.popleft() for _ in range(min(self.max_batch_size, len(queue)))]
+        if not queue:
+            del self._groups[ready]
+        return items, None
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if not self._groups:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                items, next_deadline = self._take_batch()
+                if items is not None:
+                    return items
+                self._cond.wait(max(0.0, next_deadline - time.monotonic()))
+
+    def _loop(self):
+        while True:
+            items = self._next_batch()
+            if items is None:
+                return
+
+            started = time.monotonic()
+            # Drop jobs whose callers cancelled while queued
+            items = [item for item in items if item[1].set_running_or_notify_cancel()]
+            if not items:
+                continue
+            self.stats.record(len(items), [(started - item[2]) * 1000 for item in items])
+
+            try:
+                outputs = self.run_batch([item[0] for item in items])
+                if len(outputs) != len(items):
+                    raise RuntimeError(
+                        f"run_batch returned {len(outputs)} outputs for {len(items)} jobs"
+                    )
+            except Exception as e:
+                self.stats.record_failure()
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), output in zip(items, outputs):
+                future.set_result(output)
@@ -7,10 +7,64 @@ IMAGE_SIZE = 640
 CROP_MODE = True
 MIN_CROPS = 2
 MAX_CROPS = 6  # max:9; If your GPU memory is small, it is recommended to set it to 6.
+CROP_LIMIT = 9  # upper bound for per-request / per-task max_crops
+# Per-task (min_crops, max_crops) defaults, overridable per request; unlisted tasks use MIN_CROPS / MAX_CROPS
+# on the vLLM path and INFER_CROP_BUDGET in the handler.
+# e.g. {"simple_ocr": (1, 2)} for receipts, {"doc_to_markdown": (2, 9)} for dense A3 scans
+TASK_CROP_BUDGETS = {}
+INFER_CROP_BUDGET = (2, 9)  # handler default: the range the HF model's infer() tiles with (its dynamic_preprocess defaults)
 MAX_CONCURRENCY = 100  # If you have limited GPU memory, lower the concurrency count.
 NUM_WORKERS = 64  # image pre-process (resize/padding) workers 
+PREPROCESS_MODE = 'thread'  # 'thread' (GIL-releasing PIL/torch ops) or 'process' (spawned workers, shared-memory tensors)
+PREPROCESS_QUEUE_DEPTH = 128  # images queued or in preprocessing before submitters block
 PRINT_NUM_VIS_TOKENS = False
 SKIP_REPEAT = True
+UINT8_PIXEL_TRANSPORT = False  # ship pixel_values / images_crop as uint8, normalize on the model's device
+
+# Micro-batching: concurrent jobs with the same SIZE_CONFIGS entry share one generate call
+BATCH_MAX_SIZE = 8  # max jobs per batched generate call
+BATCH_MAX_WAIT_MS = 20  # how long the first job of a batch waits for others to join (a lone job on an idle engine runs at once)
+RUNPOD_CONCURRENCY = 16  # jobs a single Runpod worker accepts at once
+RUNPOD_STREAMING = False  # generator handler: yields text chunks, then the final response
+RUNPOD_STREAM_MIN_CHARS = 200  # text buffered before a chunk is yielded (fewer, larger stream messages)
+
+# Bulk requests (/process_batch, Runpod {"items": [...]}): items are fetched concurrently and meet in the batcher
+MAX_BATCH_ITEMS = 64  # items accepted in one bulk request
+BATCH_ITEM_WORKERS = 16  # items of Runpod bulk jobs processed at once
+
+# FastAPI serving: blocking work runs in these pools, never on the event loop
+FETCH_WORKERS = 16  # threads for URL download / base64 + image decode
+INFERENCE_WORKERS = 16  # threads for preprocessing + waiting on the batcher
+ADMISSION_QUEUE_DEPTH = 64  # requests admitted at once; beyond this the server answers 503
+RETRY_AFTER_SECONDS = 2  # Retry-After hint sent with the 503
+
+# URL fetcher: pooled keep-alive client, aborts as soon as MAX_FILE_SIZE_MB is exceeded
+FETCH_TIMEOUT_SECONDS = 10  # connect / per-read timeout
+FETCH_POOL_SIZE = 100  # total keep-alive connections
+FETCH_PER_HOST_LIMIT = 8  # concurrent connections to one host
+FETCH_DNS_CACHE_TTL = 300  # seconds a resolved host is reused
+FETCH_DECODE_WORKERS = 8  # threads decoding images while they download
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# Result cache: identical (image bytes, prompt, size config, output options) return the stored response
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MEMORY_ITEMS = 512  # entries kept in the in-memory LRU
+RESULT_CACHE_DIR = '/tmp/deepseek-ocr-result-cache'  # None disables the disk tier
+RESULT_CACHE_DISK_MB = 1024  # disk tier size before LRU eviction
+RESULT_CACHE_TTL_SECONDS = 24 * 3600
+
+# Vision-embedding cache: the same image under the same resolution mode skips SAM + CLIP + projector
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_MB = 256  # device memory held by cached image features before LRU eviction
+
+# Tile dedupe (vLLM path): crop tiles are content-hashed during preprocessing
+TILE_DEDUPE = True  # identical tiles in one encoder batch go through SAM + CLIP once
+BLANK_TILE_CACHE = False  # uniform tiles reuse a cached per-colour embedding instead of being encoded
+
+# SAM global-attention blocks: the relative-position bias is built this many query rows at a time
+SAM_ATTN_CHUNK_TOKENS = 0  # 0 = dense (heads, HW, HW) bias unless it exceeds VISION_ACTIVATION_BUDGET_MB; chunking trades speed for memory
+# Vision encoder forwards are split into chunks of views whose estimated peak activations fit this budget
+VISION_ACTIVATION_BUDGET_MB = 4096  # 0 = no limit; about 202 MB per 640 px tile, 1221 per 1024 px view (bf16, dense bias)
 
 # Model paths
 # For RunPod: /runpod-volume (persistent network volume) is used for model caching
@@ -70,4 +124,15 @@ SIZE_CONFIGS = {
 }
 
 # File size limit
-MAX_FILE_SIZE_MB = 10
\ No newline at end of file
+MAX_FILE_SIZE_MB = 10
+
+# Image decode: the header is read first, so oversized images are refused before any pixel is decoded
+MAX_IMAGE_PIXELS = 100_000_000  # declared width * height above this is rejected (decompression bombs)
+REDUCED_DECODE = True  # decode JPEGs at the smallest 1/2-1/8 DCT scale that still covers the model_size target;
+# other formats, and trimmed images (the content box is only known after decoding), are decoded in full
+
+# Margin trimming (opt-in, per request "trim_margins"): blank page borders are cropped before tiling
+TRIM_MARGINS = False  # default for requests that do not set it
+TRIM_TOLERANCE = 24  # gray levels a pixel may differ from the margin colour and still count as blank
+TRIM_ANALYSIS_SIZE = 256  # long side of the downscaled copy the content box is found on
+TRIM_PADDING = 16  # pixels kept around the content
@@ -7,6 +7,8 @@ import torch
 from torch.nn import functional as F
 from torch import nn
 from flash_attn import flash_attn_qkvpacked_func, flash_attn_func
+
+from .pos_cache import PosTableCache
 # from optimus import flash_attn_func
 # from megatron.core import tensor_parallel
 # from megatron.core import parallel_state as mpu
@@ -127,6 +129,8 @@ class CLIPVisionEmbeddings(nn.Module):
         self.register_buffer(
             "position_ids", torch.arange(self.num_positions).expand((1, -1))
         )
+        # position table resized per token count (e.g. 101 for 640 tiles), built once per size
+        self.pos_tables = PosTableCache()
 
     def forward(self, pixel_values, patch_embeds):
         batch_size = pixel_values.shape[0]
@@ -151,7 +155,12 @@ class CLIPVisionEmbeddings(nn.Module):
         embeddings = torch.cat([class_embeds, patch_embeds], dim=1)
 
         # x = torch.cat([cls_token, x], dim=1)
-        embeddings = embeddings + get_abs_pos(self.position_embedding(self.position_ids), embeddings.size(1))
+        tgt_size = embeddings.size(1)
+        embeddings = embeddings + self.pos_tables.get(
+            self.position_embedding.weight,
+            tgt_size,
+            lambda: get_abs_pos(self.position_embedding(self.position_ids), tgt_size),
+        )
         # embeddings = embeddings + self.position_embedding(self.position_ids)
         return embeddings
 
@@ -0,0 +1,44 @@
+"""
+Per-resolution cache of derived positional tables for the vision encoders
+The SAM absolute / relative position tables and the CLIP position table are
+trained at one size and resized (bicubic / linear interpolation, index
+gathers) to every other input size. The result depends only on the trained
+table and the target size, so it is built once per size and reused.
+"""
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+import torch
+
+POS_TABLE_CACHE_ITEMS = 8  # derived tables kept per source table (sizes x dtypes x devices)
+
+
+class PosTableCache:
+    """
+    LRU of tables derived from one trained parameter
+
+    Entries are keyed by the caller's ``size`` key plus the source's storage,
+    in-place version counter, dtype and device, so loading weights, casting
+    or moving the module never serves a stale table. While autograd is
+    recording for the source (training), tables are rebuilt every call so
+    gradients still reach the parameter.
+    """
+
+    def __init__(self, max_items: int = POS_TABLE_CACHE_ITEMS):
+        self.max_items = max_items
+        self._tables: "OrderedDict[tuple, torch.Tensor]" = OrderedDict()
+
+    def get(self, source: torch.Tensor, size: Hashable, build: Callable[[], torch.Tensor]) -> torch.Tensor:
+        """``build()``, cached for ``size`` while ``source`` is unchanged"""
+        if source.requires_grad and torch.is_grad_enabled():
+            return build()
+        key = (size, source.data_ptr(), source._version, source.dtype, source.device)
+        table = self._tables.get(key)
+        if table is None:
+            table = build()
+            self._tables[key] = table
+            while len(self._tables) > self.max_items:
+                self._tables.popitem(last=False)
+        else:
+            self._tables.move_to_end(key)
+        return table
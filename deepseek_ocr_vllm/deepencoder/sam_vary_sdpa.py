@@ -11,6 +11,9 @@ import torch.nn.functional as F
 from typing import Optional, Tuple, Type
 from functools import partial
 from flash_attn import flash_attn_qkvpacked_func
+
+from ..config import SAM_ATTN_CHUNK_TOKENS, VISION_ACTIVATION_BUDGET_MB
+from .pos_cache import PosTableCache
 # from .common import LayerNorm2d, MLPBlock
 
 # from mmgpt.model.vision_encoder.flash_4 import _attention_rel_h_rel_w
@@ -128,6 +131,8 @@ class ImageEncoderViT(nn.Module):
             self.pos_embed = nn.Parameter(
                 torch.zeros(1, img_size // patch_size, img_size // patch_size, embed_dim)
             )
+        # pos_embed resized per input size (e.g. 40x40 for 640 tiles), built once per size
+        self.pos_embed_tables = PosTableCache()
 
         self.blocks = nn.ModuleList()
         for i in range(depth):
@@ -170,7 +175,10 @@ class ImageEncoderViT(nn.Module):
         x = self.patch_embed(x)
         if self.pos_embed is not None:
             # x = x + self.pos_embed
-            x = x + get_abs_pos(self.pos_embed, x.size(1))
+            tgt_size = x.size(1)
+            x = x + self.pos_embed_tables.get(
+                self.pos_embed, tgt_size, lambda: get_abs_pos(self.pos_embed, tgt_size)
+            )
 
         for blk in self.blocks:
             x = blk(x)
@@ -287,6 +295,11 @@ class Attention(nn.Module):
             # initialize relative positional embeddings
             self.rel_pos_h = nn.Parameter(torch.zeros(2 * input_size[0] - 1, head_dim))
             self.rel_pos_w = nn.Parameter(torch.zeros(2 * input_size[1] - 1, head_dim))
+            # Rh / Rw per (q_size, k_size), built once per input size
+            self.rel_pos_tables = PosTableCache()
+        # query rows per SDPA call when adding the rel-pos bias (see rel_pos_attention);
+        # 0 = dense, unless the bias would not fit the budget (see bias_chunk_tokens)
+        self.attn_chunk_tokens = SAM_ATTN_CHUNK_TOKENS
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         B, H, W, _ = x.shape
@@ -297,7 +310,9 @@ class Attention(nn.Module):
 
         rel_h, rel_w = None, None
         if self.use_rel_pos:
-            rel_h, rel_w = add_decomposed_rel_pos(q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W))
+            rel_h, rel_w = add_decomposed_rel_pos(
+                q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W), self.rel_pos_tables
+            )
 
         q = q.view(B, self.num_heads, H * W, -1)
         k = k.view(B, self.num_heads, H * W, -1)
@@ -306,8 +321,8 @@ class Attention(nn.Module):
         if self.use_rel_pos:
             rel_h = rel_h.view(B, self.num_heads, rel_h.size(1), rel_h.size(2), rel_h.size(3))
             rel_w = rel_w.view(B, self.num_heads, rel_w.size(1), rel_w.size(2), rel_w.size(3))
-            attn_bias = (rel_h + rel_w).view(B, self.num_heads, rel_h.size(2), rel_h.size(3) * rel_w.size(4))
-            x = torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=attn_bias)
+            chunk_tokens = self.attn_chunk_tokens or bias_chunk_tokens(B * self.num_heads, H * W, q.element_size())
+            x = rel_pos_attention(q, k, v, rel_h, rel_w, chunk_tokens)
             # x = _attention_rel_h_rel_w(q, k, v, rel_h, rel_w)
         else:
             x = torch.nn.functional.scaled_dot_product_attention(q, k, v)
@@ -323,6 +338,67 @@ class Attention(nn.Module):
         return x
 
 
+def bias_chunk_tokens(
+    batch_heads: int,
+    tokens: int,
+    dtype_bytes: int,
+    budget_bytes: int = VISION_ACTIVATION_BUDGET_MB * 2**20,
+) -> int:
+    """
+    Query rows per SDPA call for ``rel_pos_attention`` when no chunk size is configured.
+    Args:
+        batch_heads (int): B * nHead.
+        tokens (int): HW.
+        dtype_bytes (int): bytes per bias value.
+        budget_bytes (int): memory the bias and its float32 softmax scores may take; 0 = no limit.
+
+    Returns:
+        0 (one dense bias, the fastest path) if the whole bias fits ``budget_bytes``,
+        otherwise the most rows whose bias does.
+    """
+    row_bytes = batch_heads * tokens * (dtype_bytes + 4)
+    if budget_bytes <= 0 or row_bytes * tokens <= budget_bytes:
+        return 0
+    return max(1, budget_bytes // row_bytes)
+
+
+def rel_pos_attention(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    rel_h: torch.Tensor,
+    rel_w: torch.Tensor,
+    chunk_tokens: int = 0,
+) -> torch.Tensor:
+    """
+    SDPA with the decomposed relative-position bias ``rel_h + rel_w``.
+    Args:
+        q, k, v (Tensor): [B, nHead, HW, C].
+        rel_h (Tensor): [B, nHead, HW, k_h, 1] height term of the bias.
+        rel_w (Tensor): [B, nHead, HW, 1, k_w] width term of the bias.
+        chunk_tokens (int): query rows per SDPA call; 0 or >= HW builds the whole bias at once.
+
+    Returns:
+        x: attention output with [B, nHead, HW, C]. Every query row only needs its own
+        bias row, so chunking gives the same result while holding a
+        [B, nHead, chunk_tokens, HW] bias instead of [B, nHead, HW, HW].
+    """
+    B, num_heads, L, k_h, _ = rel_h.shape
+    k_w = rel_w.size(-1)
+    if not chunk_tokens or L <= chunk_tokens:
+        attn_bias = (rel_h + rel_w).view(B, num_heads, L, k_h * k_w)
+        return torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=attn_bias)
+
+    x = q.new_empty(B, num_heads, L, v.size(-1))
+    for start in range(0, L, chunk_tokens):
+        end = min(start + chunk_tokens, L)
+        attn_bias = (rel_h[:, :, start:end] + rel_w[:, :, start:end]).view(B, num_heads, end - start, k_h * k_w)
+        x[:, :, start:end] = torch.nn.functional.scaled_dot_product_attention(
+            q[:, :, start:end], k, v, attn_mask=attn_bias
+        )
+    return x
+
+
 def window_partition(x: torch.Tensor, window_size: int) -> Tuple[torch.Tensor, Tuple[int, int]]:
     """
     Partition into non-overlapping windows with padding if needed.
@@ -413,6 +489,7 @@ def add_decomposed_rel_pos(
     rel_pos_w: torch.Tensor,
     q_size: Tuple[int, int],
     k_size: Tuple[int, int],
+    rel_pos_tables: Optional[PosTableCache] = None,
 ) -> torch.Tensor:
     """
     Calculate decomposed Relative Positional Embeddings from :paper:`mvitv2`.
@@ -423,14 +500,19 @@ def add_decomposed_rel_pos(
         rel_pos_w (Tensor): relative position embeddings (Lw, C) for width axis.
         q_size (Tuple): spatial sequence size of query q with (q_h, q_w).
         k_size (Tuple): spatial sequence size of key k with (k_h, k_w).
+        rel_pos_tables (PosTableCache or None): reuses Rh / Rw built for the same sizes.
 
     Returns:
         attn (Tensor): attention map with added relative positional embeddings.
     """
     q_h, q_w = q_size
     k_h, k_w = k_size
-    Rh = get_rel_pos(q_h, k_h, rel_pos_h)
-    Rw = get_rel_pos(q_w, k_w, rel_pos_w)
+    if rel_pos_tables is None:
+        Rh = get_rel_pos(q_h, k_h, rel_pos_h)
+        Rw = get_rel_pos(q_w, k_w, rel_pos_w)
+    else:
+        Rh = rel_pos_tables.get(rel_pos_h, (q_h, k_h), lambda: get_rel_pos(q_h, k_h, rel_pos_h))
+        Rw = rel_pos_tables.get(rel_pos_w, (q_w, k_w), lambda: get_rel_pos(q_w, k_w, rel_pos_w))
 
     B, _, dim = q.shape
     r_q = q.reshape(B, q_h, q_w, dim)
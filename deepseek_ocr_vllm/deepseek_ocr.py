@@ -1,6 +1,5 @@
 """Inference-only Deepseek-OCR model compatible with HuggingFace weights."""
 
-import math
 from collections.abc import Iterable, Mapping, Sequence
 from typing import List, Literal, Optional, Set, Tuple, TypedDict, Union
 
@@ -41,7 +40,16 @@ from vllm.transformers_utils.configs.deepseek_vl2 import (
     VisionEncoderConfig,
 )
 
-from .process.image_process import DeepseekOCRProcessor, count_tiles
+from .process.image_process import (
+    MAX_CROPS_KWARG,
+    MIN_CROPS_KWARG,
+    SIZE_MODE_KWARG,
+    crop_budget,
+    DeepseekOCRProcessor,
+    image_token_layout,
+    normalize_pixels,
+    size_mode_config,
+)
 from vllm.transformers_utils.tokenizer import cached_tokenizer_from_config
 
 from vllm.model_executor.models.interfaces import (
@@ -63,12 +71,46 @@ from .deepencoder.clip_sdpa import build_clip_l
 from .deepencoder.build_linear import MlpProjector
 from addict import Dict
 
-from .config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, PRINT_NUM_VIS_TOKENS, PROMPT
+from .config import (
+    BASE_SIZE,
+    BLANK_TILE_CACHE,
+    CROP_LIMIT,
+    PRINT_NUM_VIS_TOKENS,
+    PROMPT,
+    SIZE_CONFIGS,
+    TILE_DEDUPE,
+)
+from .embedding_cache import IMAGE_CACHE_KEY_KWARG, get_embedding_cache
+from .tile_dedupe import BlankTileCache, encode_tiles
+from .vision_batch import encode_grouped, encode_in_chunks, format_image_features, read_image_metadata
 
 # The image token id may be various
 _IMAGE_TOKEN = "<image>"
 
 
+def _split_request_kwargs(mm_kwargs: Mapping[str, object]):
+    # The embedding cache key, the size mode and the crop budget ride along
+    # in mm_processor_kwargs but are not DeepseekOCRProcessor arguments
+    mm_kwargs = dict(mm_kwargs)
+    image_cache_key = mm_kwargs.pop(IMAGE_CACHE_KEY_KWARG, None)
+    size_mode = mm_kwargs.pop(SIZE_MODE_KWARG, None)
+    budget = crop_budget(mm_kwargs.pop(MIN_CROPS_KWARG, None), mm_kwargs.pop(MAX_CROPS_KWARG, None))
+    return image_cache_key, size_mode, budget, mm_kwargs
+
+
+def _flatten_embeds(image_embeds) -> List[torch.Tensor]:
+    # [n_image, n_tokens, n_embed] per request, a tensor or nested lists once batched
+    if isinstance(image_embeds, torch.Tensor):
+        return list(image_embeds.reshape(-1, *image_embeds.shape[-2:]))
+    return [features for item in image_embeds for features in _flatten_embeds(item)]
+
+
+def _flatten_flags(image_from_embeds) -> List[int]:
+    if isinstance(image_from_embeds, torch.Tensor):
+        return image_from_embeds.flatten().tolist()
+    return [flag for item in image_from_embeds for flag in _flatten_flags(item)]
+
+
 class DeepseekOCRProcessingInfo(BaseProcessingInfo):
     def get_hf_config(self):
         return self.ctx.get_hf_config(DeepseekVLV2Config)
@@ -80,44 +122,51 @@ class DeepseekOCRProcessingInfo(BaseProcessingInfo):
         return {"image": None}
 
     def get_num_image_tokens(
-        self, *, image_width: int, image_height: int, cropping: bool = True
+        self,
+        *,
+        image_width: int,
+        image_height: int,
+        cropping: bool = True,
+        size_mode: Optional[str] = None,
+        min_crops: Optional[int] = None,
+        max_crops: Optional[int] = None,
     ) -> int:
-        hf_processor = self.get_hf_processor()
-
-        image_size = IMAGE_SIZE
-        base_size = BASE_SIZE
-        patch_size = 16
-        downsample_ratio = 4
-
-        if CROP_MODE:
-            if image_width <= 640 and image_height <= 640:
-                crop_ratio = [1, 1]
-            else:
-                # find the closest aspect ratio to the target
-                crop_ratio = count_tiles(
-                    image_width, image_height, image_size=IMAGE_SIZE
+        # Memoized per image size and shared with DeepseekOCRProcessor.tokenize_with_images;
+        # cropping=False counts the global view only, even in a crop mode
+        base_size, image_size, crop_mode = size_mode_config(size_mode)
+        min_crops, max_crops = crop_budget(min_crops, max_crops)
+        _, num_image_tokens = image_token_layout(
+            image_width, image_height, base_size, image_size, crop_mode and cropping, min_crops, max_crops
+        )
+        return num_image_tokens
+
+    def get_request_with_most_features(self) -> Tuple[ImageSize, Optional[str]]:
+        """
+        (image size, size_mode) of the image with the most image tokens a request
+        can ask for: any SIZE_CONFIGS mode, with max_crops up to CROP_LIMIT
+        """
+        best = (-1, ImageSize(width=BASE_SIZE, height=BASE_SIZE), None)
+        for size_mode in (None, *SIZE_CONFIGS):
+            base_size, image_size, crop_mode = size_mode_config(size_mode)
+            grids = [(1, 1)]
+            if crop_mode:
+                grids += [
+                    (w, h) for w in range(1, CROP_LIMIT + 1) for h in range(1, CROP_LIMIT + 1) if 1 < w * h <= CROP_LIMIT
+                ]
+            for w, h in grids:
+                # an image exactly w x h tiles big gets that grid; (1, 1) is the global view alone
+                size = ImageSize(width=image_size * w, height=image_size * h)
+                if (w, h) == (1, 1):
+                    size = ImageSize(width=base_size, height=base_size)
+                tokens = self.get_num_image_tokens(
+                    image_width=size.width, image_height=size.height, size_mode=size_mode, max_crops=CROP_LIMIT
                 )
-
-            num_width_tiles, num_height_tiles = crop_ratio
-        else:
-            num_width_tiles = num_height_tiles = 1
-
-        h = w = math.ceil((base_size // patch_size) / downsample_ratio)
-
-        h2 = w2 = math.ceil((image_size // patch_size) / downsample_ratio)
-
-        global_views_tokens = h * (w + 1)
-        if num_width_tiles > 1 or num_height_tiles > 1:
-            local_views_tokens = (num_height_tiles * h2) * (num_width_tiles * w2 + 1)
-        else:
-            local_views_tokens = 0
-
-        return global_views_tokens + local_views_tokens + 1
+                if tokens > best[0]:
+                    best = (tokens, size, size_mode)
+        return best[1], best[2]
 
     def get_image_size_with_most_features(self) -> ImageSize:
-        if IMAGE_SIZE == 1024 and BASE_SIZE == 1280:
-            return ImageSize(width=1024 * 2, height=1024 * 2)
-        return ImageSize(width=640 * 2, height=640 * 2)
+        return self.get_request_with_most_features()[0]
 
 
 class DeepseekOCRDummyInputsBuilder(BaseDummyInputsBuilder[DeepseekOCRProcessingInfo]):
@@ -136,7 +185,9 @@ class DeepseekOCRDummyInputsBuilder(BaseDummyInputsBuilder[DeepseekOCRProcessing
     ) -> MultiModalDataDict:
         num_images = mm_counts.get("image", 0)
 
-        max_image_size = self.info.get_image_size_with_most_features()
+        # Profile the largest request per-request options allow, not just the engine default
+        max_image_size, size_mode = self.info.get_request_with_most_features()
+        base_size, image_size, crop_mode = size_mode_config(size_mode)
 
         if "<image>" in PROMPT:
             return {
@@ -149,12 +200,26 @@ class DeepseekOCRDummyInputsBuilder(BaseDummyInputsBuilder[DeepseekOCRProcessing
                     ),
                     bos=True,
                     eos=True,
-                    cropping=CROP_MODE,
+                    cropping=crop_mode,
+                    base_size=base_size,
+                    image_size=image_size,
+                    max_crops=CROP_LIMIT,
                 )
             }
         else:
             return {"image": []}
 
+    def get_dummy_processor_inputs(self, seq_len: int, mm_counts: Mapping[str, int]):
+        inputs = super().get_dummy_processor_inputs(seq_len, mm_counts)
+        # The prompt replacement must count the same mode and budget the dummy images were tiled with
+        _, size_mode = self.info.get_request_with_most_features()
+        inputs.hf_processor_mm_kwargs = {
+            **inputs.hf_processor_mm_kwargs,
+            **({SIZE_MODE_KWARG: size_mode} if size_mode is not None else {}),
+            MAX_CROPS_KWARG: CROP_LIMIT,
+        }
+        return inputs
+
 
 class DeepseekOCRMultiModalProcessor(
     BaseMultiModalProcessor[DeepseekOCRProcessingInfo]
@@ -165,18 +230,66 @@ class DeepseekOCRMultiModalProcessor(
         mm_data: Mapping[str, object],
         mm_kwargs: Mapping[str, object],
     ) -> BatchFeature:
+        image_cache_key, size_mode, (min_crops, max_crops), mm_kwargs = _split_request_kwargs(
+            mm_kwargs
+        )
+
         if mm_data:
             processed_outputs = self.info.ctx.call_hf_processor(
                 self.info.get_hf_processor(**mm_kwargs),
                 dict(prompt=prompt, **mm_data),
                 mm_kwargs,
             )
+            # Images arrive already tokenized; a mode mismatch would make the
+            # prompt replacement disagree with the vision tokens
+            base_size, image_size, crop_mode = size_mode_config(size_mode)
+            view_sizes = (processed_outputs["pixel_values"].shape[-1], processed_outputs["images_crop"].shape[-1])
+            if view_sizes != (base_size, image_size):
+                raise ValueError(
+                    f"Image was preprocessed with {view_sizes[0]}px global / {view_sizes[1]}px tile views "
+                    f"but size_mode {size_mode!r} expects {base_size}px / {image_size}px; pass the same "
+                    "mode's base_size / image_size / crop_mode to tokenize_with_images"
+                )
+            num_tiles = processed_outputs["images_spatial_crop"].prod(dim=-1)
+            if ((num_tiles > 1) & ((num_tiles < min_crops) | (num_tiles > max_crops))).any():
+                raise ValueError(
+                    f"Image was tiled into {num_tiles.tolist()} crops, outside the request's "
+                    f"crop budget {min_crops}-{max_crops}; pass the same min_crops / max_crops "
+                    "to tokenize_with_images"
+                )
+            # crop_mode only shows in the tile grids: they must be the ones this mode picks
+            # for the image sizes the processor recorded
+            image_shapes = mm_data["images"][0][-1]
+            grids = processed_outputs["images_spatial_crop"].reshape(-1, 2).tolist()
+            expected = [
+                list(image_token_layout(width, height, base_size, image_size, crop_mode, min_crops, max_crops)[0])
+                for width, height in image_shapes
+            ]
+            if grids != expected:
+                raise ValueError(
+                    f"Image was tiled as {grids} but size_mode {size_mode!r} (crop_mode={crop_mode}) "
+                    f"tiles it as {expected}; pass the same mode's base_size / image_size / crop_mode "
+                    "to tokenize_with_images"
+                )
+            # Always present (0 = no key) so the field stays aligned across a batch
+            processed_outputs[IMAGE_CACHE_KEY_KWARG] = torch.tensor(
+                [image_cache_key or 0], dtype=torch.long
+            )
+            processed_outputs["image_from_embeds"] = torch.tensor([0], dtype=torch.long)
 
         else:
             tokenizer = self.info.get_tokenizer()
             processed_outputs = tokenizer(
                 prompt, add_special_tokens=True, return_tensors="pt"
             )
+            if image_cache_key is not None:
+                # Cached features sent as image embeddings (build_vllm_request): the
+                # per-image metadata fields are still emitted, so a batch mixing
+                # pixel and embedding requests keeps its images in prompt order
+                processed_outputs[IMAGE_CACHE_KEY_KWARG] = torch.tensor([image_cache_key], dtype=torch.long)
+                processed_outputs["image_from_embeds"] = torch.tensor([1], dtype=torch.long)
+                processed_outputs["images_spatial_crop"] = torch.ones((1, 2), dtype=torch.long)
+                processed_outputs["images_tile_key"] = torch.zeros((1, 1), dtype=torch.long)
 
         return processed_outputs
 
@@ -189,6 +302,10 @@ class DeepseekOCRMultiModalProcessor(
             pixel_values=MultiModalFieldConfig.batched("image"),
             images_spatial_crop=MultiModalFieldConfig.batched("image"),
             images_crop=MultiModalFieldConfig.batched("image"),
+            image_cache_key=MultiModalFieldConfig.batched("image"),
+            images_tile_key=MultiModalFieldConfig.batched("image"),
+            image_embeds=MultiModalFieldConfig.batched("image"),
+            image_from_embeds=MultiModalFieldConfig.batched("image"),
         )
 
     def _get_prompt_updates(
@@ -197,6 +314,9 @@ class DeepseekOCRMultiModalProcessor(
         hf_processor_mm_kwargs: Mapping[str, object],
         out_mm_kwargs: MultiModalKwargs,
     ) -> Sequence[PromptUpdate]:
+        _, size_mode, (min_crops, max_crops), hf_processor_mm_kwargs = _split_request_kwargs(
+            hf_processor_mm_kwargs
+        )
         hf_processor = self.info.get_hf_processor(**hf_processor_mm_kwargs)
 
         image_token_id = hf_processor.image_token_id
@@ -216,7 +336,9 @@ class DeepseekOCRMultiModalProcessor(
                 num_image_tokens = self.info.get_num_image_tokens(
                     image_width=width,
                     image_height=height,
-                    cropping=CROP_MODE,
+                    size_mode=size_mode,
+                    min_crops=min_crops,
+                    max_crops=max_crops,
                 )
             return [image_token_id] * num_image_tokens
 
@@ -237,8 +359,12 @@ class DeepseekOCRMultiModalProcessor(
         # The processor logic is different for len(images) <= 2 vs > 2
         # Since the processing cache assumes that the processor output is
         # invariant of how many images are passed per prompt, we only
-        # perform caching for the most common case
-        if mm_data_items.get_count("image", strict=False) > 2:
+        # perform caching for the most common case.
+        # Image embeddings (EMBEDDING_CACHE hits) skip it too: they are
+        # already cached features, and hashing them would cost a device read
+        if mm_data_items.get_count("image", strict=False) > 2 or isinstance(
+            mm_data_items.get("image"), ImageEmbeddingItems
+        ):
             # This code path corresponds to the cache being disabled
             return self._apply_hf_processor_main(
                 prompt=prompt,
@@ -291,6 +417,8 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         self.projector = MlpProjector(
             Dict(projector_type="linear", input_dim=2048, n_embed=n_embed)
         )
+        # Uniform-tile features across batches (BLANK_TILE_CACHE)
+        self.blank_tile_cache = BlankTileCache()
         self.tile_tag = config.tile_tag
         self.global_view_pos = config.global_view_pos
 
@@ -327,9 +455,16 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         pixel_values = kwargs.pop("pixel_values", None)
         images_spatial_crop = kwargs.pop("images_spatial_crop", None)
         images_crop = kwargs.pop("images_crop", None)
+        image_cache_key = kwargs.pop(IMAGE_CACHE_KEY_KWARG, None)
+        images_tile_key = kwargs.pop("images_tile_key", None)
+        image_embeds = kwargs.pop("image_embeds", None)
+        image_from_embeds = kwargs.pop("image_from_embeds", None)
 
-        if pixel_values is None or torch.sum(pixel_values).item() == 0:
+        if pixel_values is None and image_embeds is None:
             return None
+        # pixel_values is a per-request list when the batch mixes size modes.
+        # The no-image placeholder (zero tile grid) is recognised from the
+        # metadata in _process_image_input, not by reducing the pixels here
 
         if pixel_values is not None:
             if not isinstance(pixel_values, (torch.Tensor, list)):
@@ -348,157 +483,162 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
                     f"Incorrect type of image crop. Got type: {type(images_crop)}"
                 )
 
-            return [pixel_values, images_crop, images_spatial_crop]
-
-        raise AssertionError("This line should be unreachable.")
+            return [
+                pixel_values,
+                images_crop,
+                images_spatial_crop,
+                image_cache_key,
+                images_tile_key,
+                image_embeds,
+                image_from_embeds,
+            ]
+
+        # Only cached features sent as image embeddings in this step
+        return [None, None, images_spatial_crop, image_cache_key, images_tile_key, image_embeds, image_from_embeds]
+
+    def _encode_views(self, views: torch.Tensor) -> torch.Tensor:
+        # views: [n, 3, h, w] -> projected SAM + CLIP features [n, hw, n_embed]
+        sam_features = self.sam_model(views)
+        clip_features = self.vision_model(views, sam_features)
+        features = torch.cat(
+            (
+                clip_features[:, 1:],
+                sam_features.flatten(2).permute(0, 2, 1),
+            ),
+            dim=-1,
+        )
+        return self.projector(features)
 
     def _pixel_values_to_embedding(
         self,
         pixel_values: torch.Tensor,
         images_crop: torch.Tensor,
-        images_spatial_crop: torch.Tensor,
+        crop_shapes: List[Tuple[int, int]],
+        cache_keys: List[int],
+        tile_keys: List[Optional[List[int]]],
     ) -> NestedTensors:
         # Pixel_values (global view): [n_image, batch_size, 3, height, width]
-        # images_spatial_crop: [n_image, batch_size, [num_tiles_w, num_tiles_h]]
         # images_crop (local view): [n_image, batch_size, num_pathes, 3, h, w]
+        # crop_shapes / cache_keys / tile_keys: host-side per-image metadata
+        # (read_image_metadata), so nothing below waits on the device
         # split the pixel and image_crop, all batch_size = 1
+        # pixel_values / images_crop are per-image lists when the batch mixes
+        # size modes; views are encoded in one forward per shape (encode_grouped)
 
-        images_in_this_batch = []
+        n_image = len(crop_shapes)
+        # Features of keyed tiles already encoded in this batch (TILE_DEDUPE)
+        batch_tile_features = {} if TILE_DEDUPE else None
+        blank_tile_cache = self.blank_tile_cache if BLANK_TILE_CACHE else None
+        embedding_cache = get_embedding_cache()
 
-        with torch.no_grad():
-            for jdx in range(images_spatial_crop.size(0)):
-                patches = images_crop[jdx][0].to(torch.bfloat16)  # batch_size = 1
-                image_ori = pixel_values[jdx]
-                crop_shape = images_spatial_crop[jdx][0]
-
-                if torch.sum(patches).item() != 0:  # if all values = 0, no crop
-                    local_features_1 = self.sam_model(patches)
-                    local_features_2 = self.vision_model(patches, local_features_1)
-
-                    local_features = torch.cat(
-                        (
-                            local_features_2[:, 1:],
-                            local_features_1.flatten(2).permute(0, 2, 1),
-                        ),
-                        dim=-1,
-                    )
-                    local_features = self.projector(local_features)
-
-                    global_features_1 = self.sam_model(image_ori)
-                    global_features_2 = self.vision_model(image_ori, global_features_1)
-                    global_features = torch.cat(
-                        (
-                            global_features_2[:, 1:],
-                            global_features_1.flatten(2).permute(0, 2, 1),
-                        ),
-                        dim=-1,
-                    )
-                    global_features = self.projector(global_features)
-
-                    if PRINT_NUM_VIS_TOKENS:
-                        print("=====================")
-                        print("BASE: ", global_features.shape)
-                        print("PATCHES: ", local_features.shape)
-                        print("=====================")
-
-                    _, hw, n_dim = global_features.shape
-                    h = w = int(hw**0.5)
-
-                    _2, hw2, n_dim2 = local_features.shape
-                    h2 = w2 = int(hw2**0.5)
-
-                    width_crop_num, height_crop_num = crop_shape[0], crop_shape[1]
-
-                    global_features = global_features.view(h, w, n_dim)
-
-                    global_features = torch.cat(
-                        [
-                            global_features,
-                            self.image_newline[None, None, :].expand(h, 1, n_dim),
-                        ],
-                        dim=1,
-                    )
-
-                    global_features = global_features.view(-1, n_dim)
-
-                    local_features = (
-                        local_features.view(
-                            height_crop_num, width_crop_num, h2, w2, n_dim2
-                        )
-                        .permute(0, 2, 1, 3, 4)
-                        .reshape(height_crop_num * h2, width_crop_num * w2, n_dim2)
-                    )
-                    local_features = torch.cat(
-                        [
-                            local_features,
-                            self.image_newline[None, None, :].expand(
-                                height_crop_num * h2, 1, n_dim2
-                            ),
-                        ],
-                        dim=1,
-                    )
-                    local_features = local_features.view(-1, n_dim2)
-
-                    global_local_features = torch.cat(
-                        [local_features, global_features, self.view_seperator[None, :]],
-                        dim=0,
-                    )
-
-                else:
-                    global_features_1 = self.sam_model(image_ori)
-                    global_features_2 = self.vision_model(image_ori, global_features_1)
-                    global_features = torch.cat(
-                        (
-                            global_features_2[:, 1:],
-                            global_features_1.flatten(2).permute(0, 2, 1),
-                        ),
-                        dim=-1,
-                    )
-                    global_features = self.projector(global_features)
-
-                    if PRINT_NUM_VIS_TOKENS:
-                        print("=====================")
-                        print("BASE: ", global_features.shape)
-                        print("NO PATCHES")
-                        print("=====================")
+        images_in_this_batch = [None] * n_image
+        # Images to encode, with their global view and (if cropped) tiles
+        to_encode, global_views, encode_crop_shapes = [], [], []
+        tile_views, view_tile_keys = [], []
 
-                    _, hw, n_dim = global_features.shape
-                    h = w = int(hw**0.5)
-
-                    global_features = global_features.view(h, w, n_dim)
+        with torch.no_grad():
+            for jdx in range(n_image):
+                if cache_keys[jdx]:
+                    # build_vllm_request already counted this key's miss
+                    cached = embedding_cache.get(cache_keys[jdx], count_miss=False)
+                    if cached is not None:
+                        images_in_this_batch[jdx] = cached
+                        continue
+
+                # The processor only emits tiles (else an all-zero block) for grids
+                # of more than one tile, so the grid decides without touching pixels
+                crop_shape = crop_shapes[jdx]
+                has_crop = crop_shape[0] > 1 or crop_shape[1] > 1
+
+                to_encode.append(jdx)
+                global_views.append(pixel_values[jdx])
+                encode_crop_shapes.append(crop_shape if has_crop else None)
+                if has_crop:
+                    tile_views.append(images_crop[jdx][0])  # batch_size = 1
+                    view_tile_keys.append(tile_keys[jdx])
+
+            # One SAM + CLIP forward for all tiles of the step, one per global view
+            # size, each split to fit VISION_ACTIVATION_BUDGET_MB; uint8 pixels
+            # (UINT8_PIXEL_TRANSPORT) are normalized here, per chunk, on the model's device
+            def encode(views):
+                return encode_in_chunks(
+                    lambda chunk: self._encode_views(normalize_pixels(chunk, torch.bfloat16)), views
+                )
 
-                    global_features = torch.cat(
-                        [
-                            global_features,
-                            self.image_newline[None, None, :].expand(h, 1, n_dim),
-                        ],
-                        dim=1,
-                    )
+            def encode_batch_tiles(tiles, keys):
+                return encode_tiles(encode, tiles, keys, batch_tile_features, blank_tile_cache)
 
-                    global_features = global_features.view(-1, n_dim)
+            local_features = iter(encode_grouped(encode_batch_tiles, tile_views, view_tile_keys))
+            global_features = encode_grouped(encode, global_views)
 
-                    global_local_features = torch.cat(
-                        [global_features, self.view_seperator[None, :]], dim=0
-                    )
+            for jdx, crop_shape, image_global_features in zip(to_encode, encode_crop_shapes, global_features):
+                image_local_features = next(local_features) if crop_shape is not None else None
 
-                images_in_this_batch.append(global_local_features)
+                if PRINT_NUM_VIS_TOKENS:
+                    print("=====================")
+                    print("BASE: ", image_global_features.shape)
+                    if image_local_features is not None:
+                        print("PATCHES: ", image_local_features.shape)
+                    else:
+                        print("NO PATCHES")
+                    print("=====================")
+
+                global_local_features = format_image_features(
+                    image_global_features,
+                    image_local_features,
+                    crop_shape,
+                    self.image_newline,
+                    self.view_seperator,
+                )
+                if cache_keys[jdx]:
+                    embedding_cache.put(cache_keys[jdx], global_local_features)
+                images_in_this_batch[jdx] = global_local_features
 
         return images_in_this_batch
 
     def _process_image_input(self, image_input) -> torch.Tensor:
-        # image_input: [pixel_values, images_crop, images_spatial_crop]
+        # image_input: [pixel_values, images_crop, images_spatial_crop, image_cache_key,
+        #               images_tile_key, image_embeds, image_from_embeds]
 
-        pixel_values = image_input[0].to(torch.bfloat16)
+        pixel_values = image_input[0]
         images_crop = image_input[1]
-        images_spatial_crop = image_input[2].to(dtype=torch.long)
-
-        vision_features = self._pixel_values_to_embedding(
-            pixel_values=pixel_values,
-            images_crop=images_crop,
-            images_spatial_crop=images_spatial_crop,
+        image_embeds = image_input[5]
+        # The step's only device-to-host read: tile grids, cache keys, tile keys
+        crop_shapes, cache_keys, tile_keys = read_image_metadata(
+            image_input[2],
+            image_input[3],
+            image_input[4] if TILE_DEDUPE or BLANK_TILE_CACHE else None,
         )
+        if not any(width * height for width, height in crop_shapes):
+            # only the no-image placeholder (zero tile grid)
+            return None
+
+        if image_embeds is None:
+            return self._pixel_values_to_embedding(
+                pixel_values=pixel_values,
+                images_crop=images_crop,
+                crop_shapes=crop_shapes,
+                cache_keys=cache_keys,
+                tile_keys=tile_keys,
+            )
 
-        return vision_features
+        # Some images arrived as cached features (ImageEmbeddingItems); pixels
+        # and embeddings are batched separately, the flags restore their order
+        from_embeds = _flatten_flags(image_input[6])
+        encoded = [jdx for jdx, flag in enumerate(from_embeds) if not flag]
+        pixel_features = iter(
+            self._pixel_values_to_embedding(
+                pixel_values=pixel_values,
+                images_crop=images_crop,
+                crop_shapes=[crop_shapes[jdx] for jdx in encoded],
+                cache_keys=[cache_keys[jdx] for jdx in encoded],
+                tile_keys=[tile_keys[jdx] for jdx in encoded],
+            )
+            if encoded
+            else []
+        )
+        embeds = iter(_flatten_embeds(image_embeds))
+        return [next(embeds) if flag else next(pixel_features) for flag in from_embeds]
 
     def get_language_model(self) -> torch.nn.Module:
         return self.language_model
@@ -0,0 +1,118 @@
+"""
+Vision-embedding cache for DeepSeek OCR
+Reuses the assembled SAM + CLIP + projector features when the same image is
+prompted several times (e.g. doc_to_markdown, then text_localization)
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import torch
+
+from .config import EMBEDDING_CACHE_MB
+
+# mm_processor_kwargs key carrying the cache key from the request to the model
+IMAGE_CACHE_KEY_KWARG = "image_cache_key"
+
+
+def image_view(image) -> Tuple:
+    """
+    What a decoded PIL image shows of its source bytes: (decoded size, content box)
+
+    A reduced-scale decode or ``trim_margins`` changes the pixels the encoder
+    sees without changing the bytes, so both belong in the cache key.
+    """
+    return tuple(image.size), image.info.get("content_box")
+
+
+def embedding_cache_key(
+    image_hash: str,
+    base_size: int,
+    image_size: int,
+    crop_mode: bool,
+    min_crops: int,
+    max_crops: int,
+    view: Optional[Tuple] = None,
+) -> int:
+    """
+    Cache key for one image under one resolution mode and crop budget
+
+    Args:
+        image_hash: Content hash of the image bytes (e.g. ``result_cache.hash_image_bytes``)
+        view: ``image_view`` of the decoded image the encoder sees
+
+    Returns:
+        Non-zero positive int64, so it can travel as a tensor field (0 means "no key")
+    """
+    digest = hashlib.blake2b(
+        f"{image_hash}:{base_size}:{image_size}:{int(crop_mode)}:{min_crops}:{max_crops}:{view}".encode("utf-8"),
+        digest_size=8,
+    ).digest()
+    return (int.from_bytes(digest, "little") & 0x7FFFFFFFFFFFFFFF) or 1
+
+
+class EmbeddingCache:
+    """
+    Byte-bounded LRU of ``global_local_features`` tensors
+
+    Tensors stay on the device they were computed on, so a hit costs no copy.
+    """
+
+    def __init__(self, max_bytes: int = EMBEDDING_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, torch.Tensor]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: int, count_miss: bool = True) -> Optional[torch.Tensor]:
+        """Cached features, or None; ``count_miss=False`` for a re-check of a key that already missed"""
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is None:
+                self.misses += count_miss
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tensor
+
+    def put(self, key: int, tensor: torch.Tensor):
+        nbytes = tensor.numel() * tensor.element_size()
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.numel() * old.element_size()
+            while self._entries and self._bytes + nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.numel() * evicted.element_size()
+                self.evictions += 1
+            self._entries[key] = tensor
+            self._bytes += nbytes
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "items": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache shared by the request builder and the model"""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -0,0 +1,298 @@
+"""
+Streaming, size-capped image fetcher for DeepSeek OCR
+Downloads over a pooled keep-alive client and decodes while bytes are still arriving
+"""
+import asyncio
+import io
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import aiohttp
+from PIL import Image
+
+from .config import (
+    FETCH_CHUNK_SIZE,
+    FETCH_DECODE_WORKERS,
+    FETCH_DNS_CACHE_TTL,
+    FETCH_PER_HOST_LIMIT,
+    FETCH_POOL_SIZE,
+    FETCH_TIMEOUT_SECONDS,
+    MAX_FILE_SIZE_MB,
+    MAX_IMAGE_PIXELS,
+    REDUCED_DECODE,
+)
+from .process.image_process import crop_budget, image_token_layout
+from .result_cache import image_hasher
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an input image exceeds MAX_FILE_SIZE_MB or MAX_IMAGE_PIXELS"""
+
+
+class _ChunkStream(io.RawIOBase):
+    """
+    Seekable, blocking file object over a body that is still downloading
+
+    PIL decodes from it on a worker thread: reads past the received data block
+    until the next chunk arrives, so decoding runs alongside the download.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+        self._pos = 0
+        self._eof = False
+        self._aborted = False
+        self._cond = threading.Condition()
+
+    def feed(self, chunk: bytes):
+        with self._cond:
+            self._buffer += chunk
+            self._cond.notify_all()
+
+    def finish(self, aborted: bool = False):
+        with self._cond:
+            self._eof = True
+            self._aborted = aborted
+            self._cond.notify_all()
+
+    def getvalue(self) -> bytes:
+        with self._cond:
+            return bytes(self._buffer)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        with self._cond:
+            if whence == io.SEEK_SET:
+                self._pos = offset
+            elif whence == io.SEEK_CUR:
+                self._pos += offset
+            else:
+                while not self._eof:
+                    self._cond.wait()
+                self._pos = len(self._buffer) + offset
+            return self._pos
+
+    def readinto(self, b):
+        # Full reads like io.BufferedReader: PIL's parsers treat a short read as a truncated file
+        with self._cond:
+            while self._pos + len(b) > len(self._buffer) and not self._eof:
+                self._cond.wait()
+            if self._aborted:
+                raise OSError("download aborted")
+            data = self._buffer[self._pos:self._pos + len(b)]
+            b[:len(data)] = data
+            self._pos += len(data)
+            return len(data)
+
+
+def decode_scale(width: int, height: int, size_config: Dict) -> int:
+    """
+    Largest factor (8, 4 or 2) an image can be shrunk by at decode time for ``size_config``
+
+    The reduced image must still cover everything preprocessing resamples it
+    to (the padded global view, the Tiny / Small square resize, the tile
+    canvas) and must select the same tile grid, so the prompt's image-token
+    count does not change. Returns 1 when only a full decode qualifies.
+    Optional ``min_crops`` / ``max_crops`` keys carry the request's crop budget.
+    """
+    base_size, image_size, crop_mode = size_config["base_size"], size_config["image_size"], size_config["crop_mode"]
+    min_crops, max_crops = crop_budget(size_config.get("min_crops"), size_config.get("max_crops"))
+    layout = (base_size, image_size, crop_mode, min_crops, max_crops)
+    crop_ratio, _ = image_token_layout(width, height, *layout)
+
+    if image_size <= 640 and not crop_mode:
+        need_width = need_height = image_size
+    else:
+        fit = base_size / max(width, height)
+        need_width, need_height = math.ceil(width * fit), math.ceil(height * fit)
+    if crop_ratio != (1, 1):
+        need_width = max(need_width, image_size * crop_ratio[0])
+        need_height = max(need_height, image_size * crop_ratio[1])
+
+    for scale in (8, 4, 2):
+        reduced_width, reduced_height = -(-width // scale), -(-height // scale)
+        if (
+            reduced_width >= need_width
+            and reduced_height >= need_height
+            and image_token_layout(reduced_width, reduced_height, *layout)[0] == crop_ratio
+        ):
+            return scale
+    return 1
+
+
+def decode_image(fp, size_config: Optional[Dict] = None) -> Image.Image:
+    """
+    Decode an image file object to RGB, reading only the header first
+
+    Images whose declared dimensions exceed MAX_IMAGE_PIXELS are rejected
+    before any pixel data is decoded. Given the request's ``size_config``
+    (and REDUCED_DECODE on), JPEGs are decoded directly at the
+    ``decode_scale`` DCT scale. Other formats are decoded in full: Pillow
+    cannot decode them smaller, and reducing afterwards saves neither decode
+    time nor memory. The declared size is kept in ``image.info["original_size"]``
+    so model coordinates can be mapped back onto the original image.
+    """
+    try:
+        image = Image.open(fp)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(f"Image dimensions {width}x{height} exceed {MAX_IMAGE_PIXELS} pixels.")
+
+    if size_config and REDUCED_DECODE and image.format == "JPEG":
+        scale = decode_scale(width, height, size_config)
+        if scale > 1:
+            # libjpeg scales in the IDCT: the full-size bitmap is never allocated
+            image.draft("RGB", (width // scale, height // scale))
+    image = image.convert("RGB")
+    image.info["original_size"] = (width, height)
+    return image
+
+
+class ImageFetcher:
+    """
+    Async image fetcher with a pooled keep-alive client
+
+    The client lives on a private event loop thread, so blocking callers
+    (``fetch_image``) and coroutines on any loop (``fetch_image_async``) share
+    one connection pool, per-host limit and DNS cache.
+
+    Args:
+        max_bytes: Abort once Content-Length or the streamed byte count exceeds this
+        pool_size: Total keep-alive connections
+        per_host_limit: Concurrent connections to a single host
+        dns_cache_ttl: Seconds a resolved address is reused
+        timeout: Connect / per-read timeout in seconds
+        decode_workers: Threads decoding images while they download
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_FILE_SIZE_MB * 1024 * 1024,
+        pool_size: int = FETCH_POOL_SIZE,
+        per_host_limit: int = FETCH_PER_HOST_LIMIT,
+        dns_cache_ttl: int = FETCH_DNS_CACHE_TTL,
+        timeout: float = FETCH_TIMEOUT_SECONDS,
+        decode_workers: int = FETCH_DECODE_WORKERS,
+        chunk_size: int = FETCH_CHUNK_SIZE,
+    ):
+        self.max_bytes = max_bytes
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._decode_executor = ThreadPoolExecutor(decode_workers, thread_name_prefix="ocr-decode")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ocr-fetcher", daemon=True)
+        self._thread.start()
+
+    def fetch_image(
+        self, url: str, size_config: Optional[Dict] = None, is_cached: Optional[Callable[[str], bool]] = None
+    ) -> Tuple[bytes, Optional[Image.Image]]:
+        """
+        Blocking fetch; returns the raw bytes and the decoded RGB image (see ``decode_image``)
+
+        ``is_cached`` is called with the body's ``hash_image_bytes``, hashed
+        chunk by chunk while it downloads, as soon as the last byte arrives. If
+        it returns True the image is not waited for and comes back as None;
+        either way the decode has been running alongside the download.
+        """
+        return asyncio.run_coroutine_threadsafe(self._fetch(url, size_config, is_cached), self._loop).result()
+
+    async def fetch_image_async(
+        self, url: str, size_config: Optional[Dict] = None, is_cached: Optional[Callable[[str], bool]] = None
+    ) -> Tuple[bytes, Optional[Image.Image]]:
+        """Awaitable fetch usable from any event loop"""
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self._fetch(url, size_config, is_cached), self._loop)
+        )
+
+    def close(self):
+        async def _close():
+            if self._session is not None:
+                await self._session.close()
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._decode_executor.shutdown(wait=False)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.per_host_limit,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.timeout, sock_read=self.timeout
+                ),
+            )
+        return self._session
+
+    async def _fetch(
+        self, url: str, size_config: Optional[Dict], is_cached: Optional[Callable[[str], bool]] = None
+    ) -> Tuple[bytes, Optional[Image.Image]]:
+        stream = _ChunkStream()
+        hasher = image_hasher()
+        # The header check runs as soon as the first bytes arrive
+        decoding = self._loop.run_in_executor(self._decode_executor, decode_image, stream, size_config)
+        try:
+            async with self._get_session().get(url) as response:
+                response.raise_for_status()
+                if response.content_length is not None and response.content_length > self.max_bytes:
+                    raise ImageTooLargeError(f"Image file size exceeds {self.max_bytes // (1024 * 1024)} MB.")
+
+                received = 0
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise ImageTooLargeError(f"Image file size exceeds {self.max_bytes // (1024 * 1024)} MB.")
+                    stream.feed(chunk)
+                    hasher.update(chunk)
+                    if decoding.done() and decoding.exception() is not None:
+                        # The decoder already failed (not an image, or too many pixels); stop downloading
+                        break
+        except BaseException:
+            stream.finish(aborted=True)
+            decoding.cancel()
+            raise
+
+        stream.finish()
+        # The lookup may read the disk cache: keep it off the loop that serves the downloads
+        if is_cached is not None and await self._loop.run_in_executor(None, is_cached, hasher.hexdigest()):
+            # Not needed; let the decode finish on its own, its result or error discarded
+            decoding.add_done_callback(lambda done: done.cancelled() or done.exception())
+            return stream.getvalue(), None
+        return stream.getvalue(), await decoding
+
+
+_fetcher: Optional[ImageFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> ImageFetcher:
+    """Process-wide fetcher, created on first use"""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = ImageFetcher()
+        return _fetcher
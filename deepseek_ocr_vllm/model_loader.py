@@ -8,7 +8,15 @@ from huggingface_hub import snapshot_download
 from vllm import LLM, SamplingParams
 from vllm.model_executor.models.registry import ModelRegistry
 
-from .config import MODEL_PATH, MODEL_ID
+from .config import EMBEDDING_CACHE_ENABLED, MODEL_PATH, MODEL_ID
+from .embedding_cache import IMAGE_CACHE_KEY_KWARG, embedding_cache_key, get_embedding_cache, image_view
+from .process.image_process import (
+    MAX_CROPS_KWARG,
+    MIN_CROPS_KWARG,
+    SIZE_MODE_KWARG,
+    crop_budget,
+    size_mode_config,
+)
 from .process.ngram_norepeat import NoRepeatNGramLogitsProcessor
 
 
@@ -147,6 +155,63 @@ def get_ocr_processor():
     return DeepseekOCRProcessor()
 
 
+def build_vllm_request(processor, image, prompt, size_mode=None, image_hash=None, min_crops=None, max_crops=None):
+    """
+    Build an ``llm.generate`` request for one image
+
+    Args:
+        processor: DeepseekOCRProcessor from ``get_ocr_processor``
+        image: PIL RGB image
+        prompt: Prompt containing ``<image>``
+        size_mode: ``SIZE_CONFIGS`` key (Tiny ... Gundam). The mode travels with the
+            request, so one engine serves every mode; defaults to the
+            BASE_SIZE / IMAGE_SIZE / CROP_MODE config.
+        image_hash: Content hash of the image bytes. When given, the image's vision
+            features are cached, so further prompts on the same image skip the encoder:
+            a cached image is sent as image embeddings and never preprocessed.
+        min_crops / max_crops: Tile budget of crop modes (see ``crop_budget``); defaults
+            to MIN_CROPS / MAX_CROPS. Travels with the request like ``size_mode``.
+    """
+    base_size, image_size, crop_mode = size_mode_config(size_mode)
+    min_crops, max_crops = crop_budget(min_crops, max_crops)
+    mm_processor_kwargs = {}
+    if size_mode is not None:
+        mm_processor_kwargs[SIZE_MODE_KWARG] = size_mode
+    if (min_crops, max_crops) != crop_budget():
+        mm_processor_kwargs[MIN_CROPS_KWARG] = min_crops
+        mm_processor_kwargs[MAX_CROPS_KWARG] = max_crops
+
+    cached = None
+    if image_hash is not None and EMBEDDING_CACHE_ENABLED:
+        # The decoded size and trim box are part of the key: a reduced decode
+        # or trim_margins changes what the encoder sees, not the bytes
+        cache_key = embedding_cache_key(
+            image_hash, base_size, image_size, crop_mode, min_crops, max_crops, image_view(image)
+        )
+        mm_processor_kwargs[IMAGE_CACHE_KEY_KWARG] = cache_key
+        cached = get_embedding_cache().get(cache_key)
+
+    if cached is not None:
+        # [n_images, n_tokens, n_embed]: vLLM passes it through as image_embeds
+        image_data = cached.unsqueeze(0)
+    else:
+        image_data = processor.tokenize_with_images(
+            images=[image],
+            bos=True,
+            eos=True,
+            cropping=crop_mode,
+            prompt=prompt,
+            base_size=base_size,
+            image_size=image_size,
+            min_crops=min_crops,
+            max_crops=max_crops,
+        )
+    request = {"prompt": prompt, "multi_modal_data": {"image": image_data}}
+    if mm_processor_kwargs:
+        request["mm_processor_kwargs"] = mm_processor_kwargs
+    return request
+
+
 # Global variables for model components
 _llm_engine = None
 _sampling_params = None
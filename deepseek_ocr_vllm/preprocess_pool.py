@@ -0,0 +1,181 @@
+"""
+Parallel image preprocessing for DeepSeek OCR
+Runs pad / tile / tokenize on a pool of GIL-releasing threads or worker processes
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import torch
+import torch.multiprocessing as torch_mp  # registers the shared-memory tensor reducers
+from PIL import Image
+
+from .config import MODEL_ID, NUM_WORKERS, PREPROCESS_MODE, PREPROCESS_QUEUE_DEPTH
+
+
+def prepare_inputs(processor, image: Image.Image, prompt: str, size_config: Dict) -> Dict:
+    """Tokenize the prompt and turn a decoded PIL image into model tensors.
+
+    ``size_config`` may carry the request's ``min_crops`` / ``max_crops`` budget.
+    """
+    [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, _, _, _]] = (
+        processor.tokenize_with_images(
+            images=[image],
+            bos=True,
+            eos=True,
+            cropping=size_config["crop_mode"],
+            prompt=prompt,
+            base_size=size_config["base_size"],
+            image_size=size_config["image_size"],
+            min_crops=size_config.get("min_crops"),
+            max_crops=size_config.get("max_crops"),
+        )
+    )
+    return {
+        "input_ids": input_ids,
+        "pixel_values": pixel_values,
+        "images_crop": images_crop[0],
+        "images_seq_mask": images_seq_mask,
+        "images_spatial_crop": images_spatial_crop,
+    }
+
+
+def load_processor(model_id: str = MODEL_ID):
+    """Processor factory for worker processes (must be picklable, hence module level)"""
+    from transformers import AutoTokenizer
+
+    from .process.image_process import DeepseekOCRProcessor
+
+    # prepare_inputs feeds the HF model, which has no use for tile keys
+    return DeepseekOCRProcessor(
+        tokenizer=AutoTokenizer.from_pretrained(model_id, trust_remote_code=True), hash_tiles=False
+    )
+
+
+def default_workers() -> int:
+    """NUM_WORKERS, capped at the CPUs this process may run on"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, min(NUM_WORKERS, cpus))
+
+
+# ---- worker-process side ----
+
+_worker_processor = None
+
+
+def _inherited(processor):
+    # Forked workers already hold the parent's processor
+    return processor
+
+
+def _init_worker(processor_factory: Callable):
+    global _worker_processor
+    # One intra-op thread per process; parallelism comes from the pool itself
+    torch.set_num_threads(1)
+    _worker_processor = processor_factory()
+
+
+def _prepare_in_worker(pixels: torch.Tensor, prompt: str, size_config: Dict) -> Dict:
+    inputs = prepare_inputs(_worker_processor, Image.fromarray(pixels.numpy()), prompt, size_config)
+    # Returned through shared memory: only a handle crosses the pipe
+    for tensor in inputs.values():
+        tensor.share_memory_()
+    return inputs
+
+
+class PreprocessPool:
+    """
+    Bounded pool in front of the engine for ``prepare_inputs``
+
+    ``thread`` mode shares the caller's processor; PIL resizing and torch ops
+    release the GIL, so threads scale across cores. ``process`` mode forks
+    CPU-only workers that inherit the processor (like DataLoader workers, they
+    never touch CUDA, so a CUDA parent is fine) and moves images in and tensors
+    out through shared memory rather than pickled copies. Where fork is not
+    available, workers are spawned and build their own processor with
+    ``worker_factory``.
+
+    At most ``queue_depth`` jobs are queued or running; ``submit`` blocks past
+    that, which pushes back on request threads when ingest bursts faster than
+    the pool drains.
+    """
+
+    def __init__(
+        self,
+        processor,
+        workers: Optional[int] = None,
+        mode: str = PREPROCESS_MODE,
+        queue_depth: int = PREPROCESS_QUEUE_DEPTH,
+        worker_factory: Optional[Callable] = None,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"`mode` must be 'thread' or 'process', got {mode!r}")
+        self.processor = processor
+        self.mode = mode
+        self.workers = workers or default_workers()
+        self.queue_depth = max(queue_depth, self.workers)
+
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.pending = 0
+
+        if mode == "process":
+            fork = "fork" in multiprocessing.get_all_start_methods()
+            if worker_factory is None:
+                worker_factory = partial(_inherited, processor) if fork else partial(load_processor, MODEL_ID)
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=torch_mp.get_context("fork" if fork else "spawn"),
+                initializer=_init_worker,
+                initargs=(worker_factory,),
+            )
+        else:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="ocr-preprocess")
+
+    def submit(self, image: Image.Image, prompt: str, size_config: Dict) -> Future:
+        """Queue one image; the Future resolves to the ``prepare_inputs`` dict"""
+        self._slots.acquire()
+        try:
+            if self.mode == "process":
+                pixels = torch.from_numpy(np.array(image.convert("RGB"))).share_memory_()
+                future = self._executor.submit(_prepare_in_worker, pixels, prompt, size_config)
+            else:
+                future = self._executor.submit(prepare_inputs, self.processor, image, prompt, size_config)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.submitted += 1
+            self.pending += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def prepare(self, image: Image.Image, prompt: str, size_config: Dict) -> Dict:
+        """Blocking ``submit``"""
+        return self.submit(image, prompt, size_config).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "submitted": self.submitted,
+                "pending": self.pending,
+            }
+
+    def _done(self, future: Future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
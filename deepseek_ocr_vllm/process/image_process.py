@@ -1,12 +1,40 @@
+import hashlib
 import math
+from functools import lru_cache
 from typing import List, Tuple
 
+import numpy as np
 import torch
 import torchvision.transforms as T
 from PIL import Image, ImageOps
 from transformers import AutoProcessor, BatchFeature, LlamaTokenizerFast
 from transformers.processing_utils import ProcessorMixin
 
+from ..config import (
+    BASE_SIZE,
+    BLANK_TILE_CACHE,
+    CROP_LIMIT,
+    CROP_MODE,
+    IMAGE_SIZE,
+    MAX_CROPS,
+    MIN_CROPS,
+    PROMPT_TEMPLATES,
+    SIZE_CONFIGS,
+    TILE_DEDUPE,
+    TRIM_ANALYSIS_SIZE,
+    TRIM_PADDING,
+    TRIM_TOLERANCE,
+    UINT8_PIXEL_TRANSPORT,
+)
+
+PROMPT_TOKEN_CACHE_SIZE = 1024  # distinct prompt text pieces kept tokenized
+
+# mm_processor_kwargs key naming the SIZE_CONFIGS entry a vLLM request was tokenized with
+SIZE_MODE_KWARG = "size_mode"
+# mm_processor_kwargs keys carrying a vLLM request's crop budget (see crop_budget)
+MIN_CROPS_KWARG = "min_crops"
+MAX_CROPS_KWARG = "max_crops"
+
 def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_size):
     best_ratio_diff = float('inf')
     best_ratio = (1, 1)
@@ -24,37 +52,144 @@ def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_
     return best_ratio
 
 
-def count_tiles(orig_width, orig_height, min_num=2, max_num=6, image_size=640, use_thumbnail=False):
-    aspect_ratio = orig_width / orig_height
-
-    # calculate the existing image aspect ratio
+@lru_cache(maxsize=None)
+def get_target_ratios(min_num=2, max_num=6):
+    """(w_tiles, h_tiles) grids with min_num..max_num tiles, sorted by tile count; built once per range"""
     target_ratios = set(
         (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
         i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
-
-    # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
-
-    return target_aspect_ratio
-
-
-def dynamic_preprocess(image, min_num=2, max_num=6, image_size=640, use_thumbnail=False):
+    return tuple(sorted(target_ratios, key=lambda x: x[0] * x[1]))
+
+
+@lru_cache(maxsize=65536)
+def _count_tiles(orig_width, orig_height, min_num, max_num, image_size):
+    return find_closest_aspect_ratio(
+        orig_width / orig_height, get_target_ratios(min_num, max_num), orig_width, orig_height, image_size)
+
+
+def count_tiles(orig_width, orig_height, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
+    # find the closest aspect ratio to the target (memoized per image size)
+    return _count_tiles(orig_width, orig_height, min_num, max_num, image_size)
+
+
+@lru_cache(maxsize=65536)
+def image_token_layout(width, height, base_size=1024, image_size=640, cropping=True, min_num=MIN_CROPS,
+                       max_num=MAX_CROPS, patch_size=16, downsample_ratio=4):
+    """
+    Tile grid and image-token count for one image, as ``tokenize_with_images`` lays it out
+
+    Shared by the processor and ``DeepseekOCRProcessingInfo.get_num_image_tokens``
+    so prompt replacement and tokenization always agree.
+
+    Returns:
+        ((num_width_tiles, num_height_tiles), num_image_tokens)
+    """
+    if (width <= 640 and height <= 640) or not cropping:
+        crop_ratio = (1, 1)
+    else:
+        crop_ratio = tuple(count_tiles(width, height, min_num, max_num, image_size))
+    num_width_tiles, num_height_tiles = crop_ratio
+
+    num_queries = math.ceil((image_size // patch_size) / downsample_ratio)
+    num_queries_base = math.ceil((base_size // patch_size) / downsample_ratio)
+    num_image_tokens = (num_queries_base + 1) * num_queries_base + 1
+    if num_width_tiles > 1 or num_height_tiles > 1:
+        num_image_tokens += (num_queries * num_width_tiles + 1) * (num_queries * num_height_tiles)
+    return crop_ratio, num_image_tokens
+
+
+def size_mode_config(size_mode=None):
+    """
+    (base_size, image_size, crop_mode) of a ``SIZE_CONFIGS`` entry
+
+    ``None`` is the engine default (BASE_SIZE / IMAGE_SIZE / CROP_MODE).
+    """
+    if size_mode is None:
+        return BASE_SIZE, IMAGE_SIZE, CROP_MODE
+    if size_mode not in SIZE_CONFIGS:
+        raise ValueError(f"Unknown size_mode {size_mode!r}; expected one of {list(SIZE_CONFIGS)}")
+    size_config = SIZE_CONFIGS[size_mode]
+    return size_config["base_size"], size_config["image_size"], size_config["crop_mode"]
+
+
+def crop_budget(min_crops=None, max_crops=None):
+    """
+    Validated (min_crops, max_crops) tile budget for crop modes
+
+    ``None`` takes the MIN_CROPS / MAX_CROPS default, moved as needed to stay
+    compatible with the bound that was given (``max_crops=1`` alone is (1, 1)).
+    A budget whose grid is 1x1 means the global view only.
+
+    Raises:
+        ValueError: bounds outside 1..CROP_LIMIT, or min_crops > max_crops
+    """
+    for name, value in (("min_crops", min_crops), ("max_crops", max_crops)):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int)
+                                  or not 1 <= value <= CROP_LIMIT):
+            raise ValueError(f"{name} must be an integer from 1 to {CROP_LIMIT}, got {value!r}")
+    if min_crops is None:
+        min_crops = MIN_CROPS if max_crops is None else min(MIN_CROPS, max_crops)
+    if max_crops is None:
+        max_crops = max(MAX_CROPS, min_crops)
+    if min_crops > max_crops:
+        raise ValueError(f"min_crops ({min_crops}) exceeds max_crops ({max_crops})")
+    return min_crops, max_crops
+
+
+def content_box(image, tolerance=TRIM_TOLERANCE, analysis_size=TRIM_ANALYSIS_SIZE, padding=TRIM_PADDING):
+    """
+    (left, top, right, bottom) of the non-blank content of ``image``
+
+    Works on a grayscale copy box-reduced to about ``analysis_size`` px on its
+    long side. The margin colour is the median of that copy's outer ring
+    (white paper, dark screenshots alike); cells differing from it by more
+    than ``tolerance`` are content. The box is grown by ``padding`` px and
+    clipped to the image; a blank image returns the full frame.
+    """
+    width, height = image.size
+    factor = max(1, -(-max(width, height) // analysis_size))
+    gray = np.asarray(image.convert("L").reduce(factor) if factor > 1 else image.convert("L"), dtype=np.int16)
+
+    ring = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    content = np.abs(gray - int(np.median(ring))) > tolerance
+    rows = np.flatnonzero(content.any(axis=1))
+    cols = np.flatnonzero(content.any(axis=0))
+    if rows.size == 0:
+        return 0, 0, width, height
+    return (
+        max(0, int(cols[0]) * factor - padding),
+        max(0, int(rows[0]) * factor - padding),
+        min(width, (int(cols[-1]) + 1) * factor + padding),
+        min(height, (int(rows[-1]) + 1) * factor + padding),
+    )
+
+
+def trim_margins(image, **kwargs):
+    """
+    Crop ``image`` to its ``content_box`` so blank margins do not cost tiles
+
+    The returned image records where it sits on the original in
+    ``info["content_box"]`` (original-image pixels, honouring a reduced decode's
+    ``info["original_size"]``); model coordinates are relative to that box.
+    """
+    box = content_box(image, **kwargs)
+    if box == (0, 0) + image.size:
+        return image
+    original_width, original_height = image.info.get("original_size", image.size)
+    scale_x, scale_y = original_width / image.size[0], original_height / image.size[1]
+    trimmed = image.crop(box)
+    trimmed.info["original_size"] = (original_width, original_height)
+    trimmed.info["content_box"] = (
+        round(box[0] * scale_x), round(box[1] * scale_y), round(box[2] * scale_x), round(box[3] * scale_y)
+    )
+    return trimmed
+
+
+def dynamic_preprocess(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
     orig_width, orig_height = image.size
-    aspect_ratio = orig_width / orig_height
-
-    # calculate the existing image aspect ratio
-    target_ratios = set(
-        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
-        i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
 
     # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
+    target_aspect_ratio = count_tiles(orig_width, orig_height, min_num, max_num, image_size)
 
     # print(target_aspect_ratio)
     # calculate the target width and height
@@ -82,7 +217,97 @@ def dynamic_preprocess(image, min_num=2, max_num=6, image_size=640, use_thumbnai
     return processed_images, target_aspect_ratio
 
 
-
+def tile_keys(tiles: np.ndarray) -> torch.Tensor:
+    """
+    Content keys for uint8 tiles [n, S, S, 3]: equal tiles get equal keys
+
+    Positive keys are content hashes. Uniform (single-colour) tiles get a
+    negative key encoding their colour, so the encoder can recognise blank
+    tiles without looking at pixels. Never 0, which means "no key".
+    """
+    flat = tiles.reshape(len(tiles), -1, 3)
+    uniform = (flat == flat[:, :1]).all(axis=(1, 2))
+    keys = []
+    for tile, is_uniform in zip(tiles, uniform):
+        if is_uniform:
+            r, g, b = (int(c) for c in tile[0, 0])
+            keys.append(-(1 + ((r << 16) | (g << 8) | b)))
+        else:
+            digest = hashlib.blake2b(np.ascontiguousarray(tile), digest_size=8).digest()
+            keys.append((int.from_bytes(digest, "little") >> 1) or 1)
+    return torch.tensor(keys, dtype=torch.long)
+
+
+def dynamic_preprocess_tensor(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, transform=None,
+                              uint8=False, with_keys=False):
+    """
+    Tensor-native ``dynamic_preprocess``: same tile layout and pixels, no per-tile PIL crops
+
+    The image is resized once; all tiles come out of that one buffer as a
+    reshaped view, converted to float and normalized in a single pass.
+    Returns (tiles [n_tiles, 3, image_size, image_size], target_aspect_ratio),
+    tiles in row-major order, equal to ``transform`` applied to each
+    ``dynamic_preprocess`` crop. With ``uint8`` the raw pixels are returned
+    instead (see ``normalize_pixels``). With ``with_keys`` the per-tile
+    ``tile_keys`` are appended to the returned tuple.
+    """
+    orig_width, orig_height = image.size
+    target_aspect_ratio = count_tiles(orig_width, orig_height, min_num, max_num, image_size)
+    num_width_tiles, num_height_tiles = target_aspect_ratio
+
+    resized_img = image.resize((image_size * num_width_tiles, image_size * num_height_tiles))
+    pixels = torch.from_numpy(np.array(resized_img))  # (H, W, 3) uint8
+
+    tiles = torch.empty(
+        (num_width_tiles * num_height_tiles, 3, image_size, image_size),
+        dtype=torch.uint8 if uint8 else torch.float32,
+    )
+    # (H, W, 3) -> (tiles_h, tiles_w, 3, S, S) as a view; copy_ converts to float in the same pass
+    tiles.view(num_height_tiles, num_width_tiles, 3, image_size, image_size).copy_(
+        pixels.view(num_height_tiles, image_size, num_width_tiles, image_size, 3).permute(0, 2, 4, 1, 3)
+    )
+    extra = ()
+    if with_keys:
+        # hashed from the uint8 pixels: 4x fewer bytes than the float tiles
+        extra = (tile_keys(
+            pixels.view(num_height_tiles, image_size, num_width_tiles, image_size, 3)
+            .permute(0, 2, 1, 3, 4).reshape(-1, image_size, image_size, 3).numpy()
+        ),)
+    if uint8:
+        return (tiles, target_aspect_ratio) + extra
+    tiles.div_(255)
+    if transform is not None:
+        transform.normalize_(tiles)
+    return (tiles, target_aspect_ratio) + extra
+
+
+
+
+def normalize_pixels(x, dtype, mean=(0.5, 0.5, 0.5), std=(0.5, 0.5, 0.5)):
+    """
+    Cast a [..., 3, H, W] pixel block to ``dtype`` for the vision encoder
+
+    uint8 blocks (``UINT8_PIXEL_TRANSPORT``) get the ToTensor + Normalize math
+    here, in float32 on their own device, so the result equals the processor's
+    float output cast to ``dtype``. Float blocks are only cast.
+    """
+    if x.dtype != torch.uint8:
+        return x.to(dtype)
+    x = x.to(torch.float32).div_(255)
+    mean = torch.as_tensor(mean, dtype=x.dtype, device=x.device).view(-1, 1, 1)
+    std = torch.as_tensor(std, dtype=x.dtype, device=x.device).view(-1, 1, 1)
+    return x.sub_(mean).div_(std).to(dtype)
+
+
+def pil_to_uint8_tensor(pil_img: Image.Image) -> torch.Tensor:
+    """HWC PIL image -> [3, H, W] uint8 tensor"""
+    return torch.from_numpy(np.array(pil_img)).permute(2, 0, 1).contiguous()
+
+
+@lru_cache(maxsize=256)
+def _image_token_block(image_token_id, num_image_tokens):
+    # Shared, never mutated: callers only torch.cat it
+    return torch.full((num_image_tokens,), image_token_id, dtype=torch.long)
 
 
 class ImageTransform:
@@ -106,6 +331,14 @@ class ImageTransform:
         x = self.transform(pil_img)
         return x
 
+    def normalize_(self, x: torch.Tensor) -> torch.Tensor:
+        """In-place Normalize over a [..., 3, H, W] block of ToTensor-scaled values"""
+        if self.normalize:
+            mean = torch.as_tensor(self.mean, dtype=x.dtype).view(-1, 1, 1)
+            std = torch.as_tensor(self.std, dtype=x.dtype).view(-1, 1, 1)
+            x.sub_(mean).div_(std)
+        return x
+
 
 class DeepseekOCRProcessor(ProcessorMixin):
     tokenizer_class = ("LlamaTokenizer", "LlamaTokenizerFast")
@@ -126,6 +359,8 @@ class DeepseekOCRProcessor(ProcessorMixin):
         sft_format: str = "deepseek",
         mask_prompt: bool = True,
         ignore_id: int = -100,
+        uint8_pixels: bool = UINT8_PIXEL_TRANSPORT,
+        hash_tiles: bool = TILE_DEDUPE or BLANK_TILE_CACHE,
         **kwargs,
     ):
 
@@ -141,6 +376,10 @@ class DeepseekOCRProcessor(ProcessorMixin):
         self.downsample_ratio = 4
 
         self.image_transform = ImageTransform(mean=image_mean, std=image_std, normalize=normalize)
+        # Emit raw uint8 pixels; the consumer calls normalize_pixels on its device
+        self.uint8_pixels = uint8_pixels
+        # Emit images_tile_key (tile_keys) so the encoder can dedupe tiles; zeros otherwise
+        self.hash_tiles = hash_tiles
 
         # Initialize tokenizer if not provided
         if tokenizer is None:
@@ -163,6 +402,14 @@ class DeepseekOCRProcessor(ProcessorMixin):
         #     self.tokenizer.add_special_tokens(special_tokens_dict)
         self.image_token_id = self.tokenizer.vocab.get(image_token)
 
+        # Text pieces between <image> tags are tokenized once; the PROMPT_TEMPLATES
+        # pieces are warmed up front (text_localization's varies per request)
+        self._encode_text = lru_cache(maxsize=PROMPT_TOKEN_CACHE_SIZE)(self._encode_text_uncached)
+        for template in PROMPT_TEMPLATES.values():
+            if "{" not in template:
+                for text_sep in template.split(image_token):
+                    self._encode_text(text_sep)
+
         # add five special tokens for grounding-related tasks
         # <|ref|>, <|/ref|>, <|det|>, <|/det|>, <|grounding|>
         # special_tokens = ['<|ref|>', '<|/ref|>', '<|det|>', '<|/det|>', '<|grounding|>']
@@ -238,6 +485,45 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
         return t
 
+    def _encode_text_uncached(self, text: str) -> torch.Tensor:
+        return torch.tensor(self.encode(text, bos=False, eos=False), dtype=torch.long)
+
+    def _prompt_token_tensors(self, text_splits: List[str], num_image_tokens: List[int], bos: bool, eos: bool):
+        """
+        Assemble input_ids / target_ids / images_seq_mask from cached pieces
+
+        ``text_splits[i]`` is followed by a run of ``num_image_tokens[i]`` image
+        tokens; everything is joined with one torch.cat instead of list math.
+        """
+        segments, image_spans = [], []
+        length = 0
+        if bos:
+            segments.append(torch.tensor([self.bos_id], dtype=torch.long))
+            length += 1
+        for i, text_sep in enumerate(text_splits):
+            text_ids = self._encode_text(text_sep)
+            segments.append(text_ids)
+            length += len(text_ids)
+            if i < len(num_image_tokens):
+                segments.append(_image_token_block(self.image_token_id, num_image_tokens[i]))
+                image_spans.append((length, length + num_image_tokens[i]))
+                length += num_image_tokens[i]
+        if eos:
+            segments.append(torch.tensor([self.eos_id], dtype=torch.long))
+            length += 1
+
+        input_ids = torch.cat(segments)
+        images_seq_mask = torch.zeros(length, dtype=torch.bool)
+        for start, end in image_spans:
+            images_seq_mask[start:end] = True
+
+        # set input_ids < 0 | input_ids == self.image_token_id as ignore_id
+        target_ids = input_ids.clone()
+        target_ids[(input_ids < 0) |
+                   (input_ids == self.image_token_id)] = self.ignore_id
+        input_ids[input_ids < 0] = self.pad_id
+        return input_ids, target_ids, images_seq_mask
+
     def decode(self, t: List[int], **kwargs) -> str:
         return self.tokenizer.decode(t, **kwargs)
 
@@ -272,7 +558,8 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
         sft_format = prompt
 
-        input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, _ = images[0]
+        (input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, images_tile_key,
+         num_image_tokens, _) = images[0]
 
 
         return {
@@ -281,6 +568,7 @@ class DeepseekOCRProcessor(ProcessorMixin):
             "images_crop": images_crop,
             "images_seq_mask": images_seq_mask,
             "images_spatial_crop": images_spatial_crop,
+            "images_tile_key": images_tile_key,
             "num_image_tokens": num_image_tokens,
         }
 
@@ -337,26 +625,32 @@ class DeepseekOCRProcessor(ProcessorMixin):
         bos: bool = True,
         eos: bool = True,
         cropping: bool = True,
-        prompt: str = None
+        prompt: str = None,
+        base_size: int = None,
+        image_size: int = None,
+        min_crops: int = None,
+        max_crops: int = None,
     ):
-        """Tokenize text with <image> tags."""
+        """Tokenize text with <image> tags.
+
+        ``base_size`` / ``image_size`` override the processor defaults for this
+        call only, so one processor instance can serve every ``SIZE_CONFIGS`` entry.
+        ``min_crops`` / ``max_crops`` bound the tile grid (see ``crop_budget``).
+        """
 
         # Use provided prompt or default
         conversation = prompt if prompt else '<image>\n<|grounding|>Convert the document to markdown.'
+        base_size = base_size or self.base_size
+        image_size = image_size or self.image_size
+        min_crops, max_crops = crop_budget(min_crops, max_crops)
         
         assert conversation.count(self.image_token) == len(images)
         text_splits = conversation.split(self.image_token)
-        images_list, images_crop_list, images_seq_mask, images_spatial_crop = [], [], [], []
+        images_list, images_crop_list, images_spatial_crop, tile_key_list = [], [], [], []
         image_shapes = []
         num_image_tokens = []
-        tokenized_str = []
         # print('image: ', len(images))
-        for text_sep, image in zip(text_splits, images):
-            """encode text_sep"""
-            tokenized_sep = self.encode(text_sep, bos=False, eos=False)
-            tokenized_str += tokenized_sep
-            images_seq_mask += [False] * len(tokenized_sep)
-
+        for image in images:
             """select best resolution for anyres"""
             # if cropping:
             #     best_width, best_height = self.select_best_resolution(image.size)
@@ -365,32 +659,30 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
             image_shapes.append(image.size)
 
-            if image.size[0] <= 640 and image.size[1] <= 640:
-                crop_ratio = [1, 1]
-            else:
-                if cropping:
-                    # print('image-size: ', image.size)
-                    # best_width, best_height = select_best_resolution(image.size, self.candidate_resolutions)
-                    # print('image ', image.size)
-                    # print('open_size:', image.size)
-                    images_crop_raw, crop_ratio = dynamic_preprocess(image, image_size=self.image_size)
-                    # print('crop_ratio: ', crop_ratio)
-                else:
-                    # best_width, best_height = self.image_size, self.image_size
-                    crop_ratio = [1, 1]
+            # same (memoized) choice get_num_image_tokens makes during prompt replacement
+            crop_ratio, image_tokens = image_token_layout(
+                image.size[0], image.size[1], base_size, image_size, cropping, min_crops, max_crops,
+                patch_size=self.patch_size, downsample_ratio=self.downsample_ratio)
+            if crop_ratio != (1, 1):
+                images_crop_tiles, _, *crop_tile_keys = dynamic_preprocess_tensor(
+                    image, min_crops, max_crops, image_size=image_size, transform=self.image_transform, uint8=self.uint8_pixels,
+                    with_keys=self.hash_tiles)
             # print(image.size, (best_width, best_height)) # check the select_best_resolutions func
 
             # print(crop_ratio)
             """process the global view"""
 
             # if cropping
-            if self.image_size <= 640 and not cropping:
+            if image_size <= 640 and not cropping:
                 # print('directly resize')
-                image = image.resize((self.image_size, self.image_size))
+                image = image.resize((image_size, image_size))
 
-            global_view = ImageOps.pad(image, (self.base_size, self.base_size),
+            global_view = ImageOps.pad(image, (base_size, base_size),
                                     color=tuple(int(x * 255) for x in self.image_transform.mean))
-            images_list.append(self.image_transform(global_view))
+            if self.uint8_pixels:
+                images_list.append(pil_to_uint8_tensor(global_view))
+            else:
+                images_list.append(self.image_transform(global_view))
 
             """record height / width crop num"""
             # width_crop_num, height_crop_num = best_width // self.image_size, best_height // self.image_size
@@ -408,8 +700,9 @@ class DeepseekOCRProcessor(ProcessorMixin):
                 #     for j in range(0, best_width, self.image_size):
                 #         images_crop_list.append(
                 #             self.image_transform(local_view.crop((j, i, j + self.image_size, i + self.image_size))))
-                for i in range(len(images_crop_raw)):
-                    images_crop_list.append(self.image_transform(images_crop_raw[i]))
+                images_crop_list.append(images_crop_tiles)
+                tile_key_list.append(
+                    crop_tile_keys[0] if crop_tile_keys else torch.zeros(len(images_crop_tiles), dtype=torch.long))
 
             # """process the global view"""
             # global_view = ImageOps.pad(image, (self.image_size, self.image_size),
@@ -424,58 +717,12 @@ class DeepseekOCRProcessor(ProcessorMixin):
             #         images_list.append(
             #             self.image_transform(local_view.crop((j, i, j + self.image_size, i + self.image_size))))
 
-            # """add image tokens"""
             """add image tokens"""
-            num_queries = math.ceil((self.image_size // self.patch_size) / self.downsample_ratio)
-            num_queries_base = math.ceil((self.base_size // self.patch_size) / self.downsample_ratio)
-
-
-            tokenized_image = ([self.image_token_id] * num_queries_base + [self.image_token_id]) * num_queries_base
-            tokenized_image += [self.image_token_id]
-            if num_width_tiles > 1 or num_height_tiles > 1:
-                tokenized_image += ([self.image_token_id] * (num_queries * num_width_tiles) + [self.image_token_id]) * (
-                            num_queries * num_height_tiles)
-            tokenized_str += tokenized_image
-            images_seq_mask += [True] * len(tokenized_image)
-            num_image_tokens.append(len(tokenized_image))
-
-        """process the last text split"""
-        tokenized_sep = self.encode(text_splits[-1], bos=False, eos=False)
-        tokenized_str += tokenized_sep
-        images_seq_mask += [False] * len(tokenized_sep)
-
-        """add the bos and eos tokens"""
-        if bos:
-            tokenized_str = [self.bos_id] + tokenized_str
-            images_seq_mask = [False] + images_seq_mask
-        if eos:
-            tokenized_str = tokenized_str + [self.eos_id]
-            images_seq_mask = images_seq_mask + [False]
-
-        assert len(tokenized_str) == len(
-            images_seq_mask), f"tokenize_with_images func: tokenized_str's length {len(tokenized_str)} is not equal to imags_seq_mask's length {len(images_seq_mask)}"
-        
-
-
-        masked_tokenized_str = []
-        for token_index in tokenized_str:
-            if token_index != self.image_token_id:
-                masked_tokenized_str.append(token_index)
-            else:
-                masked_tokenized_str.append(self.ignore_id)
-
-        assert len(tokenized_str) == len(images_seq_mask) == len(masked_tokenized_str), \
-            (f"tokenized_str's length {len(tokenized_str)}, input_ids' length {len(masked_tokenized_str)}, "
-             f"imags_seq_mask's length {len(images_seq_mask)}, are not equal")
+            num_image_tokens.append(image_tokens)
 
-        input_ids = torch.LongTensor(tokenized_str)
-        target_ids = torch.LongTensor(masked_tokenized_str)
-        images_seq_mask = torch.tensor(images_seq_mask, dtype=torch.bool)
-
-        # set input_ids < 0 | input_ids == self.image_token_id as ignore_id
-        target_ids[(input_ids < 0) |
-                   (input_ids == self.image_token_id)] = self.ignore_id
-        input_ids[input_ids < 0] = self.pad_id
+        """tokenize the text splits and join them with the image-token runs"""
+        input_ids, target_ids, images_seq_mask = self._prompt_token_tensors(
+            text_splits, num_image_tokens, bos=bos, eos=eos)
 
         inference_mode = True
 
@@ -486,22 +733,32 @@ class DeepseekOCRProcessor(ProcessorMixin):
             target_ids = target_ids[:-1]
             images_seq_mask = images_seq_mask[:-1]
 
+        pixel_dtype = torch.uint8 if self.uint8_pixels else torch.float32
         if len(images_list) == 0:
-            pixel_values = torch.zeros((1, 3, self.base_size, self.base_size))
+            pixel_values = torch.zeros((1, 3, base_size, base_size), dtype=pixel_dtype)
             images_spatial_crop = torch.zeros((1, 1), dtype=torch.long)
-            images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
+            images_crop = torch.zeros((1, 3, image_size, image_size), dtype=pixel_dtype).unsqueeze(0)
+            images_tile_key = torch.zeros((1, 1), dtype=torch.long)
         else:
             pixel_values = torch.stack(images_list, dim=0)
             images_spatial_crop = torch.tensor(images_spatial_crop, dtype=torch.long)
             if images_crop_list:
-                images_crop = torch.stack(images_crop_list, dim=0).unsqueeze(0)
+                # one [n_tiles, 3, h, w] block per image
+                if len(images_crop_list) == 1:
+                    images_crop = images_crop_list[0].unsqueeze(0)
+                else:
+                    images_crop = torch.cat(images_crop_list, dim=0).unsqueeze(0)
+                # [1, n_tiles], aligned with images_crop
+                images_tile_key = torch.cat(tile_key_list).unsqueeze(0)
             else:
-                images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
+                images_crop = torch.zeros((1, 3, image_size, image_size), dtype=pixel_dtype).unsqueeze(0)
+                images_tile_key = torch.zeros((1, 1), dtype=torch.long)
 
         input_ids = input_ids.unsqueeze(0)
 
         
-        return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, image_shapes]]
+        return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, images_tile_key,
+                 num_image_tokens, image_shapes]]
 
 
 try:
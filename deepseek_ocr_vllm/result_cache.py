@@ -0,0 +1,216 @@
+"""
+Content-addressed OCR result cache
+Bounded in-memory LRU in front of an on-disk store with size-based eviction and TTLs
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .config import (
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_DISK_MB,
+    RESULT_CACHE_MEMORY_ITEMS,
+    RESULT_CACHE_TTL_SECONDS,
+)
+
+
+def image_hasher():
+    """Incremental ``hash_image_bytes``: ``update`` it chunk by chunk, then read ``hexdigest()``"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_image_bytes(image_bytes: bytes) -> str:
+    """Fast content hash of the raw (encoded) image bytes"""
+    hasher = image_hasher()
+    hasher.update(image_bytes)
+    return hasher.hexdigest()
+
+
+def make_cache_key(image_hash: str, prompt: str, size_config: Dict, output_options: Dict) -> str:
+    """
+    Build the cache key for one request
+
+    Args:
+        image_hash: ``hash_image_bytes`` of the input
+        prompt: Final prompt sent to the model
+        size_config: The ``SIZE_CONFIGS`` entry used
+        output_options: Options that change the response (boxes, visualization, ...)
+    """
+    params = json.dumps([prompt, size_config, output_options], sort_keys=True)
+    return hashlib.blake2b(f"{image_hash}:{params}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of OCR responses
+
+    Lookups hit the memory LRU first, then the disk tier (promoting hits back
+    into memory). Entries older than ``ttl_seconds`` count as misses and are
+    removed. The disk tier evicts least-recently-used files once it grows past
+    ``disk_max_bytes``. Set ``disk_dir`` to None for a memory-only cache.
+    """
+
+    def __init__(
+        self,
+        memory_items: int = RESULT_CACHE_MEMORY_ITEMS,
+        disk_dir: Optional[str] = RESULT_CACHE_DIR,
+        disk_max_bytes: int = RESULT_CACHE_DISK_MB * 1024 * 1024,
+        ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+    ):
+        self.memory_items = memory_items
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created, value)
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()  # key -> file size, LRU order
+        self._disk_bytes = 0
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expirations": 0,
+        }
+
+        if self.disk_dir is not None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[Dict]:
+        """Cached response, or None; ``count_miss=False`` for a re-check of a key that already missed"""
+        now = time.time()
+        expired = False
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return dict(entry[1])
+                del self._memory[key]
+                expired = True
+            on_disk = key in self._disk_index
+
+        if on_disk:
+            entry = self._read_disk(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._touch(key)
+                with self._lock:
+                    if key in self._disk_index:
+                        self._disk_index.move_to_end(key)
+                    self._put_memory(key, entry)
+                    self.counters["disk_hits"] += 1
+                return dict(entry[1])
+            expired = expired or entry is not None
+            with self._lock:
+                self._drop_disk(key)
+
+        with self._lock:
+            self.counters["misses"] += count_miss
+            if expired:
+                self.counters["expirations"] += 1
+        return None
+
+    def put(self, key: str, value: Dict):
+        entry = (time.time(), value)
+        with self._lock:
+            self._put_memory(key, entry)
+        if self.disk_dir is not None:
+            self._write_disk(key, entry)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # ---- memory tier (call with the lock held) ----
+
+    def _put_memory(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    # ---- disk tier ----
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+        with self._lock:
+            self._evict_disk()
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["created"], data["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _touch(self, key: str):
+        # Keeps the LRU order across restarts, which rebuild the index from mtimes
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _write_disk(self, key: str, entry: tuple):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": entry[0], "value": entry[1]}, f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Result cache write failed: {str(e)}")
+            return
+        with self._lock:
+            self._disk_bytes += size - self._disk_index.pop(key, 0)
+            self._disk_index[key] = size
+            self._evict_disk()
+
+    def _drop_disk(self, key: str):
+        # Call with the lock held
+        size = self._disk_index.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        # Call with the lock held
+        while self._disk_bytes > self.disk_max_bytes and self._disk_index:
+            key = next(iter(self._disk_index))
+            self._drop_disk(key)
+            self.counters["disk_evictions"] += 1
@@ -0,0 +1,67 @@
+"""
+Single-flight coalescing for OCR jobs
+Identical requests that arrive while one is still running share its result
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Run at most one computation per key at a time
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive with the same key before it finishes block on the leader's future
+    and receive the same result or exception. The key is forgotten as soon as
+    the leader finishes, so later callers start a fresh computation (put a
+    cache in front for that).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (result, shared): ``shared`` is True when the result came from another caller's run
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            # BaseException too (KeyboardInterrupt, SystemExit, a cancelled task):
+            # followers must never be left waiting on an unresolved future
+            self._forget(key)
+            future.set_exception(e)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result, False
+
+    def _forget(self, key: Hashable):
+        # Before the future resolves, so later callers start a fresh run
+        with self._lock:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
@@ -0,0 +1,110 @@
+"""
+Tile-level dedupe for the DeepSeek OCR vision encoder
+Identical crop tiles in one encoder batch (repeated headers, multi-page
+scans) run through SAM + CLIP + projector once; uniform tiles can be served
+from a per-colour embedding cache
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+BLANK_TILE_CACHE_ITEMS = 64  # distinct (colour, tile size) embeddings kept
+
+
+class BlankTileCache:
+    """
+    LRU of encoder features for uniform tiles, keyed by (tile key, tile size)
+
+    A uniform tile's key encodes its colour (see ``tile_keys``), so one entry
+    serves every blank tile of that colour. Used from the model's forward
+    only, hence no lock.
+    """
+
+    def __init__(self, max_items: int = BLANK_TILE_CACHE_ITEMS):
+        self.max_items = max_items
+        self._entries: "OrderedDict[Tuple[int, int], torch.Tensor]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[int, int]) -> Optional[torch.Tensor]:
+        features = self._entries.get(key)
+        if features is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return features
+
+    def put(self, key: Tuple[int, int], features: torch.Tensor):
+        self._entries[key] = features
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+
+
+def encode_tiles(
+    encode: Callable[[torch.Tensor], torch.Tensor],
+    tiles: torch.Tensor,
+    keys: Optional[List[int]],
+    batch_features: Optional[Dict] = None,
+    blank_cache: Optional[BlankTileCache] = None,
+) -> torch.Tensor:
+    """
+    ``encode(tiles)``, running each distinct tile through the encoder once
+
+    Args:
+        encode: [n, 3, S, S] -> [n, ...] features (SAM + CLIP + projector)
+        tiles: One image's crop tiles
+        keys: Per-tile ``tile_keys``; 0 means unknown and is always encoded
+        batch_features: Dict shared by all images of one encoder batch. Keyed
+            tiles encoded here are added to it and later equal tiles reuse
+            them; None disables dedupe.
+        blank_cache: Serves uniform tiles (negative keys) across batches; None disables it
+
+    Returns:
+        [n, ...] features in tile order. Without reusable tiles this is
+        exactly ``encode(tiles)``.
+    """
+    if keys is None or len(keys) != len(tiles) or (batch_features is None and blank_cache is None):
+        return encode(tiles)
+
+    size = tiles.shape[-1]
+    features: List[Optional[torch.Tensor]] = [None] * len(keys)
+    pending: Dict[Tuple[int, int], int] = {}  # key -> index of the tile that encodes it
+    todo = []
+    for index, key in enumerate(keys):
+        cache_key = (key, size)
+        if key == 0 or (key > 0 and batch_features is None):
+            todo.append(index)
+            continue
+        found = batch_features.get(cache_key) if batch_features is not None else None
+        if found is None and key < 0 and blank_cache is not None:
+            found = blank_cache.get(cache_key)
+        if found is not None:
+            features[index] = found
+        elif cache_key not in pending:
+            pending[cache_key] = index
+            todo.append(index)
+
+    if len(todo) == len(keys):
+        encoded = encode(tiles)
+    elif todo:
+        encoded = encode(tiles[todo])
+    else:
+        encoded = []
+    for index, tile_features in zip(todo, encoded):
+        features[index] = tile_features
+        key = keys[index]
+        if key != 0:
+            if batch_features is not None:
+                batch_features[(key, size)] = tile_features
+            if key < 0 and blank_cache is not None:
+                # A copy: the row is a view that would keep the whole encoded batch alive
+                blank_cache.put((key, size), tile_features.clone())
+
+    for index, key in enumerate(keys):
+        if features[index] is None:
+            # a repeat of a tile encoded above in this call
+            features[index] = features[pending[(key, size)]]
+    return torch.stack(features)
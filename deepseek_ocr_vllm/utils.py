@@ -5,11 +5,71 @@ Handles image preprocessing, bounding box extraction, and coordinate conversion
 import re
 import io
 import base64
-from typing import List, Dict, Tuple, Optional
-import requests
+from typing import Callable, List, Dict, Tuple, Optional
 from PIL import Image, ImageDraw
 
 from .config import MAX_FILE_SIZE_MB
+from .fetcher import ImageTooLargeError, decode_image, get_fetcher
+from .result_cache import hash_image_bytes
+
+
+def decode_base64_bytes(value: str) -> bytes:
+    """
+    Raw bytes of a base64 payload, rejecting oversized ones before decoding them
+
+    Raises:
+        ImageTooLargeError: if the payload exceeds MAX_FILE_SIZE_MB
+    """
+    max_bytes = MAX_FILE_SIZE_MB * 1024 * 1024
+    # base64 carries 3 bytes per 4 characters; reject without allocating the decode
+    if len(value) * 3 // 4 > max_bytes + 2:
+        raise ImageTooLargeError(f"Image file size exceeds {MAX_FILE_SIZE_MB} MB.")
+    image_bytes = base64.b64decode(value)
+    if len(image_bytes) > max_bytes:
+        raise ImageTooLargeError(f"Image file size exceeds {MAX_FILE_SIZE_MB} MB.")
+    return image_bytes
+
+
+def decode_base64_image(
+    value: str, size_config: Optional[Dict] = None, is_cached: Optional[Callable[[str], bool]] = None
+) -> Tuple[bytes, Optional[Image.Image]]:
+    """
+    Decode a base64 payload, rejecting oversized ones before decoding them
+
+    Args:
+        value: base64 image payload
+        size_config: SIZE_CONFIGS entry the image is for; enables reduced-resolution decoding
+        is_cached: Called with the bytes' ``hash_image_bytes`` before decoding; True skips the decode
+
+    Returns:
+        Tuple of (raw bytes, RGB PIL Image, or None when ``is_cached`` returned True)
+    """
+    image_bytes = decode_base64_bytes(value)
+    if is_cached is not None and is_cached(hash_image_bytes(image_bytes)):
+        return image_bytes, None
+    return image_bytes, decode_image(io.BytesIO(image_bytes), size_config)
+
+
+def fetch_source(
+    input_source: Dict, size_config: Optional[Dict] = None, is_cached: Optional[Callable[[str], bool]] = None
+) -> Tuple[bytes, Optional[Image.Image]]:
+    """
+    Fetch (URL) or decode (base64) an input source
+
+    Args:
+        input_source: Dictionary with 'type' and 'value' keys
+        size_config: SIZE_CONFIGS entry the image is for; when given, the image may be
+            decoded below full resolution (``image.info["original_size"]`` keeps the real size)
+        is_cached: Called with the input's ``hash_image_bytes`` (e.g. to look up the
+            result cache); when it returns True the image is None. URLs still
+            decode while they download, so a miss costs no extra latency.
+
+    Raises:
+        ImageTooLargeError: if the payload exceeds MAX_FILE_SIZE_MB or MAX_IMAGE_PIXELS
+    """
+    if input_source["type"] == "url":
+        return get_fetcher().fetch_image(input_source["value"], size_config, is_cached)
+    return decode_base64_image(input_source["value"], size_config, is_cached)
 
 
 def load_image_from_source(input_source: Dict) -> Optional[Image.Image]:
@@ -23,30 +83,38 @@ def load_image_from_source(input_source: Dict) -> Optional[Image.Image]:
         PIL Image or None if loading fails
     """
     try:
-        if input_source["type"] == "url":
-            resp = requests.get(input_source["value"], timeout=10)
-            resp.raise_for_status()
-            image_bytes = resp.content
-        else:
-            image_bytes = base64.b64decode(input_source["value"])
-            
-        if len(image_bytes) > MAX_FILE_SIZE_MB * 1024 * 1024:
-            return None
-            
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        _, image = fetch_source(input_source)
         return image
+    except ImageTooLargeError:
+        return None
     except Exception as e:
         print(f"Image load failed: {str(e)}")
         return None
 
 
-def extract_bounding_boxes(text: str, image_size: Tuple[int, int]) -> List[Dict]:
+def image_frame(image: Image.Image) -> Tuple[int, int, int, int]:
+    """
+    Region of the original image the model saw, as (left, top, right, bottom)
+
+    That is the ``trim_margins`` content box when margins were trimmed, else the
+    whole original (declared size, also for reduced-scale decodes).
+    """
+    if "content_box" in image.info:
+        return image.info["content_box"]
+    return (0, 0) + tuple(image.info.get("original_size", image.size))
+
+
+def extract_bounding_boxes(
+    text: str, image_size: Tuple[int, int], content_box: Optional[Tuple[int, int, int, int]] = None
+) -> List[Dict]:
     """
     Extract bounding boxes from OCR text output along with text content
 
     Args:
         text: OCR text output containing bounding box annotations
         image_size: Tuple of (width, height) of the original image
+        content_box: (left, top, right, bottom) of the original the model saw, when
+            margins were trimmed (see ``image_frame``); boxes are mapped through it
 
     Returns:
         List of dictionaries containing bounding box information with text content
@@ -55,7 +123,8 @@ def extract_bounding_boxes(text: str, image_size: Tuple[int, int]) -> List[Dict]
     pattern = re.compile(r'<\|ref\|>(.*?)<\|/ref\|><\|det\|\>\[\[(\d+),\s*(\d+),\s*(\d+),\s*(\d+)\]\]<\|/det\|>')
     matches = pattern.finditer(text)
 
-    w_orig, h_orig = image_size
+    left, top, right, bottom = content_box or (0, 0) + tuple(image_size)
+    w_orig, h_orig = right - left, bottom - top
     all_boxes = []
 
     for match in matches:
@@ -64,10 +133,10 @@ def extract_bounding_boxes(text: str, image_size: Tuple[int, int]) -> List[Dict]
 
         # Convert from normalized coordinates (0-999) to pixel coordinates
         box = [
-            int(x1 / 999 * w_orig),
-            int(y1 / 999 * h_orig),
-            int(x2 / 999 * w_orig),
-            int(y2 / 999 * h_orig),
+            left + int(x1 / 999 * w_orig),
+            top + int(y1 / 999 * h_orig),
+            left + int(x2 / 999 * w_orig),
+            top + int(y2 / 999 * h_orig),
         ]
 
         all_boxes.append({
@@ -0,0 +1,226 @@
+"""
+Batched vision encoding for DeepSeek OCR
+The views of every image in a scheduler step go through SAM + CLIP +
+projector together, one forward per view shape (the crop tiles, and the
+global views of each size mode), instead of one forward per image and view.
+The features are then scattered back and laid out per image. Forwards that
+would exceed VISION_ACTIVATION_BUDGET_MB are split into chunks of views.
+"""
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+
+from .config import SAM_ATTN_CHUNK_TOKENS, VISION_ACTIVATION_BUDGET_MB
+
+# Encoder shapes the activation estimate is derived from (SAM ViT-B, CLIP-L)
+SAM_PATCH_SIZE = 16
+SAM_EMBED_DIM = 768
+SAM_NUM_HEADS = 12
+CLIP_DOWNSAMPLE = 4  # SAM's neck halves the grid twice before CLIP
+CLIP_EMBED_DIM = 1024
+CLIP_NUM_HEADS = 16
+# Token-sized [HW, dim] tensors alive at a block's peak: residual, norm,
+# q / k / v, attention output, and the 4x MLP hidden
+LIVE_TOKEN_TENSORS = 10
+SCORE_BYTES = 4  # softmax scores are float32 whatever the activation dtype
+
+
+def view_activation_bytes(size: int, dtype_bytes: int = 2, chunk_tokens: int = SAM_ATTN_CHUNK_TOKENS) -> int:
+    """
+    Estimated peak activation memory of one ``size`` px view in SAM + CLIP
+
+    The peak is a SAM global-attention block: its token tensors plus the
+    relative-position bias and softmax scores for ``chunk_tokens`` query rows
+    (all HW rows when 0, see ``rel_pos_attention``; a single view whose dense
+    bias is over budget is chunked by ``bias_chunk_tokens``). CLIP runs on the 16x
+    smaller grid and adds its own, much smaller, block peak. Within about 10%
+    of measured CPU peaks (benchmarks/bench_sam_attention.py).
+    """
+    tokens = (size // SAM_PATCH_SIZE) ** 2
+    rows = min(tokens, chunk_tokens) if chunk_tokens else tokens
+    sam = LIVE_TOKEN_TENSORS * tokens * SAM_EMBED_DIM * dtype_bytes + SAM_NUM_HEADS * rows * tokens * (
+        dtype_bytes + SCORE_BYTES
+    )
+    clip_tokens = (size // SAM_PATCH_SIZE // CLIP_DOWNSAMPLE) ** 2 + 1
+    clip = (
+        LIVE_TOKEN_TENSORS * clip_tokens * CLIP_EMBED_DIM * dtype_bytes
+        + CLIP_NUM_HEADS * clip_tokens * clip_tokens * SCORE_BYTES
+    )
+    return sam + clip
+
+
+def plan_chunks(n_views: int, view_bytes: int, budget_bytes: int) -> List[int]:
+    """
+    Sizes of the encoder forwards for ``n_views`` views of ``view_bytes`` each
+
+    As few chunks as fit ``budget_bytes`` (at least one view per chunk, even
+    if that view alone is over budget), with sizes balanced so the last chunk
+    is not a straggler: 13 views at 6 per chunk run as 5 + 4 + 4. A budget of
+    0 means one forward.
+    """
+    if n_views <= 0:
+        return []
+    if budget_bytes <= 0:
+        return [n_views]
+    per_chunk = max(1, budget_bytes // max(1, view_bytes))
+    n_chunks = math.ceil(n_views / per_chunk)
+    base, extra = divmod(n_views, n_chunks)
+    return [base + 1] * extra + [base] * (n_chunks - extra)
+
+
+def encode_in_chunks(
+    encode: Callable[[torch.Tensor], torch.Tensor],
+    views: torch.Tensor,
+    dtype_bytes: int = 2,
+    budget_mb: int = VISION_ACTIVATION_BUDGET_MB,
+) -> torch.Tensor:
+    """``encode(views)``, run in as many forwards as ``plan_chunks`` needs to stay within ``budget_mb``"""
+    sizes = plan_chunks(len(views), view_activation_bytes(views.shape[-1], dtype_bytes), budget_mb * 2**20)
+    if len(sizes) <= 1:
+        return encode(views)
+    return torch.cat([encode(chunk) for chunk in views.split(sizes)])
+
+
+def read_image_metadata(
+    images_spatial_crop,
+    image_cache_keys=None,
+    images_tile_keys=None,
+) -> Tuple[List[Tuple[int, int]], List[int], List[Optional[List[int]]]]:
+    """
+    Host copies of a step's per-image metadata, in one device-to-host transfer
+
+    Whether an image exists and whether it has tiles are read from its tile
+    grid, so the pixel tensors are never reduced on the host's behalf.
+
+    Args:
+        images_spatial_crop: [n_image, batch_size, 2] tile grids (a tensor, or a
+            per-image list). A [0, 0] grid is the no-image placeholder; a
+            grid with more than one tile means the image has crops.
+        image_cache_keys: [n_image, batch_size] embedding cache keys, or None
+        images_tile_keys: [n_image, batch_size, n_tiles] ``tile_keys``, or None
+
+    Returns:
+        (crop_shapes [(num_tiles_w, num_tiles_h)], cache_keys (0 = not cacheable),
+        tile_keys (None where an image has no keys))
+    """
+    if isinstance(images_spatial_crop, torch.Tensor):
+        images_spatial_crop = list(images_spatial_crop)
+    n_image = len(images_spatial_crop)
+
+    def per_image(field):
+        if field is None:
+            return []
+        if isinstance(field, torch.Tensor):
+            return [k.flatten() for k in field.reshape(n_image, -1)]
+        return [k.flatten() for k in field]
+
+    crops = [c.flatten() for c in images_spatial_crop]
+    cache_keys = [k[:1] for k in per_image(image_cache_keys)]
+    tile_keys = per_image(images_tile_keys)
+    pieces = crops + cache_keys + tile_keys
+    flat = torch.cat([p.to(torch.long) for p in pieces]).tolist()
+
+    values, start = [], 0
+    for piece in pieces:
+        values.append(flat[start:start + piece.numel()])
+        start += piece.numel()
+    crop_values = values[:n_image]
+    crop_shapes = [tuple(v[:2]) if len(v) >= 2 else (0, 0) for v in crop_values]
+    cache_values = values[n_image:n_image + len(cache_keys)]
+    tile_values = values[n_image + len(cache_keys):]
+    return (
+        crop_shapes,
+        [v[0] for v in cache_values] if cache_values else [0] * n_image,
+        [v if any(v) else None for v in tile_values] if tile_values else [None] * n_image,
+    )
+
+
+def encode_grouped(
+    encode: Callable[..., torch.Tensor],
+    views: Sequence[torch.Tensor],
+    keys: Optional[Sequence[Optional[List[int]]]] = None,
+) -> List[torch.Tensor]:
+    """
+    ``[encode(v) for v in views]`` with one ``encode`` call per distinct view shape
+
+    Args:
+        encode: [n, 3, h, w] -> [n, ...] features. Called as ``encode(batch)``,
+            or ``encode(batch, batch_keys)`` when ``keys`` is given.
+        views: Per-image [n_i, 3, h, w] view blocks (a global view, or an image's tiles)
+        keys: Per-image ``tile_keys`` lists aligned with ``views`` (None: unknown).
+            ``batch_keys`` is their concatenation, unknown tiles as 0, or None
+            when no view in the group has keys.
+
+    Returns:
+        Per-image [n_i, ...] features, in ``views`` order
+    """
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for index, view in enumerate(views):
+        groups.setdefault(tuple(view.shape[1:]), []).append(index)
+
+    features: List[Optional[torch.Tensor]] = [None] * len(views)
+    for indices in groups.values():
+        batch = torch.cat([views[i] for i in indices]) if len(indices) > 1 else views[indices[0]]
+        if keys is None:
+            encoded = encode(batch)
+        else:
+            group_keys = [keys[i] for i in indices]
+            batch_keys = None
+            if any(k is not None for k in group_keys):
+                batch_keys = [
+                    key for i, k in zip(indices, group_keys) for key in (k if k is not None else [0] * len(views[i]))
+                ]
+            encoded = encode(batch, batch_keys)
+        for index, image_features in zip(indices, encoded.split([len(views[i]) for i in indices])):
+            features[index] = image_features
+    return features
+
+
+def format_image_features(
+    global_features: torch.Tensor,
+    local_features: Optional[torch.Tensor],
+    crop_shape: Optional[Sequence[int]],
+    image_newline: torch.Tensor,
+    view_separator: torch.Tensor,
+) -> torch.Tensor:
+    """
+    One image's vision-token sequence in the 2D tile-tag layout
+
+    Tiles are stitched into one grid and the global view follows; every row
+    of either ends with ``image_newline`` and ``view_separator`` closes the
+    sequence.
+
+    Args:
+        global_features: [1, hw, n_dim] encoded global view
+        local_features: [n_tiles, hw2, n_dim] encoded tiles, or None without crops
+        crop_shape: (num_tiles_w, num_tiles_h) of the tiles
+    """
+    _, hw, n_dim = global_features.shape
+    h = w = int(hw**0.5)
+
+    global_features = global_features.view(h, w, n_dim)
+    global_features = torch.cat(
+        [global_features, image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
+    )
+    global_features = global_features.view(-1, n_dim)
+
+    if local_features is None:
+        return torch.cat([global_features, view_separator[None, :]], dim=0)
+
+    _, hw2, n_dim2 = local_features.shape
+    h2 = w2 = int(hw2**0.5)
+    width_crop_num, height_crop_num = int(crop_shape[0]), int(crop_shape[1])
+
+    local_features = (
+        local_features.view(height_crop_num, width_crop_num, h2, w2, n_dim2)
+        .permute(0, 2, 1, 3, 4)
+        .reshape(height_crop_num * h2, width_crop_num * w2, n_dim2)
+    )
+    local_features = torch.cat(
+        [local_features, image_newline[None, None, :].expand(height_crop_num * h2, 1, n_dim2)],
+        dim=1,
+    )
+    local_features = local_features.view(-1, n_dim2)
+
+    return torch.cat([local_features, global_features, view_separator[None, :]], dim=0)
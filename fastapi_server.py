@@ -1,13 +1,82 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 import uvicorn
 
-from handler import process_image
+from deepseek_ocr_vllm.config import (
+    ADMISSION_QUEUE_DEPTH,
+    FETCH_WORKERS,
+    INFERENCE_WORKERS,
+    RETRY_AFTER_SECONDS,
+)
+from handler import (
+    batch_response,
+    complete_job,
+    expand_batch,
+    get_metrics,
+    load_job,
+    stream_job,
+)
 
 
 # --- Interface B: FastAPI Server (for Local Testing) ---
 app = FastAPI()
 
+# Fetch/decode and inference get separate pools so slow downloads cannot
+# starve the GPU path (and vice versa). The event loop only awaits them.
+fetch_executor = ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix="ocr-fetch")
+inference_executor = ThreadPoolExecutor(INFERENCE_WORKERS, thread_name_prefix="ocr-infer")
+
+
+class AdmissionQueue:
+    """Bounded admission: at most `depth` requests are in the server at once.
+
+    Only touched from the event loop thread, so a plain counter is enough.
+    """
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self, slots: int = 1) -> bool:
+        if self.in_flight + slots > self.depth:
+            self.rejected += 1
+            return False
+        self.in_flight += slots
+        return True
+
+    def release(self, slots: int = 1):
+        self.in_flight -= slots
+
+    def releaser(self, slots: int = 1):
+        """A `release` callback that only takes effect on its first call."""
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release(slots)
+
+        return release
+
+
+admission = AdmissionQueue(ADMISSION_QUEUE_DEPTH)
+
+
+def overloaded_response():
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Server is at capacity, retry later."},
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
 
 class InputSource(BaseModel):
     type: str = Field(..., description="Input type, 'url' or 'base64'")
@@ -25,14 +94,144 @@ class APIRequest(BaseModel):
     prompt: str = None
     model_size: str = "Gundam"
     output_options: OutputOptions = Field(default_factory=OutputOptions)
+    trim_margins: Optional[bool] = None  # None: server default (TRIM_MARGINS)
+    min_crops: Optional[int] = None  # tile budget of crop modes; None: task default (TASK_CROP_BUDGETS, else INFER_CROP_BUDGET)
+    max_crops: Optional[int] = None
+
+
+class BatchItem(BaseModel):
+    input_source: InputSource
+    task_type: Optional[str] = None
+    prompt: Optional[str] = None
+    model_size: Optional[str] = None
+    output_options: Optional[OutputOptions] = None
+    trim_margins: Optional[bool] = None
+    min_crops: Optional[int] = None
+    max_crops: Optional[int] = None
+
+
+class BatchAPIRequest(BaseModel):
+    """Shared options apply to every item unless the item sets its own."""
+    items: List[BatchItem]
+    task_type: Optional[str] = None
+    prompt: Optional[str] = None
+    model_size: str = "Gundam"
+    output_options: OutputOptions = Field(default_factory=OutputOptions)
+    trim_margins: Optional[bool] = None
+    min_crops: Optional[int] = None
+    max_crops: Optional[int] = None
+
+
+async def fetch_job(job_input):
+    """`load_job` on the fetch pool; returns (image_bytes, image, job) or an error dict."""
+    return await asyncio.get_running_loop().run_in_executor(fetch_executor, load_job, job_input)
+
+
+async def run_job(job_input):
+    """Same stages as `process_image`, with every blocking step off the loop."""
+    loaded = await fetch_job(job_input)
+    if isinstance(loaded, dict):
+        return loaded
+    return await asyncio.get_running_loop().run_in_executor(
+        inference_executor, complete_job, *loaded
+    )
+
+
+async def sse_events(events, on_close):
+    """Drive a blocking event generator on the inference pool and format it as SSE."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    pending = None
+    try:
+        while True:
+            pending = loop.run_in_executor(inference_executor, next, events, done)
+            event = await asyncio.shield(pending)
+            if event is done:
+                return
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        # On disconnect, let the running `next` finish, then close the
+        # generator so generation stops instead of running to the end
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        await loop.run_in_executor(inference_executor, events.close)
+        on_close()
+
+
+class SlotStreamingResponse(StreamingResponse):
+    """StreamingResponse that gives back its admission slot however the response ends.
+
+    The event generator's `finally` never runs if the client is gone before
+    streaming starts, and Starlette skips background tasks on a disconnect.
+    """
+
+    def __init__(self, *args, release, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
 
 
 @app.post("/process")
 async def process_endpoint(request: APIRequest):
     """The main processing endpoint for local testing."""
-    # Convert the Pydantic model to the dict format our core logic expects
-    job_input = request.dict()
-    return process_image(job_input)
+    if not admission.try_acquire():
+        return overloaded_response()
+    try:
+        # Convert the Pydantic model to the dict format our core logic expects
+        return await run_job(request.dict())
+    finally:
+        admission.release()
+
+
+@app.post("/process_stream")
+async def process_stream_endpoint(request: APIRequest):
+    """`/process` as Server-Sent Events: `delta` events with text, then one `final` event."""
+    if not admission.try_acquire():
+        return overloaded_response()
+    try:
+        loaded = await fetch_job(request.dict())
+    except BaseException:
+        admission.release()
+        raise
+    if isinstance(loaded, dict):
+        admission.release()
+        return loaded
+    release = admission.releaser()
+    try:
+        return SlotStreamingResponse(
+            sse_events(stream_job(*loaded), release),
+            release=release,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except BaseException:
+        release()
+        raise
+
+
+@app.post("/process_batch")
+async def process_batch_endpoint(request: BatchAPIRequest):
+    """Many images per call; each item takes one admission slot."""
+    # exclude_unset: fields an item leaves out fall back to the shared ones
+    items = expand_batch(request.dict(exclude_unset=True))
+    if isinstance(items, dict):
+        return items
+    if not admission.try_acquire(len(items)):
+        return overloaded_response()
+    try:
+        outputs = await asyncio.gather(*(run_job(item) for item in items), return_exceptions=True)
+        # A failing item gets its own error entry instead of failing the whole batch
+        return batch_response([
+            {"error": f"Processing failed: {str(output)}"} if isinstance(output, BaseException) else output
+            for output in outputs
+        ])
+    finally:
+        admission.release(len(items))
 
 
 @app.get("/")
@@ -40,6 +239,18 @@ def health_check():
     return {"status": "ok", "message": "Server is ready to accept requests."}
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        **get_metrics(),
+        "admission": {
+            "in_flight": admission.in_flight,
+            "depth": admission.depth,
+            "rejected": admission.rejected,
+        },
+    }
+
+
 # ===================================================================================
 # 4. LAUNCHER (Decides whether to start Runpod or FastAPI)
 # ===================================================================================
@@ -1,17 +1,49 @@
-import os
 import sys
+import asyncio
 import runpod
 import torch
 import base64
-import requests
 import re
-import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from PIL import Image, ImageDraw
+from PIL import ImageDraw
 import io
 
 # --- Transformers Imports (Core Model) ---
-from transformers import AutoModel, AutoTokenizer
+from transformers import (
+    AutoModel,
+    AutoTokenizer,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
+
+from deepseek_ocr_vllm.batching import MicroBatcher, left_pad, split_generated
+from deepseek_ocr_vllm.config import (
+    BATCH_ITEM_WORKERS,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_WAIT_MS,
+    INFER_CROP_BUDGET,
+    MAX_BATCH_ITEMS,
+    RESULT_CACHE_ENABLED,
+    RUNPOD_CONCURRENCY,
+    RUNPOD_STREAM_MIN_CHARS,
+    RUNPOD_STREAMING,
+    TASK_CROP_BUDGETS,
+    TRIM_MARGINS,
+)
+from deepseek_ocr_vllm.preprocess_pool import PreprocessPool
+from deepseek_ocr_vllm.process.image_process import (
+    DeepseekOCRProcessor,
+    crop_budget,
+    normalize_pixels,
+    trim_margins,
+)
+from deepseek_ocr_vllm.result_cache import ResultCache, make_cache_key
+from deepseek_ocr_vllm.singleflight import SingleFlight
+from deepseek_ocr_vllm.utils import ImageTooLargeError, fetch_source, image_frame
 
 # ===================================================================================
 # 1. GLOBAL MODEL AND TOKENIZER SETUP (LOADED ONLY ONCE)
@@ -35,6 +67,11 @@ model = AutoModel.from_pretrained(
     use_safetensors=True,
 ).to(device=DEVICE, dtype=MODEL_DTYPE)
 model.eval()
+# Reuses the vLLM processor's tokenization so images never leave memory.
+# Tile keys only feed the vLLM encoder's dedupe, so they are not computed here.
+processor = DeepseekOCRProcessor(tokenizer=tokenizer, hash_tiles=False)
+# Pad / tile / tokenize run here (sized from NUM_WORKERS and the CPU count), not inline.
+preprocess_pool = PreprocessPool(processor)
 print("--> Model and Tokenizer loaded successfully. Model is in evaluation mode.")
 
 
@@ -58,38 +95,232 @@ SIZE_CONFIGS = {
     "Gundam": {"base_size": 1024, "image_size": 640, "crop_mode": True},
 }
 MAX_FILE_SIZE_MB = 10
+MAX_NEW_TOKENS = 8192
+STOP_STR = "<｜end▁of▁sentence｜>"
 
 
-def process_image(job_input):
-    """Core logic, refactored to be called by any interface."""
+def prepare_inputs(image, prompt, config):
+    """Tokenize the prompt and turn a decoded PIL image into model tensors.
+
+    Runs on the shared preprocessing pool; blocks while the pool's queue is full.
+    """
+    return preprocess_pool.prepare(image, prompt, config)
+
+
+def model_images(inputs):
+    """(crops, global view) on the device; uint8 pixels are normalized after the copy."""
+    crops = inputs["images_crop"].to(DEVICE)
+    if crops.dtype == torch.uint8 and not (inputs["images_spatial_crop"] > 1).any():
+        # The model detects "no crop" by an all-zero block; normalizing would break that
+        crops = torch.zeros(crops.shape, dtype=MODEL_DTYPE, device=DEVICE)
+    return (
+        normalize_pixels(crops, MODEL_DTYPE),
+        normalize_pixels(inputs["pixel_values"].to(DEVICE), MODEL_DTYPE),
+    )
+
+
+def generate_text(inputs):
+    """Run generation on tensors from `prepare_inputs` and return the decoded text."""
+    input_ids = inputs["input_ids"].to(DEVICE)
+    images = [model_images(inputs)]
+    with torch.autocast(DEVICE, dtype=MODEL_DTYPE, enabled=DEVICE == "cuda"):
+        with torch.inference_mode():
+            output_ids = model.generate(
+                input_ids,
+                images=images,
+                images_seq_mask=inputs["images_seq_mask"].unsqueeze(0).to(DEVICE),
+                images_spatial_crop=inputs["images_spatial_crop"],
+                temperature=0.0,
+                eos_token_id=tokenizer.eos_token_id,
+                max_new_tokens=MAX_NEW_TOKENS,
+                no_repeat_ngram_size=35,
+                use_cache=True,
+            )
+    outputs = tokenizer.decode(output_ids[0, input_ids.shape[1]:])
+    if outputs.endswith(STOP_STR):
+        outputs = outputs[: -len(STOP_STR)]
+    return outputs.strip()
+
+
+class _StopOnEvent(StoppingCriteria):
+    """Ends generation once `event` is set (e.g. the streaming client went away)."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device
+        )
+
+
+def stream_tokens(inputs):
+    """Like `generate_text`, but yields decoded text deltas while generating.
+
+    Bypasses the micro-batcher: generate runs on its own thread and hands text
+    back through a TextIteratorStreamer. Closing the generator stops generation.
+    """
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True)
+    stop = threading.Event()
+    errors = []
+
+    def _generate():
+        # Everything that can fail is inside the try: the consumer waits on the
+        # streamer until end() is called. After a normal generate this is a second
+        # end(), which only queues an unread stop signal
+        try:
+            input_ids = inputs["input_ids"].to(DEVICE)
+            images = [model_images(inputs)]
+            with torch.autocast(DEVICE, dtype=MODEL_DTYPE, enabled=DEVICE == "cuda"):
+                with torch.inference_mode():
+                    model.generate(
+                        input_ids,
+                        images=images,
+                        images_seq_mask=inputs["images_seq_mask"].unsqueeze(0).to(DEVICE),
+                        images_spatial_crop=inputs["images_spatial_crop"],
+                        temperature=0.0,
+                        eos_token_id=tokenizer.eos_token_id,
+                        max_new_tokens=MAX_NEW_TOKENS,
+                        no_repeat_ngram_size=35,
+                        use_cache=True,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop)]),
+                    )
+        except Exception as e:
+            errors.append(e)
+        finally:
+            streamer.end()
+
+    thread = threading.Thread(target=_generate, name="ocr-stream", daemon=True)
+    thread.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    finally:
+        stop.set()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def strip_stop_str(deltas):
+    """Drop STOP_STR (and anything after it) from a stream of text deltas.
+
+    A tail that could be the start of STOP_STR is held back until the next
+    delta tells whether it is. Leading whitespace is dropped, matching the
+    `.strip()` of the non-streaming path.
+    """
+    pending = ""
+    started = False
+    for delta in deltas:
+        pending += delta
+        if not started:
+            pending = pending.lstrip()
+            started = bool(pending)
+        stop = pending.find(STOP_STR)
+        if stop != -1:
+            pending = pending[:stop]
+            break
+        keep = next(
+            (n for n in range(min(len(STOP_STR) - 1, len(pending)), 0, -1) if STOP_STR.startswith(pending[-n:])),
+            0,
+        )
+        if len(pending) > keep:
+            yield pending[: len(pending) - keep]
+            pending = pending[len(pending) - keep:]
+    if pending:
+        yield pending
+
+
+def generate_batch(inputs_list):
+    """Run one left-padded generate call over several `prepare_inputs` results.
+
+    All inputs must come from the same SIZE_CONFIGS entry. Returns one decoded
+    text per input, in order.
+    """
+    if len(inputs_list) == 1:
+        return [generate_text(inputs_list[0])]
+
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    input_ids, attention_mask, images_seq_mask = left_pad(inputs_list, pad_id)
+    images = [model_images(inputs) for inputs in inputs_list]
+    images_spatial_crop = torch.cat([inputs["images_spatial_crop"] for inputs in inputs_list], dim=0)
+
+    with torch.autocast(DEVICE, dtype=MODEL_DTYPE, enabled=DEVICE == "cuda"):
+        with torch.inference_mode():
+            output_ids = model.generate(
+                input_ids.to(DEVICE),
+                attention_mask=attention_mask.to(DEVICE),
+                images=images,
+                images_seq_mask=images_seq_mask.to(DEVICE),
+                images_spatial_crop=images_spatial_crop,
+                temperature=0.0,
+                eos_token_id=tokenizer.eos_token_id,
+                pad_token_id=pad_id,
+                max_new_tokens=MAX_NEW_TOKENS,
+                no_repeat_ngram_size=35,
+                use_cache=True,
+            )
+
+    return [
+        tokenizer.decode(row).strip()
+        for row in split_generated(output_ids, input_ids.shape[1], tokenizer.eos_token_id)
+    ]
+
+
+def infer_image(image, prompt, config):
+    """In-memory replacement for `model.infer`: no temp image, no result files."""
+    return generate_text(prepare_inputs(image, prompt, config))
+
+
+# Concurrent jobs with the same model_size are merged into one generate call.
+batcher = MicroBatcher(
+    generate_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS
+)
+
+
+# Repeat submissions of the same image + options skip generation entirely.
+result_cache = ResultCache() if RESULT_CACHE_ENABLED else None
+
+# Identical jobs arriving while one is still running wait for that run instead.
+in_flight = SingleFlight()
+
+
+def get_metrics():
+    metrics = {
+        "batching": batcher.stats.snapshot(),
+        "single_flight": in_flight.stats(),
+        "preprocess": preprocess_pool.stats(),
+    }
+    if result_cache is not None:
+        metrics["result_cache"] = result_cache.stats()
+    return metrics
+
+
+def parse_job(job_input):
+    """Validate the request fields and resolve the final prompt.
+
+    Returns the parsed job, or a dict with an "error" key.
+    """
     input_source = job_input.get("input_source")
     task_type = job_input.get("task_type")
     custom_prompt = job_input.get("prompt")
     model_size = job_input.get("model_size", "Gundam")
-    output_options = job_input.get("output_options", {})
-    include_bounding_boxes = output_options.get("include_bounding_boxes", False)
-    include_visualization = output_options.get("include_visualization", False)
+    output_options = job_input.get("output_options") or {}
+    trim = job_input.get("trim_margins")
+    min_crops = job_input.get("min_crops")
+    max_crops = job_input.get("max_crops")
 
     # ... (All validation and processing logic is here, unchanged) ...
     if not all([input_source, task_type]):
         return {"error": "..."}
     if model_size not in SIZE_CONFIGS:
         return {"error": "..."}
+    if task_type != "custom" and task_type not in PROMPT_TEMPLATES:
+        return {"error": f"Unknown task_type {task_type!r}; expected 'custom' or one of {sorted(PROMPT_TEMPLATES)}."}
     # ...
 
-    try:
-        if input_source["type"] == "url":
-            response = requests.get(input_source["value"], timeout=10)
-            response.raise_for_status()
-            image_bytes = response.content
-        else:
-            image_bytes = base64.b64decode(input_source["value"])
-        if len(image_bytes) > MAX_FILE_SIZE_MB * 1024 * 1024:
-            return {"error": f"Image file size exceeds {MAX_FILE_SIZE_MB} MB."}
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    except Exception as e:
-        return {"error": f"Failed to load image: {str(e)}"}
-
     if task_type == "custom":
         final_prompt = custom_prompt
     elif task_type == "text_localization":
@@ -99,43 +330,270 @@ def process_image(job_input):
     else:
         final_prompt = PROMPT_TEMPLATES[task_type]
 
+    # Tile budget of crop modes: the task's default unless the request sets a bound,
+    # else the one model.infer used, so responses match what it returned
+    if min_crops is None and max_crops is None:
+        min_crops, max_crops = TASK_CROP_BUDGETS.get(task_type, INFER_CROP_BUDGET)
     try:
-        with tempfile.TemporaryDirectory() as output_path:
-            temp_image_path = os.path.join(output_path, "temp_image.png")
-            image.save(temp_image_path)
-            config = SIZE_CONFIGS[model_size]
-            with torch.inference_mode():
-                text_content = model.infer(
-                    tokenizer,
-                    prompt=final_prompt,
-                    image_file=temp_image_path,
-                    output_path=output_path,
-                    base_size=config["base_size"],
-                    image_size=config["image_size"],
-                    crop_mode=config["crop_mode"],
-                    save_results=True,
-                    test_compress=True,
-                    eval_mode=True,
-                )
+        min_crops, max_crops = crop_budget(min_crops, max_crops)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    return {
+        "input_source": input_source,
+        "final_prompt": final_prompt,
+        "model_size": model_size,
+        "include_bounding_boxes": output_options.get("include_bounding_boxes", False),
+        "include_visualization": output_options.get("include_visualization", False),
+        "trim_margins": TRIM_MARGINS if trim is None else bool(trim),
+        "min_crops": min_crops,
+        "max_crops": max_crops,
+    }
+
+
+def job_size_config(job):
+    """The job's SIZE_CONFIGS entry plus its crop budget, as `prepare_inputs` takes it."""
+    return {**SIZE_CONFIGS[job["model_size"]], "min_crops": job["min_crops"], "max_crops": job["max_crops"]}
+
+
+def load_image(input_source, size_config=None, is_cached=None):
+    """Download or base64-decode the input; returns (raw bytes, RGB image).
+
+    URLs are streamed through the shared pooled fetcher, which aborts as soon
+    as the body passes MAX_FILE_SIZE_MB and decodes while bytes arrive. With a
+    `size_config`, large JPEGs are decoded at reduced scale for that mode.
+    `is_cached` gets the bytes' hash before the image is needed (see `fetch_source`).
+    """
+    return fetch_source(input_source, size_config, is_cached)
+
+
+def load_job(job_input):
+    """Parse and load one job; returns (image_bytes, image, job) or a dict with an "error" key.
+
+    The result cache is looked up as soon as the raw bytes are in (URLs keep
+    decoding while they download): on a hit `image` is None and
+    `job["cached_output"]` is the response.
+    """
+    job = parse_job(job_input)
+    if "error" in job:
+        return job
+    # The visualization is drawn on the decoded image, so it keeps full resolution and its margins.
+    # Trimmed images are decoded in full: a scale picked from the page would leave the content box too small
+    trim = job["trim_margins"] and not job["include_visualization"]
+    size_config = None if job["include_visualization"] or trim else job_size_config(job)
+
+    def is_cached(image_hash):
+        job["cache_key"] = job_cache_key(image_hash, job)
+        job["cached_output"] = result_cache.get(job["cache_key"]) if result_cache is not None else None
+        return job["cached_output"] is not None
+
+    try:
+        image_bytes, image = load_image(job["input_source"], size_config, is_cached)
+        if image is None:
+            return image_bytes, None, job
+    except ImageTooLargeError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Failed to load image: {str(e)}"}
+    if trim:
+        image = trim_margins(image)
+    return image_bytes, image, job
+
+
+def process_image(job_input):
+    """Core logic, refactored to be called by any interface.
+
+    Never raises: failures come back as a dict with an "error" key, so one bad
+    item of a batch does not discard the others.
+    """
+    try:
+        loaded = load_job(job_input)
+        if isinstance(loaded, dict):
+            return loaded
+        return complete_job(*loaded)
+    except Exception as e:
+        return {"error": f"Processing failed: {str(e)}"}
+
+
+# Items of bulk Runpod jobs run here so they reach the batcher together.
+batch_item_executor = ThreadPoolExecutor(BATCH_ITEM_WORKERS, thread_name_prefix="ocr-batch-item")
+
+BATCH_SHARED_FIELDS = (
+    "task_type", "prompt", "model_size", "output_options", "trim_margins", "min_crops", "max_crops",
+)
+
+
+def expand_batch(job_input):
+    """Split a bulk request into one job input per item.
+
+    Top-level `task_type` / `prompt` / `model_size` / `output_options` /
+    `trim_margins` / `min_crops` / `max_crops` apply to every item; an item's own fields override them
+    (`output_options` is merged key by key). Returns the list of item inputs,
+    or a dict with an "error" key.
+    """
+    items = job_input.get("items")
+    if not isinstance(items, list) or not items:
+        return {"error": "`items` must be a non-empty list."}
+    if len(items) > MAX_BATCH_ITEMS:
+        return {"error": f"At most {MAX_BATCH_ITEMS} items are accepted per batch."}
+
+    shared = {k: job_input[k] for k in BATCH_SHARED_FIELDS if job_input.get(k) is not None}
+    expanded = []
+    for item in items:
+        if not isinstance(item, dict):
+            item = {}
+        merged = {**shared, **{k: v for k, v in item.items() if v is not None}}
+        merged["output_options"] = {
+            **(shared.get("output_options") or {}),
+            **(item.get("output_options") or {}),
+        }
+        expanded.append(merged)
+    return expanded
+
+
+def batch_response(outputs):
+    """Per-item results in request order; failed items carry their own "error"."""
+    return {
+        "results": [{"index": i, **output} for i, output in enumerate(outputs)],
+        "succeeded": sum("error" not in output for output in outputs),
+        "failed": sum("error" in output for output in outputs),
+    }
+
+
+def process_batch(job_input):
+    """Bulk variant of `process_image`: every item is fetched and run concurrently."""
+    items = expand_batch(job_input)
+    if isinstance(items, dict):
+        return items
+    return batch_response(list(batch_item_executor.map(process_image, items)))
+
+
+def job_cache_key(image_hash, job):
+    return make_cache_key(
+        image_hash,
+        job["final_prompt"],
+        job_size_config(job),
+        {
+            "include_bounding_boxes": job["include_bounding_boxes"],
+            "include_visualization": job["include_visualization"],
+            "trim_margins": job["trim_margins"],
+        },
+    )
+
+
+def complete_job(image_bytes, image, job):
+    """Serve the job from the result cache, or run OCR and cache the response.
+
+    Identical jobs already running are joined rather than run again.
+    """
+    if job.get("cached_output") is not None:
+        return job["cached_output"]
+    key = job["cache_key"]
+    output, shared = in_flight.do(key, lambda: run_cached(key, image, job))
+    return dict(output) if shared else output
+
+
+def run_cached(key, image, job):
+    if result_cache is None:
+        return run_ocr(image, job)
+
+    # load_job already counted this key's miss; an identical job may have finished since
+    output = result_cache.get(key, count_miss=False)
+    if output is not None:
+        return output
+    output = run_ocr(image, job)
+    if "error" not in output:
+        result_cache.put(key, output)
+    return output
+
+
+def run_ocr(image, job):
+    """Run inference on a decoded image and build the response dict."""
+    model_size = job["model_size"]
+
+    try:
+        inputs = prepare_inputs(image, job["final_prompt"], job_size_config(job))
+        text_content = batcher.submit(model_size, inputs).result()
     except Exception as e:
         return {"error": f"Model inference failed: {str(e)}"}
+    return build_output(image, job, text_content, input_tile_grid(inputs))
+
+
+def stream_job(image_bytes, image, job, token_stream=None):
+    """Streaming variant of `complete_job`.
+
+    Yields {"type": "delta", "text": ...} events while the model generates,
+    then one {"type": "final", ...} event carrying the `complete_job` response
+    (boxes, visualization or "error") plus a "metadata" dict. `token_stream`
+    maps `prepare_inputs` tensors to an iterator of text deltas; it defaults to
+    `stream_tokens` and can be swapped for a stub.
+    """
+    token_stream = token_stream or stream_tokens
+    started = time.monotonic()
+    metadata = {"model_size": job["model_size"], "cached": False}
+
+    key = job["cache_key"]
+    output = job.get("cached_output")
+    if output is not None:
+        metadata["cached"] = True
+        yield {"type": "delta", "text": output["text_content"]}
+        yield {"type": "final", **output, "metadata": metadata}
+        return
+
+    pieces = []
+    tokens = None
+    try:
+        inputs = prepare_inputs(image, job["final_prompt"], job_size_config(job))
+        tokens = token_stream(inputs)
+        for delta in strip_stop_str(tokens):
+            if not pieces:
+                metadata["first_delta_seconds"] = round(time.monotonic() - started, 3)
+            pieces.append(delta)
+            yield {"type": "delta", "text": delta}
+    except Exception as e:
+        yield {"type": "final", "error": f"Model inference failed: {str(e)}", "metadata": metadata}
+        return
+    finally:
+        if hasattr(tokens, "close"):
+            tokens.close()
+
+    output = build_output(image, job, "".join(pieces).strip(), input_tile_grid(inputs))
+    if result_cache is not None:
+        result_cache.put(key, output)
+    metadata["total_seconds"] = round(time.monotonic() - started, 3)
+    yield {"type": "final", **output, "metadata": metadata}
+
+
+def input_tile_grid(inputs):
+    """[tiles_w, tiles_h] the image was cropped into; [1, 1] is the global view only."""
+    return inputs["images_spatial_crop"][0].tolist()
+
+
+def build_output(image, job, text_content, tile_grid=None):
+    """Response dict for generated text: boxes are scaled from the model's 0-1000 grid."""
+    include_bounding_boxes = job["include_bounding_boxes"]
+    include_visualization = job["include_visualization"]
 
     output = {"text_content": text_content}
+    if tile_grid is not None:
+        output["tile_grid"] = tile_grid
     boxes_data = []
     pattern = re.compile(r"<\|det\|>\[\[(\d+),\s*(\d+),\s*(\d+),\s*(\d+)\]\]<\|/det\|>")
     matches = list(pattern.finditer(text_content))
     if matches:
-        w, h = image.size
+        # Boxes refer to the original image, also after a reduced-scale decode or margin trim
+        left, top, right, bottom = image_frame(image)
+        w, h = right - left, bottom - top
         for match in matches:
             coords = [int(c) for c in match.groups()]
             boxes_data.append(
                 {
                     "text": "N/A",
                     "box": [
-                        int(coords[0] / 1000 * w),
-                        int(coords[1] / 1000 * h),
-                        int(coords[2] / 1000 * w),
-                        int(coords[3] / 1000 * h),
+                        left + int(coords[0] / 1000 * w),
+                        top + int(coords[1] / 1000 * h),
+                        left + int(coords[2] / 1000 * w),
+                        top + int(coords[3] / 1000 * h),
                     ],
                 }
             )
@@ -160,9 +618,56 @@ def process_image(job_input):
 
 
 # --- Interface A: Runpod Handler (for Production) ---
-def runpod_handler(job):
-    """The handler function that Runpod will call."""
-    return process_image(job["input"])
+async def runpod_handler(job):
+    """The handler function that Runpod will call.
+
+    Runs off the event loop so concurrent jobs can meet in the micro-batcher.
+    An input with an `items` list is a bulk job (see `expand_batch`).
+    """
+    job_input = job["input"]
+    if "items" in job_input:
+        return await asyncio.to_thread(process_batch, job_input)
+    return await asyncio.to_thread(process_image, job_input)
+
+
+async def runpod_stream_handler(job):
+    """Generator variant of `runpod_handler`, used when RUNPOD_STREAMING is on.
+
+    Yields {"type": "delta", "text": ...} chunks of at least
+    RUNPOD_STREAM_MIN_CHARS characters as the markdown is generated, then one
+    {"type": "final", ...} chunk with the boxes (see `stream_job`). Bulk and
+    failed jobs yield a single chunk holding the usual response.
+    """
+    job_input = job["input"]
+    if "items" in job_input:
+        yield await asyncio.to_thread(process_batch, job_input)
+        return
+
+    loaded = await asyncio.to_thread(load_job, job_input)
+    if isinstance(loaded, dict):
+        yield loaded
+        return
+
+    events = stream_job(*loaded)
+    done = object()
+    buffered = ""
+    try:
+        while True:
+            event = await asyncio.to_thread(next, events, done)
+            if event is done:
+                return
+            if event["type"] == "delta":
+                buffered += event["text"]
+                if len(buffered) >= RUNPOD_STREAM_MIN_CHARS:
+                    yield {"type": "delta", "text": buffered}
+                    buffered = ""
+                continue
+            if buffered:
+                yield {"type": "delta", "text": buffered}
+                buffered = ""
+            yield event
+    finally:
+        await asyncio.to_thread(events.close)
 
 
 # ===================================================================================
@@ -170,4 +675,19 @@ def runpod_handler(job):
 # ===================================================================================
 if __name__ == "__main__":
     print("--> Starting Runpod serverless worker for production...")
-    runpod.serverless.start({"handler": runpod_handler})
+    if RUNPOD_STREAMING:
+        # return_aggregate_stream: /run and /runsync still get every chunk, as a list
+        runpod.serverless.start(
+            {
+                "handler": runpod_stream_handler,
+                "concurrency_modifier": lambda current: RUNPOD_CONCURRENCY,
+                "return_aggregate_stream": True,
+            }
+        )
+    else:
+        runpod.serverless.start(
+            {
+                "handler": runpod_handler,
+                "concurrency_modifier": lambda current: RUNPOD_CONCURRENCY,
+            }
+        )